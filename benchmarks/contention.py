@@ -0,0 +1,39 @@
+# Copyright (c) 2018, Globo.com (https://github.com/globocom)
+#
+# License: MIT
+
+"""
+Compares the single lock InMemoryCache with ShardedInMemoryCache under
+concurrent gets and sets (10% writes) from a growing number of threads.
+
+Usage: python -m benchmarks.contention [number]
+"""
+
+import sys
+
+from generic_cache.backend import InMemoryCache, ShardedInMemoryCache
+
+from .suite import build_filled_cache, threaded_usec_per_op
+
+
+def run(number=20000, thread_counts=(1, 2, 4, 8, 16)):
+    results = []
+    for threads in thread_counts:
+        row = [threads]
+        for backend_class in (InMemoryCache, ShardedInMemoryCache):
+            cache, keys = build_filled_cache(10000, 'ttl', backend_class)
+            row.append(min(threaded_usec_per_op(cache, keys, threads, number) for _ in range(3)))
+        results.append(tuple(row))
+    return results
+
+
+def main(argv):
+    number = int(argv[1]) if len(argv) > 1 else 20000
+    print("{:>8} {:>14} {:>14} {:>9}".format('threads', 'single lock', 'sharded', 'speedup'))
+    for threads, single, sharded in run(number):
+        print("{:>8} {:>11.3f} us {:>11.3f} us {:>8.2f}x".format(
+            threads, single, sharded, single / sharded))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,81 @@
+# Copyright (c) 2018, Globo.com (https://github.com/globocom)
+#
+# License: MIT
+
+"""
+Compares the cache hit path of a decorated method using a compiled key plan
+with building the key from scratch on each call.
+
+Usage: python -m benchmarks.key_building [number]
+"""
+
+import inspect
+import sys
+import timeit
+
+from generic_cache.backend import InMemoryCache
+from generic_cache.decorator import CacheDecorator
+from generic_cache.key_builder import AttrsMethodKeyBuilder, ArgsCacheKey
+
+
+class UncompiledKeyBuilder(AttrsMethodKeyBuilder):
+    '''
+    Inspects the function signature on every call, like key builders did before
+    key plans.
+    '''
+
+    def get_normalized_kwargs(self, func, *func_args, **func_kwargs):
+        from collections import OrderedDict
+        args_spec = inspect.getfullargspec(func)
+        kwargs = OrderedDict()
+        for i, arg in enumerate(func_args):
+            kwargs[args_spec.args[i]] = arg
+        kwargs.update(func_kwargs)
+        kwargs.pop('self')
+        instance = func_args[0]
+        for attr in self.attrs:
+            kwargs[attr] = getattr(instance, attr)
+        return kwargs
+
+    def build_key(self, key_prefix, func, *func_args, **func_kwargs):
+        return ArgsCacheKey(key_prefix, **self.get_normalized_kwargs(func, *func_args, **func_kwargs))
+
+
+def build_user_class(key_builder):
+    cache = CacheDecorator("User.", InMemoryCache(), key_builder)
+
+    class User(object):
+        def __init__(self, id):
+            self.id = id
+
+        @cache("get_photo_url")
+        def get_photo_url(self, photo_type, size=100):
+            return "http://myphoto.who/{}/{}/{}".format(self.id, photo_type, size)
+
+    return User
+
+
+def run(number=100000):
+    results = {}
+    for name, builder in [
+        ('uncompiled', UncompiledKeyBuilder(['id'])),
+        ('compiled', AttrsMethodKeyBuilder(['id'])),
+    ]:
+        user = build_user_class(builder)(42)
+        user.get_photo_url('avatar', size=50)
+        seconds = min(timeit.repeat(
+            lambda: user.get_photo_url('avatar', size=50), number=number, repeat=3))
+        results[name] = seconds / number * 1e6
+    return results
+
+
+def main(argv):
+    number = int(argv[1]) if len(argv) > 1 else 100000
+    results = run(number)
+    for name, usec in sorted(results.items()):
+        print("{:>12}: {:.2f} usec per cache hit".format(name, usec))
+    print("{:>12}: {:.1f}x".format('speedup', results['uncompiled'] / results['compiled']))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
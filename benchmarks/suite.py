@@ -0,0 +1,269 @@
+# Copyright (c) 2018, Globo.com (https://github.com/globocom)
+#
+# License: MIT
+
+"""
+Benchmark suite for the decorator overhead, key building and backends. Every
+result is the time of one operation in microseconds (lower is better).
+
+Usage:
+    python -m benchmarks.suite [--quick] [--filter TEXT] [--output results.json]
+        [--baseline baseline.json] [--threshold 0.25]
+
+With `--baseline` each result is compared with the stored one and the exit
+status is 1 if any got slower by more than `--threshold` (a fraction).
+"""
+
+import argparse
+import itertools
+import json
+import platform
+import sys
+import threading
+import time
+import timeit
+
+from generic_cache.backend import InMemoryCache, ShardedInMemoryCache
+from generic_cache.decorator import CacheDecorator
+from generic_cache.key_builder import (
+    ArgsCacheKey, AttrsMethodKeyBuilder, FunctionKeyBuilder, MethodKeyBuilder, _get_func_kwargs,
+)
+
+# (name, function(number) returning usec per operation, default number)
+BENCHMARKS = []
+
+
+def register(name, number):
+    def decorator(func):
+        BENCHMARKS.append((name, func, number))
+        return func
+    return decorator
+
+
+def usec_per_op(func, number, repeat=3):
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number * 1e6
+
+
+def build_decorated(builder_name):
+    '''
+    Returns an argumentless function calling a function decorated with the
+    `builder_name` key builder.
+    '''
+    if builder_name == 'function':
+        cache = CacheDecorator("Bench.", InMemoryCache(), FunctionKeyBuilder())
+
+        @cache("get_photo_url")
+        def get_photo_url(user_id, photo_type, size=100):
+            return "http://myphoto.who/{}/{}/{}".format(user_id, photo_type, size)
+
+        return lambda **kwargs: get_photo_url(42, 'avatar', size=50, **kwargs)
+
+    key_builder = MethodKeyBuilder() if builder_name == 'method' else AttrsMethodKeyBuilder(['id'])
+    cache = CacheDecorator("Bench.", InMemoryCache(), key_builder)
+
+    class User(object):
+        def __init__(self, id):
+            self.id = id
+
+        @cache("get_photo_url")
+        def get_photo_url(self, photo_type, size=100):
+            return "http://myphoto.who/{}/{}/{}".format(self.id, photo_type, size)
+
+    user = User(42)
+    return lambda **kwargs: user.get_photo_url('avatar', size=50, **kwargs)
+
+
+def _register_decorator_benchmarks():
+    for builder_name in ('function', 'method', 'attrs'):
+        @register('decorator.hit.{}'.format(builder_name), 100000)
+        def hit(number, builder_name=builder_name):
+            call = build_decorated(builder_name)
+            call()
+            return usec_per_op(call, number)
+
+        @register('decorator.miss.{}'.format(builder_name), 50000)
+        def miss(number, builder_name=builder_name):
+            call = build_decorated(builder_name)
+            # Never written to cache, so every call is a miss.
+            return usec_per_op(lambda: call(disable_cache_overwrite=True), number)
+
+
+_register_decorator_benchmarks()
+
+SMALL_ARGS = ((1, 'avatar'), {'size': 50})
+LARGE_ARGS = (
+    (list(range(1000)), 'x' * 1000),
+    dict(('kwarg_{}'.format(i), i) for i in range(100)),
+)
+
+
+@register('key_str.small', 100000)
+def key_str_small(number):
+    args, kwargs = SMALL_ARGS
+    return usec_per_op(lambda: ArgsCacheKey('Bench.func', *args, **kwargs).key_str, number)
+
+
+@register('key_str.large', 2000)
+def key_str_large(number):
+    args, kwargs = LARGE_ARGS
+    return usec_per_op(lambda: ArgsCacheKey('Bench.func', *args, **kwargs).key_str, number)
+
+
+@register('key_builder.func_kwargs', 100000)
+def func_kwargs(number):
+    def func(self, a, b, c=None):
+        pass
+    return usec_per_op(lambda: _get_func_kwargs(func, None, 1, 2, c=3), number)
+
+
+TTL_MIXES = {
+    'none': [None],
+    'ttl': [300],
+    'mixed': [None, 60, 300, None, 3600],
+}
+
+
+def build_filled_cache(size, ttl_mix, backend_class=InMemoryCache, **kwargs):
+    cache = backend_class(max_entries=size, **kwargs)
+    timeouts = itertools.cycle(TTL_MIXES[ttl_mix])
+    keys = ['key_{}'.format(i) for i in range(size)]
+    for key in keys:
+        cache.set(key, key, timeout=next(timeouts))
+    return cache, keys
+
+
+def _register_backend_benchmarks():
+    for size in (1000, 100000):
+        for ttl_mix in sorted(TTL_MIXES):
+            suffix = 'size={}.ttl={}'.format(size, ttl_mix)
+
+            @register('backend.get.' + suffix, 200000)
+            def get(number, size=size, ttl_mix=ttl_mix):
+                cache, keys = build_filled_cache(size, ttl_mix)
+                keys = itertools.cycle(keys)
+                return usec_per_op(lambda: cache.get(next(keys)), number)
+
+            @register('backend.set.' + suffix, 100000)
+            def set(number, size=size, ttl_mix=ttl_mix):
+                cache, keys = build_filled_cache(size, ttl_mix)
+                # Half of the writes are new keys, forcing evictions.
+                keys = itertools.cycle(keys + ['new_{}'.format(i) for i in range(size)])
+                timeouts = itertools.cycle(TTL_MIXES[ttl_mix])
+                return usec_per_op(
+                    lambda: cache.set(next(keys), 'value', timeout=next(timeouts)), number)
+
+
+_register_backend_benchmarks()
+
+
+def threaded_usec_per_op(cache, keys, threads, number, write_ratio=0.1):
+    '''
+    Runs `threads` threads doing `number` operations each on `cache`, a
+    `write_ratio` of them sets and the rest gets. Returns the wall clock time
+    per operation, so contention shows as a higher value.
+    '''
+    writes_every = int(1 / write_ratio)
+    start_barrier = threading.Barrier(threads + 1)
+
+    def worker(offset):
+        local_keys = itertools.cycle(keys[offset:] + keys[:offset])
+        start_barrier.wait()
+        for i in range(number):
+            key = next(local_keys)
+            if i % writes_every:
+                cache.get(key)
+            else:
+                cache.set(key, 'value', timeout=300)
+
+    workers = [
+        threading.Thread(target=worker, args=(i * len(keys) // threads,)) for i in range(threads)
+    ]
+    for thread in workers:
+        thread.start()
+    start_barrier.wait()
+    start = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    return (time.perf_counter() - start) / (threads * number) * 1e6
+
+
+CONTENTION_BACKENDS = {
+    'in_memory': InMemoryCache,
+    'sharded': ShardedInMemoryCache,
+}
+
+
+def _register_contention_benchmarks():
+    for backend_name in sorted(CONTENTION_BACKENDS):
+        for threads in (1, 4, 8):
+            @register('contention.{}.threads={}'.format(backend_name, threads), 20000)
+            def contention(number, backend_name=backend_name, threads=threads):
+                cache, keys = build_filled_cache(
+                    10000, 'ttl', CONTENTION_BACKENDS[backend_name])
+                return min(threaded_usec_per_op(cache, keys, threads, number) for _ in range(3))
+
+
+_register_contention_benchmarks()
+
+
+def run(name_filter=None, quick=False):
+    results = {}
+    for name, func, number in BENCHMARKS:
+        if name_filter and name_filter not in name:
+            continue
+        if quick:
+            number = max(number // 10, 1)
+        results[name] = func(number)
+    return results
+
+
+def compare(results, baseline, threshold):
+    '''
+    Returns a list of `(name, current, baseline, ratio, regressed)` for every
+    result also present in `baseline`.
+    '''
+    rows = []
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        ratio = results[name] / baseline[name]
+        rows.append((name, results[name], baseline[name], ratio, ratio > 1 + threshold))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--quick', action='store_true', help="run 10x fewer iterations")
+    parser.add_argument('--filter', help="only run benchmarks whose name contains this")
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    parser.add_argument('--baseline', help="JSON results file to compare with")
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help="slowdown fraction reported as a regression (default 0.25)")
+    args = parser.parse_args(argv)
+
+    results = run(args.filter, args.quick)
+    for name in sorted(results):
+        print("{:<45} {:>10.3f} usec".format(name, results[name]))
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump({
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'results': results,
+            }, output, indent=2, sort_keys=True)
+
+    if not args.baseline:
+        return 0
+    with open(args.baseline) as baseline_file:
+        baseline = json.load(baseline_file)['results']
+    rows = compare(results, baseline, args.threshold)
+    print("\nCompared with {}:".format(args.baseline))
+    for name, current, previous, ratio, regressed in rows:
+        print("{:<45} {:>10.3f} {:>10.3f} {:>7.2f}x{}".format(
+            name, current, previous, ratio, '  REGRESSION' if regressed else ''))
+    return 1 if any(row[-1] for row in rows) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
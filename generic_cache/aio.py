@@ -0,0 +1,400 @@
+# Copyright (c) 2018, Globo.com (https://github.com/globocom)
+#
+# License: MIT
+
+import asyncio
+import functools
+import inspect
+import logging
+import time
+
+from .backend import MISS, BaseBackend, InMemoryCache
+from .cache import CacheEntry, _BaseGenericCache, jitter_timeout
+from .scope import current_scope
+
+__all__ = [
+    'AsyncBaseBackend', 'AsyncInMemoryCache', 'SyncBackendAdapter', 'AsyncGenericCache',
+    'AsyncCacheHandler',
+]
+
+
+class AsyncBaseBackend(object):
+    """
+    Abstract class that acts like every asyncio Cache Backend Interface. Extend it
+    to implement your own asyncio Cache Backend.
+    """
+
+    async def get(self, key, default=None):
+        '''
+        Returns the value cached for `key`, or `default` if the key is not cached.
+        `AsyncGenericCache` passes `default=MISS` only when caching `None` results
+        is enabled, so backends that don't support the argument still work
+        otherwise.
+        '''
+        raise NotImplementedError("Subclasses should implement this method")
+
+    async def set(self, key, value, timeout=None):
+        raise NotImplementedError("Subclasses should implement this method")
+
+    async def delete(self, key):
+        raise NotImplementedError("Subclasses should implement this method")
+
+
+class SyncBackendAdapter(AsyncBaseBackend):
+    '''
+    Exposes a `BaseBackend` through the `AsyncBaseBackend` interface.
+
+    Args:
+        backend (BaseBackend): the wrapped backend.
+        run_in_executor (:obj:`bool`, optional): If `True` every call runs on the
+            event loop default executor, so blocking (networked) backends don't
+            block the loop. Defaults to `False`, which is what you want for in
+            process backends.
+    '''
+
+    def __init__(self, backend, run_in_executor=False):
+        self.backend = backend
+        self.run_in_executor = run_in_executor
+
+    @property
+    def in_process(self):
+        return getattr(self.backend, 'in_process', False)
+
+    async def _call(self, method, *args, **kwargs):
+        if not self.run_in_executor:
+            return method(*args, **kwargs)
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, lambda: method(*args, **kwargs))
+
+    async def get(self, key, **kwargs):
+        return await self._call(self.backend.get, key, **kwargs)
+
+    async def set(self, key, value, timeout=None, **kwargs):
+        return await self._call(self.backend.set, key, value, timeout=timeout, **kwargs)
+
+    async def delete(self, key, **kwargs):
+        return await self._call(self.backend.delete, key, **kwargs)
+
+
+class AsyncInMemoryCache(SyncBackendAdapter):
+    '''
+    asyncio version of `InMemoryCache`. Accepts the same arguments.
+    '''
+
+    def __init__(self, *args, **kwargs):
+        super(AsyncInMemoryCache, self).__init__(InMemoryCache(*args, **kwargs))
+
+    def stats(self):
+        return self.backend.stats()
+
+
+class AsyncGenericCache(_BaseGenericCache):
+    '''
+    asyncio version of `GenericCache`. `func` given to `get` must be an
+    argumentless coroutine function. Concurrent misses for the same key are
+    coalesced: a single `func()` call is awaited and its result is shared.
+
+    Accepts the `GenericCache` arguments, with the same meaning, except for
+    `single_flight_lock` and `refresh_executor`, which raise `ValueError`:
+    stale values are refreshed by background tasks instead (see
+    `max_pending_refreshes`). Misses are always coalesced, so `single_flight`
+    is accepted only for compatibility.
+
+    Args:
+        cache_backend (object): The cache backend to be used. Must be an
+            `AsyncBaseBackend` implementation. `BaseBackend` implementations are
+            wrapped in a `SyncBackendAdapter`.
+
+        default_timeout (:obj:`int`, optional): Default timeout (in seconds) used
+            in key creation.
+
+        logging_enabled (bool): If logging is enabled, defaults to `False`
+
+        key_prefix (str): A string to be preppended on each generated key.
+
+        max_pending_refreshes (int): maximum number of stale values refreshed
+            at once. Further refreshes are dropped until some finish. Defaults
+            to 1000.
+
+    Attributes:
+        refreshes_rejected (int): refreshes dropped because
+            `max_pending_refreshes` was reached.
+        refreshes_failed (int): refreshes whose `func()` raised.
+    '''
+
+    def __init__(
+        self, cache_backend, default_timeout=None, logging_enabled=False, key_prefix='',
+        single_flight=True, single_flight_timeout=None, single_flight_fallback=None,
+        single_flight_lock=False, refresh_executor=None, cache_none=False,
+        negative_timeout=None, codec=None, metrics=None, hot_keys=None,
+        max_pending_refreshes=1000,
+    ):
+        if single_flight_lock:
+            raise ValueError("single_flight_lock is not supported by AsyncGenericCache")
+        if refresh_executor is not None:
+            raise ValueError(
+                "refresh_executor is not supported by AsyncGenericCache, stale values "
+                "are refreshed by tasks (see max_pending_refreshes)"
+            )
+        if isinstance(cache_backend, BaseBackend):
+            cache_backend = SyncBackendAdapter(cache_backend)
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.cache_backend = cache_backend
+        self.default_timeout = default_timeout
+        self.logging_enabled = logging_enabled
+        self.key_prefix = key_prefix
+        self.single_flight = single_flight
+        self.single_flight_timeout = single_flight_timeout
+        self.single_flight_fallback = single_flight_fallback
+        self.cache_none = cache_none
+        self.negative_timeout = negative_timeout
+        self.codec = codec
+        self.metrics = metrics
+        self.hot_keys = hot_keys
+        self.max_pending_refreshes = max_pending_refreshes
+        self.refreshes_rejected = 0
+        self.refreshes_failed = 0
+        self._inflight = {}
+        self._refreshes = set()
+
+    async def _measure(self, timing, error, key, awaitable):
+        '''
+        Awaits `awaitable` reporting its duration as `timing` and, if it raises,
+        counting an `error`.
+        '''
+        with self._measured(timing, error, key):
+            return await awaitable
+
+    async def get_from_cache(self, key, **cache_kwargs):
+        value = self._decode(await self.cache_backend.get(key.key_str, **cache_kwargs))
+        if isinstance(value, CacheEntry):
+            return value.value
+        return value
+
+    async def _lookup(self, key, cache_none, cache_kwargs):
+        if cache_none:
+            value = await self.cache_backend.get(key.key_str, default=MISS, **cache_kwargs)
+        else:
+            value = await self.cache_backend.get(key.key_str, **cache_kwargs)
+        return self._unwrap(self._decode(value), cache_none)
+
+    async def set(
+        self, key, value, stale_ttl=None, negative_timeout=None, ttl_jitter=None, delta=None,
+        **cache_kwargs
+    ):
+        self.log("set key=%s", key)
+        scope = current_scope()
+        if scope is not None:
+            scope.set(self.cache_backend, key.key_str, value)
+        if self.hot_keys is not None:
+            self.hot_keys.unpin(key.key_str)
+        timeout, value = self._prepare_write(
+            key, value, stale_ttl, negative_timeout, delta,
+            lambda timeout: jitter_timeout(timeout, ttl_jitter))
+        write = self.cache_backend.set(
+            key.key_str, self._encode(value), timeout=timeout, **cache_kwargs)
+        if self.metrics is None:
+            await write
+            return
+        await self._measure('backend_set_seconds', 'backend_errors', key, write)
+        self.metrics.increment('sets', key.key_type)
+
+    async def get(
+        self, key, func, disable_cache=False, disable_cache_overwrite=False,
+        single_flight=None, stale_ttl=None, cache_none=None, negative_timeout=None,
+        early_expiration_beta=None, ttl_jitter=None, **cache_kwargs
+    ):
+        '''
+        Same as `GenericCache.get`, but `func` is a coroutine function. Concurrent
+        misses are always coalesced, so `single_flight` is accepted only for
+        signature compatibility. Stale values (see `stale_ttl`) are refreshed by
+        a background task, values expiring early (see `early_expiration_beta`)
+        are recomputed before returning. A `scope.RequestScope` memoizes values
+        across the tasks started within it.
+        '''
+        set_options = {
+            'stale_ttl': stale_ttl,
+            'negative_timeout': negative_timeout,
+            'ttl_jitter': ttl_jitter,
+            'early_expiration': early_expiration_beta is not None,
+        }
+        if disable_cache:
+            return await self._compute(
+                key, func, disable_cache_overwrite, cache_kwargs, set_options)
+
+        cache_none = self._use_cache_none(cache_none, negative_timeout)
+        metrics = self.metrics
+        scope = current_scope()
+        if scope is not None:
+            value = scope.get(self.cache_backend, key.key_str)
+            if value is not MISS and (value is not None or cache_none):
+                self.log("request scope hit for key=%s", key)
+                return value
+        hot = False
+        if self.hot_keys is not None:
+            hot = self.hot_keys.record(key.key_str)
+            if hot:
+                value = self.hot_keys.pinned(key.key_str, MISS)
+                if value is not MISS and (value is not None or cache_none):
+                    self.log("pinned hot key=%s", key)
+                    if metrics is not None:
+                        metrics.increment('hits', key.key_type)
+                        metrics.increment('hot_key_hits', key.key_type)
+                    return value
+        if metrics is None:
+            value, entry = await self._lookup(key, cache_none, cache_kwargs)
+        else:
+            value, entry = await self._measure(
+                'backend_get_seconds', 'backend_errors', key,
+                self._lookup(key, cache_none, cache_kwargs))
+            metrics.increment('misses' if value is MISS else 'hits', key.key_type)
+        if value is not MISS:
+            self.log("cache hit for key=%s", key)
+            if entry is not None:
+                if early_expiration_beta is not None and entry.expires_early(
+                        early_expiration_beta):
+                    self.log("early expiration for key=%s", key)
+                    if metrics is not None:
+                        metrics.increment('early_expirations', key.key_type)
+                    return await self._wait(key, func, self._shared_compute(
+                        key, func, disable_cache_overwrite, cache_kwargs, set_options))
+                if entry.is_stale():
+                    self._schedule_refresh(key, func, cache_kwargs, set_options)
+            if scope is not None:
+                scope.set(self.cache_backend, key.key_str, value)
+            if hot:
+                self.hot_keys.pin(key.key_str, value)
+            return value
+
+        self.log("cache miss for key=%s", key)
+        value = await self._wait(key, func, self._shared_compute(
+            key, func, disable_cache_overwrite, cache_kwargs, set_options))
+        # The computation may have been started by another request's task.
+        if scope is not None and not disable_cache_overwrite:
+            scope.set(self.cache_backend, key.key_str, value)
+        return value
+
+    async def _wait(self, key, func, future):
+        # Shielded so a cancelled (or timed out) caller doesn't cancel the
+        # other waiters.
+        if self.single_flight_timeout is None:
+            return await asyncio.shield(future)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), self.single_flight_timeout)
+        except asyncio.TimeoutError:
+            self.log("single flight wait timed out for key=%s", key)
+        if self.single_flight_fallback is None:
+            return await func()
+        value = self.single_flight_fallback(key)
+        if inspect.isawaitable(value):
+            value = await value
+        return value
+
+    def _shared_compute(self, key, func, disable_cache_overwrite, cache_kwargs, set_options):
+        key_str = key.key_str
+        future = self._inflight.get(key_str)
+        if future is None:
+            future = asyncio.ensure_future(self._compute(
+                key, func, disable_cache_overwrite, cache_kwargs, set_options))
+            self._inflight[key_str] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key_str, None))
+        return future
+
+    def _schedule_refresh(self, key, func, cache_kwargs, set_options):
+        if key.key_str in self._inflight:
+            return
+        if len(self._refreshes) >= self.max_pending_refreshes:
+            self.refreshes_rejected += 1
+            self.log("stale key=%s, too many pending refreshes", key)
+            return
+        task = self._shared_compute(key, func, False, cache_kwargs, set_options)
+        self._refreshes.add(task)
+        task.add_done_callback(functools.partial(self._refresh_done, key))
+        self.log("stale key=%s, refresh scheduled", key)
+
+    def _refresh_done(self, key, task):
+        self._refreshes.discard(task)
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is not None:
+            self.refreshes_failed += 1
+            self.logger.error("failed to refresh key=%s", key, exc_info=error)
+
+    def pending_refreshes(self):
+        return len(self._refreshes)
+
+    async def _compute(self, key, func, disable_cache_overwrite, cache_kwargs, set_options):
+        start = time.perf_counter()
+        if self.metrics is None:
+            value = await func()
+        else:
+            value = await self._measure('compute_seconds', 'compute_errors', key, func())
+        if not disable_cache_overwrite:
+            kwargs = dict(cache_kwargs)
+            kwargs.update(set_options)
+            if kwargs.pop('early_expiration', False):
+                kwargs['delta'] = time.perf_counter() - start
+            await self.set(key, value, **kwargs)
+        return value
+
+    async def flush(self, key, **cache_kwargs):
+        self.log("flush key=%s", key)
+        scope = current_scope()
+        if scope is not None:
+            scope.discard(self.cache_backend, key.key_str)
+        if self.hot_keys is not None:
+            self.hot_keys.unpin(key.key_str)
+        return await self.cache_backend.delete(key.key_str, **cache_kwargs)
+
+
+class AsyncCacheHandler(object):
+    '''
+    `CacheHandler` counterpart for coroutine functions: `get` and `flush` are
+    coroutines.
+    '''
+
+    def __init__(self, func, decorator_factory, key_type, key_version):
+        self.func = func
+        self.decorator_factory = decorator_factory
+        self.key_version = key_version
+        self.key_type = key_type
+
+    async def _call_cache(self, method, *args, **kwargs):
+        key = self.decorator_factory._build_key(
+            self.key_type, self.func, *args, key_version=self.key_version, **kwargs)
+        method = getattr(self.decorator_factory._get_async_generic_cache(), method)
+        return await method(key)
+
+    async def get(self, *args, **kwargs):
+        return await self._call_cache("get_from_cache", *args, **kwargs)
+
+    async def flush(self, *args, **kwargs):
+        return await self._call_cache("flush", *args, **kwargs)
+
+
+def build_async_decorated(
+    decorator_factory, func, build_key, key_type, key_timeout, key_version, get_kwargs
+):
+    '''
+    Builds the wrapper `CacheDecorator` uses for coroutine functions.
+    '''
+    from functools import wraps
+
+    @wraps(func)
+    async def decorated(*args, **kwargs):
+        disable_cache = kwargs.pop('disable_cache', False)
+        disable_cache_overwrite = kwargs.pop('disable_cache_overwrite', False)
+
+        def call_original():
+            return func(*args, **kwargs)
+
+        key = build_key(*args, **kwargs)
+        key.timeout = key_timeout
+        return await decorator_factory._get_async_generic_cache().get(
+            key, call_original, disable_cache=disable_cache,
+            disable_cache_overwrite=disable_cache_overwrite, **get_kwargs
+        )
+    decorated.cache = AsyncCacheHandler(func, decorator_factory, key_type, key_version)
+    return decorated
+
@@ -2,16 +2,51 @@
 #
 # License: MIT
 
-from datetime import datetime, timedelta
+import sys
+import threading
+from .eviction import BaseEvictionPolicy, get_policy
+from .expiry import ExpiryQueue, Sweeper, monotonic
+
+__all__ = [
+    'MISS', 'BaseBackend', 'InMemoryCache', 'ShardedInMemoryCache', 'TieredBackend',
+]
+
+
+class _Miss(object):
+    '''
+    Type of the `MISS` sentinel.
+    '''
+
+    def __repr__(self):
+        return 'MISS'
+
+    def __reduce__(self):
+        return 'MISS'
+
+
+# Passed as `default` to `BaseBackend.get` when a cached `None` must be told apart
+# from a key that is not cached.
+MISS = _Miss()
 
 
 class BaseBackend(object):
     """
     Abstract class that acts like every Cache Backend Interface. Extend it
     to implement your own Cache Backend.
+
+    Attributes:
+        in_process (bool): `True` for backends that keep values as live objects in
+            the process memory, which need no serialization (see `codec.Codec`).
     """
 
-    def get(self, key):
+    in_process = False
+
+    def get(self, key, default=None):
+        '''
+        Returns the value cached for `key`, or `default` if the key is not cached.
+        `GenericCache` passes `default=MISS` only when caching `None` results is
+        enabled, so backends that don't support the argument still work otherwise.
+        '''
         raise NotImplementedError("Subclasses should implement this method")
 
     def set(self, key, value, timeout=None):
@@ -20,27 +55,554 @@ class BaseBackend(object):
     def delete(self, key):
         raise NotImplementedError("Subclasses should implement this method")
 
+    def add(self, key, value, timeout=None):
+        '''
+        Sets `value` for `key` only if `key` is not already cached. Must return
+        `True` if the value was stored and `False` otherwise. It is optional, but
+        it must be atomic, since it is used as a lock across processes (see
+        `GenericCache` single-flight mode).
+        '''
+        raise NotImplementedError("Subclasses should implement this method")
+
+    def get_many(self, keys):
+        '''
+        Returns a dict with the values of the cached `keys`. Keys that are not
+        cached are left out. The default implementation calls `get` for each key
+        (so cached `None` values are left out too), override it if your backend can
+        fetch many keys in one round trip.
+        '''
+        values = {}
+        for key in keys:
+            value = self.get(key)
+            if value is not None:
+                values[key] = value
+        return values
+
+    def set_many(self, mapping, timeout=None):
+        '''
+        Sets every `key: value` pair of `mapping`, all with the same `timeout`.
+        The default implementation calls `set` for each pair.
+        '''
+        for key, value in mapping.items():
+            self.set(key, value, timeout=timeout)
+
+    def delete_many(self, keys):
+        '''
+        Deletes every key in `keys`. The default implementation calls `delete` for
+        each key.
+        '''
+        for key in keys:
+            self.delete(key)
+
 
 class InMemoryCache(BaseBackend):
-    def __init__(self):
+    '''
+    A dict based cache backend living in the process memory.
+
+    By default the cache is unbounded. Pass `max_entries` and/or `max_bytes` to
+    bound it: once a limit would be exceeded, keys are evicted according to
+    `eviction_policy`.
+
+    Expiration deadlines are monotonic clock floats kept in an expiry heap.
+    Expired entries are freed when read, a few at a time on every `set` (see
+    `reclaim_batch`) and, optionally, by a background sweeper thread.
+
+    Args:
+        max_entries (:obj:`int`, optional): maximum number of cached keys.
+        max_bytes (:obj:`int`, optional): maximum accumulated size of the cached
+            entries, as measured by `sizeof`.
+        eviction_policy (:obj:`str` or `BaseEvictionPolicy`, optional): `'lru'`
+            (default), `'lfu'`, `'tinylfu'` or a `eviction.BaseEvictionPolicy`
+            instance. Only used when the cache is bounded.
+        sizeof (:obj:`function`, optional): `sizeof(key, value)` returning the
+            size of an entry in bytes. Defaults to the shallow `sys.getsizeof` of
+            the key plus the value.
+        reclaim_batch (:obj:`int`, optional): maximum number of expired entries
+            freed on each `set`. Defaults to 16. `0` disables it.
+        sweep_interval (:obj:`float`, optional): if given, a daemon thread frees
+            every expired entry each `sweep_interval` seconds. Call `close` to
+            stop it.
+        clock (:obj:`function`, optional): returns the current time in seconds.
+            Defaults to `time.monotonic`.
+    '''
+
+    in_process = True
+
+    def __init__(
+        self, max_entries=None, max_bytes=None, eviction_policy='lru', sizeof=None,
+        reclaim_batch=16, sweep_interval=None, clock=monotonic,
+    ):
         self._cache = {}
+        self._lock = threading.RLock()
+        self._clock = clock
+        self._expiry = ExpiryQueue()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.bounded = max_entries is not None or max_bytes is not None
+        self._policy = get_policy(eviction_policy) if self.bounded else None
+        self._sizeof = sizeof or _default_sizeof
+        self._sizes = {}
+        self._bytes = 0
+        self.reclaim_batch = reclaim_batch
+        self.evictions = 0
+        self.rejections = 0
+        self.expired_entries = 0
+        self.expired_bytes = 0
+        self._sweeper = None
+        if sweep_interval is not None:
+            self._sweeper = Sweeper(self.purge_expired, sweep_interval)
+            self._sweeper.start()
 
-    def get(self, key):
-        now = datetime.now()
-        value, expires_in = self._cache.get(key, (None, None))
-        if expires_in is not None and expires_in < now:
-            return None
-        return value
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return default
+            value, deadline = entry
+            if deadline is not None and deadline <= self._clock():
+                self._expire(key, entry)
+                return default
+            if self._policy is not None:
+                self._policy.record_access(key)
+            return value
 
     def set(self, key, value, timeout=None):
-        expires_in = None
-        if timeout is not None:
-            expires_in = datetime.now() + timedelta(seconds=timeout)
-        self._cache[key] = (value, expires_in)
+        with self._lock:
+            self._store(key, value, self._prepare_write(timeout))
+
+    def _prepare_write(self, timeout):
+        # Reclaims some expired entries and returns the deadline for `timeout`.
+        deadline = None
+        if timeout is not None or self.reclaim_batch:
+            now = self._clock()
+            if self.reclaim_batch:
+                self._reclaim(now, self.reclaim_batch)
+            if timeout is not None:
+                deadline = now + timeout
+        return deadline
+
+    def _store(self, key, value, deadline):
+        if not self.bounded:
+            self._cache[key] = (value, deadline)
+        else:
+            size = self._sizeof(key, value) if self.max_bytes is not None else 0
+            if key in self._cache:
+                if not self._update(key, value, deadline, size):
+                    return
+            elif not self._insert(key, value, deadline, size):
+                return
+        if deadline is not None:
+            self._push_deadline(deadline, key)
 
     def delete(self, key):
-        self._cache.pop(key, None)
+        with self._lock:
+            self._remove(key)
+
+    def add(self, key, value, timeout=None):
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and (entry[1] is None or entry[1] > self._clock()):
+                return False
+            self.set(key, value, timeout=timeout)
+            return key in self._cache
+
+    def get_many(self, keys):
+        values = {}
+        with self._lock:
+            now = self._clock()
+            for key in keys:
+                entry = self._cache.get(key)
+                if entry is None:
+                    continue
+                if entry[1] is not None and entry[1] <= now:
+                    self._expire(key, entry)
+                    continue
+                if self._policy is not None:
+                    self._policy.record_access(key)
+                values[key] = entry[0]
+        return values
+
+    def set_many(self, mapping, timeout=None):
+        with self._lock:
+            deadline = self._prepare_write(timeout)
+            for key, value in mapping.items():
+                self._store(key, value, deadline)
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._remove(key)
+
+    def purge_expired(self):
+        '''
+        Frees every expired entry and returns how many were freed.
+        '''
+        with self._lock:
+            return self._reclaim(self._clock())
+
+    def close(self):
+        '''
+        Stops the background sweeper, if any.
+        '''
+        if self._sweeper is not None:
+            self._sweeper.stop()
+            self._sweeper = None
+
+    def _push_deadline(self, deadline, key):
+        self._expiry.push(deadline, key)
+        if len(self._expiry) > 2 * len(self._cache) + 64:
+            self._expiry.rebuild(dict(
+                (k, d) for k, (_, d) in self._cache.items() if d is not None
+            ))
+
+    def _reclaim(self, now, limit=None):
+        reclaimed = 0
+        for deadline, key in self._expiry.pop_expired(now, limit):
+            entry = self._cache.get(key)
+            # Stale heap pairs (overwritten or deleted keys) are just dropped.
+            if entry is not None and entry[1] == deadline:
+                self._expire(key, entry)
+                reclaimed += 1
+        return reclaimed
+
+    def _expire(self, key, entry):
+        size = self._sizes.get(key)
+        if size is None:
+            size = self._sizeof(key, entry[0])
+        self._remove(key)
+        self.expired_entries += 1
+        self.expired_bytes += size
+
+    def _insert(self, key, value, deadline, size):
+        if not self._make_room(key, size):
+            self.rejections += 1
+            record_rejection = getattr(self._policy, 'record_rejection', None)
+            if record_rejection is not None:
+                record_rejection(key)
+            return False
+        self._cache[key] = (value, deadline)
+        self._policy.record_insert(key)
+        if self.max_bytes is not None:
+            self._sizes[key] = size
+            self._bytes += size
+        return True
+
+    def _update(self, key, value, deadline, size):
+        if self.max_bytes is not None and size > self.max_bytes:
+            self._remove(key)
+            self.rejections += 1
+            return False
+        self._cache[key] = (value, deadline)
+        self._policy.record_access(key)
+        if self.max_bytes is None:
+            return True
+        self._bytes += size - self._sizes[key]
+        self._sizes[key] = size
+        while self._bytes > self.max_bytes:
+            victim = self._policy.victim()
+            if victim is None:
+                break
+            self._remove(victim)
+            self.evictions += 1
+        return key in self._cache
+
+    def _remove(self, key):
+        if self._cache.pop(key, MISS) is MISS:
+            return
+        if self._policy is not None:
+            self._policy.record_remove(key)
+            self._bytes -= self._sizes.pop(key, 0)
+
+    def _is_full(self, extra_bytes):
+        if self.max_entries is not None and len(self._cache) >= self.max_entries:
+            return True
+        if self.max_bytes is not None and self._bytes + extra_bytes > self.max_bytes:
+            return True
+        return False
+
+    def _make_room(self, key, size):
+        if self.max_bytes is not None and size > self.max_bytes:
+            return False
+        if self.max_entries is not None and self.max_entries <= 0:
+            return False
+        while self._is_full(size):
+            victim = self._policy.victim()
+            if victim is None:
+                return False
+            if not self._policy.admit(key, victim):
+                return False
+            self._remove(victim)
+            self.evictions += 1
+        return True
+
+    def __len__(self):
+        return len(self._cache)
+
+    def stats(self):
+        '''
+        Returns a dict with the current number of entries and bytes (`bytes` is
+        only tracked when `max_bytes` is set), the eviction counters and the
+        number of entries and bytes reclaimed after expiring.
+        '''
+        with self._lock:
+            return {
+                'entries': len(self._cache),
+                'bytes': self._bytes,
+                'evictions': self.evictions,
+                'rejections': self.rejections,
+                'expired_entries': self.expired_entries,
+                'expired_bytes': self.expired_bytes,
+            }
 
     def print_cache(self):
         import pprint
         pprint.pprint(self._cache)
+
+
+class ShardedInMemoryCache(BaseBackend):
+    '''
+    An in process cache split in `shards` independent `InMemoryCache` instances,
+    each with its own lock, expiry heap and eviction bookkeeping. Keys are
+    assigned to shards by hash, so threads working on different keys rarely
+    wait for each other.
+
+    Single key operations behave like `InMemoryCache`'s. Batch operations are
+    split by shard and each part is atomic, but a batch is not atomic as a whole.
+    Limits are split evenly among shards, so eviction approximates the policy
+    over the whole cache.
+
+    Args:
+        shards (int): number of shards. Defaults to 16.
+        max_entries (:obj:`int`, optional): maximum number of cached keys.
+        max_bytes (:obj:`int`, optional): maximum accumulated size of the entries.
+        eviction_policy (:obj:`str` or `function`, optional): a policy name (see
+            `InMemoryCache`) or a function returning a new
+            `eviction.BaseEvictionPolicy`, called once per shard.
+        sweep_interval (:obj:`float`, optional): if given, a single daemon thread
+            frees the expired entries of every shard each `sweep_interval`
+            seconds. Call `close` to stop it.
+        **kwargs: other `InMemoryCache` arguments (`sizeof`, `reclaim_batch`,
+            `clock`), given to every shard.
+    '''
+
+    in_process = True
+
+    def __init__(
+        self, shards=16, max_entries=None, max_bytes=None, eviction_policy='lru',
+        sweep_interval=None, **kwargs
+    ):
+        if shards < 1:
+            raise ValueError("shards must be at least 1")
+        if isinstance(eviction_policy, BaseEvictionPolicy):
+            raise ValueError(
+                "eviction policies can't be shared among shards, pass a name or a factory")
+        self._shards = tuple(
+            InMemoryCache(
+                max_entries=_split_limit(max_entries, shards),
+                max_bytes=_split_limit(max_bytes, shards),
+                eviction_policy=(
+                    eviction_policy() if callable(eviction_policy) else eviction_policy),
+                **kwargs
+            ) for _ in range(shards)
+        )
+        self._sweeper = None
+        if sweep_interval is not None:
+            self._sweeper = Sweeper(self.purge_expired, sweep_interval)
+            self._sweeper.start()
+
+    def _shard(self, key):
+        return self._shards[hash(key) % len(self._shards)]
+
+    def _group(self, keys):
+        groups = {}
+        count = len(self._shards)
+        for key in keys:
+            groups.setdefault(hash(key) % count, []).append(key)
+        return [(self._shards[index], group) for index, group in groups.items()]
+
+    def get(self, key, default=None):
+        return self._shard(key).get(key, default)
+
+    def set(self, key, value, timeout=None):
+        self._shard(key).set(key, value, timeout=timeout)
+
+    def delete(self, key):
+        self._shard(key).delete(key)
+
+    def add(self, key, value, timeout=None):
+        return self._shard(key).add(key, value, timeout=timeout)
+
+    def get_many(self, keys):
+        values = {}
+        for shard, group in self._group(keys):
+            values.update(shard.get_many(group))
+        return values
+
+    def set_many(self, mapping, timeout=None):
+        for shard, group in self._group(mapping):
+            shard.set_many(dict((key, mapping[key]) for key in group), timeout=timeout)
+
+    def delete_many(self, keys):
+        for shard, group in self._group(keys):
+            shard.delete_many(group)
+
+    def purge_expired(self):
+        '''
+        Frees every expired entry and returns how many were freed.
+        '''
+        return sum(shard.purge_expired() for shard in self._shards)
+
+    def close(self):
+        '''
+        Stops the background sweeper, if any.
+        '''
+        if self._sweeper is not None:
+            self._sweeper.stop()
+            self._sweeper = None
+
+    def __len__(self):
+        return sum(len(shard) for shard in self._shards)
+
+    def stats(self):
+        '''
+        Returns the `InMemoryCache.stats` of every shard summed up.
+        '''
+        totals = {}
+        for shard in self._shards:
+            for name, value in shard.stats().items():
+                totals[name] = totals.get(name, 0) + value
+        return totals
+
+    def print_cache(self):
+        for shard in self._shards:
+            shard.print_cache()
+
+
+def _split_limit(limit, shards):
+    if limit is None:
+        return None
+    return -(-limit // shards)
+
+
+class TieredBackend(BaseBackend):
+    '''
+    Composite backend serving reads from a small in process cache (L1) in front of
+    any other backend (L2), usually a remote one shared by many processes. L2 hits
+    are promoted into L1 and writes go to both tiers.
+
+    L1 entries live at most `l1_timeout` seconds, which also bounds how long a
+    process may serve a value that was overwritten or deleted by another process.
+    Keys used to coordinate processes through `add`, like the `GenericCache`
+    `single_flight_lock`, should not be read with `get` for the same reason.
+
+    Args:
+        l2 (BaseBackend): the shared backend.
+        l1 (:obj:`BaseBackend`, optional): the in process backend. Defaults to an
+            `InMemoryCache` bounded by `l1_max_entries`.
+        l1_max_entries (int): size of the default L1. Defaults to 1000.
+        l1_timeout (float): maximum timeout (in seconds) of L1 entries. May be
+            overridden per call with the `l1_timeout` kwarg, e.g. through
+            `CacheDecorator` `cache_kwargs`. Defaults to 5.
+        l1_eviction_policy (str): eviction policy of the default L1.
+
+    Attributes:
+        l1_hits (int): reads served by L1.
+        l2_hits (int): reads served by L2.
+        misses (int): reads found in neither tier.
+    '''
+
+    def __init__(
+        self, l2, l1=None, l1_max_entries=1000, l1_timeout=5, l1_eviction_policy='lru',
+    ):
+        if l1 is None:
+            l1 = InMemoryCache(max_entries=l1_max_entries, eviction_policy=l1_eviction_policy)
+        self.l1 = l1
+        self.l2 = l2
+        self.l1_timeout = l1_timeout
+        self.l1_hits = 0
+        self.l2_hits = 0
+        self.misses = 0
+
+    def _l1_timeout(self, timeout, l1_timeout):
+        if l1_timeout is None:
+            l1_timeout = self.l1_timeout
+        if timeout is None:
+            return l1_timeout
+        if l1_timeout is None:
+            return timeout
+        return min(timeout, l1_timeout)
+
+    def get(self, key, default=None, l1_timeout=None):
+        value = self.l1.get(key, default=MISS)
+        if value is not MISS:
+            self.l1_hits += 1
+            return value
+        if default is MISS:
+            value = self.l2.get(key, default=MISS)
+        else:
+            value = self.l2.get(key)
+            if value is None:
+                value = MISS
+        if value is MISS:
+            self.misses += 1
+            return default
+        self.l2_hits += 1
+        self.l1.set(key, value, timeout=self._l1_timeout(None, l1_timeout))
+        return value
+
+    def set(self, key, value, timeout=None, l1_timeout=None):
+        self.l2.set(key, value, timeout=timeout)
+        self.l1.set(key, value, timeout=self._l1_timeout(timeout, l1_timeout))
+
+    def delete(self, key):
+        self.l1.delete(key)
+        self.l2.delete(key)
+
+    def add(self, key, value, timeout=None):
+        added = self.l2.add(key, value, timeout=timeout)
+        if added:
+            self.l1.delete(key)
+        return added
+
+    def get_many(self, keys, l1_timeout=None):
+        keys = list(keys)
+        values = self.l1.get_many(keys)
+        self.l1_hits += len(values)
+        missing = [key for key in keys if key not in values]
+        if not missing:
+            return values
+        found = self.l2.get_many(missing)
+        self.l2_hits += len(found)
+        self.misses += len(missing) - len(found)
+        if found:
+            self.l1.set_many(found, timeout=self._l1_timeout(None, l1_timeout))
+            values.update(found)
+        return values
+
+    def set_many(self, mapping, timeout=None, l1_timeout=None):
+        self.l2.set_many(mapping, timeout=timeout)
+        self.l1.set_many(mapping, timeout=self._l1_timeout(timeout, l1_timeout))
+
+    def delete_many(self, keys):
+        keys = list(keys)
+        self.l1.delete_many(keys)
+        self.l2.delete_many(keys)
+
+    def stats(self):
+        '''
+        Returns the per tier hit counters and hit rates. `l1_hit_rate` is relative
+        to every read, `l2_hit_rate` to the reads that reached L2.
+        '''
+        l1_requests = self.l1_hits + self.l2_hits + self.misses
+        l2_requests = self.l2_hits + self.misses
+        return {
+            'l1_hits': self.l1_hits,
+            'l2_hits': self.l2_hits,
+            'misses': self.misses,
+            'l1_hit_rate': float(self.l1_hits) / l1_requests if l1_requests else 0.0,
+            'l2_hit_rate': float(self.l2_hits) / l2_requests if l2_requests else 0.0,
+        }
+
+
+def _default_sizeof(key, value):
+    return sys.getsizeof(key) + sys.getsizeof(value)
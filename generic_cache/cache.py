@@ -2,11 +2,21 @@
 #
 # License: MIT
 
+import contextlib
+import functools
 import logging
-from .backend import BaseBackend
+import math
+import random
+import threading
+import time
+from .backend import MISS, BaseBackend
+from .profiling import current_call
+from .refresh import RefreshExecutor
+from .scope import RequestScope, current_scope
+from .single_flight import SingleFlight, SingleFlightTimeout
 
 __all__ = [
-    'BaseCacheKey', 'ArgsCacheKey', 'GenericCache',
+    'BaseCacheKey', 'ArgsCacheKey', 'CacheEntry', 'GenericCache',
 ]
 
 
@@ -120,7 +130,177 @@ class ArgsCacheKey(BaseCacheKey):
         return self._key_str
 
 
-class GenericCache(object):
+class CacheEntry(object):
+    '''
+    Envelope stored on the cache backend when a value carries metadata besides
+    the value itself.
+
+    Attributes:
+        value (object): the cached value.
+        stale_at (float): unix timestamp after which the value is stale.
+        delta (float): seconds it took to compute the value.
+        expires_at (float): unix timestamp when the value expires from cache.
+    '''
+
+    __slots__ = ('value', 'stale_at', 'delta', 'expires_at')
+
+    def __init__(self, value, stale_at=None, delta=None, expires_at=None):
+        self.value = value
+        self.stale_at = stale_at
+        self.delta = delta
+        self.expires_at = expires_at
+
+    def is_stale(self, now=None):
+        if self.stale_at is None:
+            return False
+        return self.stale_at <= (time.time() if now is None else now)
+
+    def expires_early(self, beta=1.0, now=None):
+        '''
+        Tells whether the value should be recomputed before it expires, using
+        the XFetch algorithm: the probability rises as `expires_at` approaches,
+        sooner for values that are slow to compute (`delta`) and for larger
+        `beta`.
+        '''
+        if self.delta is None or self.expires_at is None:
+            return False
+        now = time.time() if now is None else now
+        # 1 - random() is never 0, whose log is undefined.
+        return now - self.delta * beta * math.log(1.0 - random.random()) >= self.expires_at
+
+    def __getstate__(self):
+        return dict((slot, getattr(self, slot)) for slot in self.__slots__)
+
+    def __setstate__(self, state):
+        for slot in self.__slots__:
+            setattr(self, slot, state.get(slot))
+
+
+def jitter_timeout(timeout, ttl_jitter):
+    '''
+    Returns `timeout` shortened by a random fraction of up to `ttl_jitter`, so
+    keys written together don't all expire at the same moment.
+    '''
+    if timeout is None or not ttl_jitter:
+        return timeout
+    return timeout * (1 - random.uniform(0, ttl_jitter))
+
+
+def _refresh_one(func_for_missing, key):
+    return func_for_missing([key])[0]
+
+
+class _BaseGenericCache(object):
+    '''
+    Helpers shared by `GenericCache` and `aio.AsyncGenericCache`, which don't
+    depend on the backend being called synchronously or not.
+    '''
+
+    def log(self, *args, **kwargs):
+        '''
+        Logs messages if `logging_enabled == True`. Pass the message arguments
+        separately (`self.log("key=%s", key)`) so they are only formatted when the
+        message is emitted.
+
+        Attributes:
+            log_level (int): the log level, defaults to `logging.DEBUG`. All other args
+                and kwargs
+            are forwarded to `logger.log` method.
+        '''
+        if not self.logging_enabled:
+            return
+        level = kwargs.pop('log_level', logging.DEBUG)
+        self.logger.log(level, *args, **kwargs)
+
+    def _get_codec(self):
+        if self.codec is None or getattr(self.cache_backend, 'in_process', False):
+            return None
+        return self.codec
+
+    def _encode(self, value):
+        codec = self._get_codec()
+        return value if codec is None else codec.encode(value)
+
+    def _decode(self, value):
+        codec = self._get_codec()
+        if codec is None or value is None or value is MISS:
+            return value
+        return codec.decode(value)
+
+    def _unwrap(self, value, cache_none):
+        '''
+        Returns the `(value, entry)` tuple of `_lookup` for a raw (decoded) value.
+        '''
+        entry = None
+        if isinstance(value, CacheEntry):
+            entry = value
+            value = entry.value
+        if value is None and not cache_none:
+            value = MISS
+        return value, entry
+
+    @contextlib.contextmanager
+    def _measured(self, timing, error, key):
+        '''
+        Reports the duration of the block as `timing` and, if it raises, counts
+        an `error`.
+        '''
+        key_type = key.key_type
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.metrics.increment(error, key_type)
+            raise
+        finally:
+            self.metrics.observe(timing, key_type, time.perf_counter() - start)
+
+    def _use_cache_none(self, cache_none, negative_timeout):
+        if cache_none is None:
+            cache_none = self.cache_none
+        return cache_none or negative_timeout is not None or self.negative_timeout is not None
+
+    def _prepare_write(self, key, value, stale_ttl, negative_timeout, delta, jitter):
+        '''
+        Returns the `(timeout, value)` pair written for `key`: `None` values get
+        the negative timeout, the timeout is passed through `jitter` and the
+        value is wrapped in a `CacheEntry` when needed (see `set`).
+        '''
+        timeout = key.timeout
+        if value is None:
+            if negative_timeout is None:
+                negative_timeout = self.negative_timeout
+            if negative_timeout is not None:
+                timeout = negative_timeout
+        timeout = jitter(timeout)
+        if stale_ttl is not None or delta is not None:
+            now = time.time()
+            value = CacheEntry(
+                value,
+                stale_at=None if stale_ttl is None else now + stale_ttl,
+                delta=delta,
+                expires_at=None if timeout is None else now + timeout,
+            )
+        return timeout, value
+
+    def get_key(self, key_type, *args, **kwargs):
+        '''
+        Generates a ArgsCacheKey based on the key_type, args and kwargs. This method
+        may be overridden to better suits the use case needs.
+        Args:
+            key_type(`str`): The base key_type for ArgsCacheKey
+        *args and **kwargs will be forward to ArgsCacheKey initializer.
+
+        Returns:
+            ArgsCacheKey: the generated key
+        '''
+        timeout = kwargs.pop('timeout', self.default_timeout)
+        return ArgsCacheKey(
+            self.key_prefix + key_type, timeout=timeout, *args, **kwargs
+        )
+
+
+class GenericCache(_BaseGenericCache):
     '''
     Generic cache class, intented to be used as a helper for caching class or instance
     methods.
@@ -134,6 +314,49 @@ class GenericCache(object):
 
         logging_enabled (bool): If logging is enabled, defaults to `False`
 
+        single_flight (:obj:`bool`, optional): If `True`, concurrent misses for the
+            same key within the process are collapsed: one thread calls `func()`
+            and the others wait for its result. Defaults to `False`.
+
+        single_flight_timeout (:obj:`float`, optional): How many seconds a caller
+            waits for another caller's computation before falling back, also the
+            timeout of the `single_flight_lock`. Defaults to `None` (waits
+            forever, or for `lock_timeout` seconds when `single_flight_lock` is
+            enabled).
+
+        single_flight_fallback (:obj:`function`, optional): Called with the key when
+            the wait times out, its return value is used as the result. Defaults to
+            calling `func()` without writing the result to cache.
+
+        single_flight_lock (:obj:`bool`, optional): If `True`, the leader also takes a
+            lock on the cache backend (using `cache_backend.add`) so that misses are
+            collapsed across processes too. Callers that don't get the lock poll the
+            cache until the value shows up, and take the lock over if it's released
+            without a value. Defaults to `False`.
+
+        refresh_executor (:obj:`RefreshExecutor`, optional): Thread pool used to
+            refresh stale values (see `stale_ttl` on `get`). A default one is
+            created on first use.
+
+        cache_none (:obj:`bool`, optional): If `True`, `None` results are cached
+            too. The cache backend must support the `default` argument of `get`
+            (see `backend.MISS`). Defaults to `False`: `None` means a cache miss.
+
+        negative_timeout (:obj:`int`, optional): Timeout (in seconds) used instead
+            of `key.timeout` when caching a `None` result. Implies `cache_none`.
+
+        codec (:obj:`codec.Codec`, optional): Serializes (and compresses) values
+            before writing them to the cache backend. Skipped for in process
+            backends (see `BaseBackend.in_process`), which store live objects.
+
+        metrics (:obj:`metrics.BaseMetricsSink`, optional): Receives hit, miss,
+            set and error counts and backend and `func()` timings, labeled by
+            `key.key_type`. Defaults to `None` (no metrics).
+
+        hot_keys (:obj:`hot_keys.HotKeyDetector`, optional): Records the keys read
+            by `get` to find the hottest ones, and serves them from its in
+            process replica when it pins them. Defaults to `None`.
+
     Attributes:
         logger (logging.Logger): the logger instance used for logging.
         cache_backend (object): the cache backend to be used.
@@ -142,29 +365,35 @@ class GenericCache(object):
         key_prefix (str): A string to be preppended on each generated key. Defaults to ''.
     '''
 
+    lock_suffix = '__lock'
+    # Bytes, so backends storing raw values (e.g. RedisBackend(codec=None)) accept it.
+    lock_value = b'1'
+    lock_poll_interval = 0.05
+    lock_timeout = 30
+
     def __init__(
         self, cache_backend=BaseBackend(), default_timeout=None, logging_enabled=False,
-        key_prefix='',
+        key_prefix='', single_flight=False, single_flight_timeout=None,
+        single_flight_fallback=None, single_flight_lock=False, refresh_executor=None,
+        cache_none=False, negative_timeout=None, codec=None, metrics=None, hot_keys=None,
     ):
         self.logger = logging.getLogger(self.__class__.__name__)
         self.cache_backend = cache_backend
         self.default_timeout = default_timeout
         self.logging_enabled = logging_enabled
         self.key_prefix = key_prefix
-
-    def log(self, *args, **kwargs):
-        '''
-        Logs messages if `logging_enabled == True`.
-
-        Attributes:
-            log_level (int): the log level, defaults to `logging.DEBUG`. All other args
-                and kwargs
-            are forwarded to `logger.log` method.
-        '''
-        if not self.logging_enabled:
-            return
-        level = kwargs.pop('log_level', logging.DEBUG)
-        self.logger.log(level, *args, **kwargs)
+        self.single_flight = single_flight
+        self.single_flight_timeout = single_flight_timeout
+        self.single_flight_fallback = single_flight_fallback
+        self.single_flight_lock = single_flight_lock
+        self._flights = SingleFlight()
+        self.refresh_executor = refresh_executor
+        self._refresh_executor_lock = threading.Lock()
+        self.cache_none = cache_none
+        self.negative_timeout = negative_timeout
+        self.codec = codec
+        self.metrics = metrics
+        self.hot_keys = hot_keys
 
     def get_from_cache(self, key, **cache_kwargs):
         '''
@@ -172,22 +401,87 @@ class GenericCache(object):
         the cache key. It is expected that `key` is a `BaseCacheKey` instance. Aditional
         cache kwargs will be forwarded to cache backend method `get`.
         '''
-        return self.cache_backend.get(key.key_str, **cache_kwargs)
+        value = self._get_raw(key, **cache_kwargs)
+        if isinstance(value, CacheEntry):
+            return value.value
+        return value
+
+    def _get_raw(self, key, **cache_kwargs):
+        call = current_call()
+        if call is not None:
+            return self._decode(call.measure(
+                'backend_get', self.cache_backend.get, key.key_str, **cache_kwargs))
+        return self._decode(self.cache_backend.get(key.key_str, **cache_kwargs))
+
+    def _lookup(self, key, cache_none, cache_kwargs):
+        '''
+        Returns a `(value, entry)` tuple for `key`. `value` is `MISS` if the key is
+        not cached (or is cached as `None` and `cache_none` is off) and `entry` is
+        the `CacheEntry` envelope, if the value was stored in one.
+        '''
+        if cache_none:
+            value = self._get_raw(key, default=MISS, **cache_kwargs)
+        else:
+            value = self._get_raw(key, **cache_kwargs)
+        return self._unwrap(value, cache_none)
+
+    def _measure(self, timing, error, key, func, *args):
+        '''
+        Calls `func(*args)` reporting its duration as `timing` and, if it raises,
+        counting an `error`.
+        '''
+        with self._measured(timing, error, key):
+            return func(*args)
 
-    def set(self, key, value, **cache_kwargs):
+    def set(
+        self, key, value, stale_ttl=None, negative_timeout=None, ttl_jitter=None, delta=None,
+        **cache_kwargs
+    ):
         '''
         Sets `value` for `key` on cache. `key.key_str` will be used as
         the cache key. It is expected that `key` is a `BaseCacheKey` instance. Aditional
         cache kwargs will be forwarded to cache backend method `set`. The `key.timeout`
         value will be used for timeout.
+
+        If `stale_ttl` is given the value is stored in a `CacheEntry` which is
+        considered stale after `stale_ttl` seconds (see `get`). If `value` is `None`,
+        `negative_timeout` (or the instance `negative_timeout`) is used as timeout
+        when given. `ttl_jitter` shortens the timeout by a random fraction of up to
+        `ttl_jitter` (see `jitter_timeout`). If `delta`, the seconds it took to
+        compute `value`, is given it is stored in a `CacheEntry` along with the
+        expiration time, for early expiration (see `early_expiration_beta` on
+        `get`).
         '''
-        self.log("set key={}".format(key))
-        self.cache_backend.set(
-            key.key_str, value, timeout=key.timeout, **cache_kwargs)
+        self.log("set key=%s", key)
+        scope = current_scope()
+        if scope is not None:
+            scope.set(self.cache_backend, key.key_str, value)
+        if self.hot_keys is not None:
+            self.hot_keys.unpin(key.key_str)
+        timeout, value = self._prepare_write(
+            key, value, stale_ttl, negative_timeout, delta,
+            lambda timeout: jitter_timeout(timeout, ttl_jitter))
+        call = current_call()
+        if self.metrics is None and call is None:
+            self.cache_backend.set(
+                key.key_str, self._encode(value), timeout=timeout, **cache_kwargs)
+            return
+
+        def write():
+            self.cache_backend.set(
+                key.key_str, self._encode(value), timeout=timeout, **cache_kwargs)
+        if call is not None:
+            write = functools.partial(call.measure, 'backend_set', write)
+        if self.metrics is None:
+            write()
+            return
+        self._measure('backend_set_seconds', 'backend_errors', key, write)
+        self.metrics.increment('sets', key.key_type)
 
     def get(
         self, key, func, disable_cache=False, disable_cache_overwrite=False,
-        **cache_kwargs
+        single_flight=None, stale_ttl=None, cache_none=None, negative_timeout=None,
+        early_expiration_beta=None, ttl_jitter=None, **cache_kwargs
     ):
         '''
         Gets the value for `key`. It first tries to get the value from cache. If it
@@ -203,42 +497,357 @@ class GenericCache(object):
                 `func()`.
             disable_cache_overwrite (:obj:`bool`, optional): Defaults to `False`. If
             `True` won't write to cache when value is evaluated by `func()`.
+            single_flight (:obj:`bool`, optional): Overrides the instance
+                `single_flight` setting for this call.
+            stale_ttl (:obj:`float`, optional): Soft timeout (in seconds). Values
+                older than it are still returned, but a refresh calling `func()` is
+                scheduled on `refresh_executor`. `key.timeout` works as the hard
+                timeout. Defaults to `None` (no soft timeout).
+            cache_none (:obj:`bool`, optional): Overrides the instance `cache_none`
+                setting for this call.
+            negative_timeout (:obj:`int`, optional): Overrides the instance
+                `negative_timeout` setting for this call.
+            early_expiration_beta (:obj:`float`, optional): Enables probabilistic
+                early expiration (XFetch): how long `func()` takes is stored with
+                the value, and each hit recomputes it before `key.timeout` expires
+                with a probability that rises as the expiration approaches. `1.0`
+                is a good default, larger values recompute earlier. Spreads the
+                recomputations of keys expiring together without any locking.
+                Defaults to `None` (disabled).
+            ttl_jitter (:obj:`float`, optional): Shortens the timeout of each write
+                by a random fraction of up to `ttl_jitter` (e.g. `0.1`), so keys
+                written together expire at different times. Defaults to `None`.
+
+        Within a `request_scope` the values read and written are memoized, and
+        repeated calls for the same key don't query the cache backend.
         '''
-        value = None
+        set_options = {
+            'stale_ttl': stale_ttl,
+            'negative_timeout': negative_timeout,
+            'ttl_jitter': ttl_jitter,
+            'early_expiration': early_expiration_beta is not None,
+        }
+        cache_none = self._use_cache_none(cache_none, negative_timeout)
+        metrics = self.metrics
+        scope = current_scope()
         if not disable_cache:
-            value = self.get_from_cache(key, **cache_kwargs)
-            if value is None:
-                self.log("cache miss for key={}".format(key))
+            if scope is not None:
+                value = scope.get(self.cache_backend, key.key_str)
+                if value is not MISS and (value is not None or cache_none):
+                    self.log("request scope hit for key=%s", key)
+                    return value
+            hot = False
+            if self.hot_keys is not None:
+                hot = self.hot_keys.record(key.key_str)
+                if hot:
+                    value = self.hot_keys.pinned(key.key_str, MISS)
+                    if value is not MISS and (value is not None or cache_none):
+                        self.log("pinned hot key=%s", key)
+                        if metrics is not None:
+                            metrics.increment('hits', key.key_type)
+                            metrics.increment('hot_key_hits', key.key_type)
+                        return value
+            if metrics is None:
+                value, entry = self._lookup(key, cache_none, cache_kwargs)
             else:
-                self.log("cache hit for key={}".format(key))
-
-        if value is None:
+                value, entry = self._measure(
+                    'backend_get_seconds', 'backend_errors', key,
+                    self._lookup, key, cache_none, cache_kwargs)
+                metrics.increment('misses' if value is MISS else 'hits', key.key_type)
+            if value is MISS:
+                self.log("cache miss for key=%s", key)
+            else:
+                self.log("cache hit for key=%s", key)
+                if entry is not None:
+                    if early_expiration_beta is not None and entry.expires_early(
+                            early_expiration_beta):
+                        self.log("early expiration for key=%s", key)
+                        if metrics is not None:
+                            metrics.increment('early_expirations', key.key_type)
+                        return self._compute(
+                            key, func, disable_cache_overwrite, cache_kwargs, set_options)
+                    if entry.is_stale():
+                        self._schedule_refresh(key, func, cache_kwargs, set_options)
+                if scope is not None:
+                    scope.set(self.cache_backend, key.key_str, value)
+                if hot:
+                    self.hot_keys.pin(key.key_str, value)
+                return value
+
+        if single_flight is None:
+            single_flight = self.single_flight
+        if single_flight and not disable_cache:
+            value = self._get_single_flight(
+                key, func, disable_cache_overwrite, cache_kwargs, set_options, cache_none)
+            # The computation may have been led by another request's thread.
+            if scope is not None and not disable_cache_overwrite:
+                scope.set(self.cache_backend, key.key_str, value)
+            return value
+        return self._compute(
+            key, func, disable_cache_overwrite, cache_kwargs, set_options)
+
+    def _compute(self, key, func, disable_cache_overwrite, cache_kwargs, set_options):
+        call = current_call()
+        if call is not None:
+            func = functools.partial(call.measure, 'compute', func)
+        start = time.perf_counter()
+        if self.metrics is None:
             value = func()
-            if not disable_cache_overwrite:
-                self.set(key, value, **cache_kwargs)
+        else:
+            value = self._measure('compute_seconds', 'compute_errors', key, func)
+        if not disable_cache_overwrite:
+            kwargs = dict(cache_kwargs)
+            kwargs.update(set_options)
+            if kwargs.pop('early_expiration', False):
+                kwargs['delta'] = time.perf_counter() - start
+            self.set(key, value, **kwargs)
         return value
 
+    def _schedule_refresh(self, key, func, cache_kwargs, set_options):
+        if self.refresh_executor is None:
+            with self._refresh_executor_lock:
+                # Racing threads must share one executor to dedupe refreshes.
+                if self.refresh_executor is None:
+                    self.refresh_executor = RefreshExecutor()
+
+        def refresh():
+            self._compute(key, func, False, cache_kwargs, set_options)
+
+        if self.refresh_executor.submit(key.key_str, refresh):
+            self.log("stale key=%s, refresh scheduled", key)
+
+    def _get_single_flight(
+        self, key, func, disable_cache_overwrite, cache_kwargs, set_options, cache_none
+    ):
+        def lead():
+            # Another leader may have just finished, check before computing.
+            value, _ = self._lookup(key, cache_none, cache_kwargs)
+            if value is not MISS:
+                return value
+            if not self.single_flight_lock:
+                return self._compute(
+                    key, func, disable_cache_overwrite, cache_kwargs, set_options)
+            return self._compute_with_lock(
+                key, func, disable_cache_overwrite, cache_kwargs, set_options, cache_none)
+
+        try:
+            return self._flights.do(key.key_str, lead, self.single_flight_timeout)
+        except SingleFlightTimeout:
+            self.log("single flight wait timed out for key=%s", key)
+            return self._fallback(key, func)
+
+    def _compute_with_lock(
+        self, key, func, disable_cache_overwrite, cache_kwargs, set_options, cache_none
+    ):
+        lock_key = key.key_str + self.lock_suffix
+        # Bounded independently of key.timeout: a crashed holder must not block
+        # the other processes for the whole TTL of the key.
+        lock_timeout = self.single_flight_timeout or self.lock_timeout
+        deadline = time.time() + lock_timeout
+        # The lock is probed with add, never read with get: backends caching
+        # reads (see backend.TieredBackend) could keep serving a released lock.
+        # A later successful add means the holder released it without a value,
+        # so the computation is taken over.
+        while not self.cache_backend.add(lock_key, self.lock_value, timeout=lock_timeout):
+            if time.time() >= deadline:
+                raise SingleFlightTimeout(
+                    "timed out waiting for key={} computation".format(key)
+                )
+            self.log("waiting for another process to compute key=%s", key)
+            time.sleep(self.lock_poll_interval)
+            value, _ = self._lookup(key, cache_none, cache_kwargs)
+            if value is not MISS:
+                return value
+        try:
+            return self._compute(key, func, disable_cache_overwrite, cache_kwargs, set_options)
+        finally:
+            self.cache_backend.delete(lock_key)
+
+    def _fallback(self, key, func):
+        if self.single_flight_fallback is not None:
+            return self.single_flight_fallback(key)
+        return func()
+
+    def get_many_from_cache(self, keys, **cache_kwargs):
+        '''
+        Returns a list with the cached values for `keys` (`None` for keys not
+        cached), fetched with a single `cache_backend.get_many` call.
+        '''
+        found = self.cache_backend.get_many([key.key_str for key in keys], **cache_kwargs)
+        values = []
+        for key in keys:
+            value = self._decode(found.get(key.key_str))
+            if isinstance(value, CacheEntry):
+                value = value.value
+            values.append(value)
+        return values
+
+    def exists_many(self, keys, **cache_kwargs):
+        '''
+        Returns a list telling, for each key of `keys`, whether it is cached,
+        checked with a single `cache_backend.get_many` call.
+        '''
+        found = self.cache_backend.get_many([key.key_str for key in keys], **cache_kwargs)
+        return [key.key_str in found for key in keys]
+
+    def set_many(
+        self, items, stale_ttl=None, negative_timeout=None, ttl_jitter=None, delta=None,
+        **cache_kwargs
+    ):
+        '''
+        Sets many `(key, value)` pairs on cache. Keys are grouped by timeout and
+        each group is written with a single `cache_backend.set_many` call. The
+        options are the ones of `set`, but `ttl_jitter` draws one jitter per
+        timeout, so groups are not split.
+        '''
+        groups = {}
+        jittered = {}
+        scope = current_scope()
+
+        def jitter(timeout):
+            if timeout not in jittered:
+                jittered[timeout] = jitter_timeout(timeout, ttl_jitter)
+            return jittered[timeout]
+
+        for key, value in items:
+            if scope is not None:
+                scope.set(self.cache_backend, key.key_str, value)
+            if self.hot_keys is not None:
+                self.hot_keys.unpin(key.key_str)
+            timeout, value = self._prepare_write(
+                key, value, stale_ttl, negative_timeout, delta, jitter)
+            groups.setdefault(timeout, {})[key.key_str] = self._encode(value)
+        for timeout, mapping in groups.items():
+            self.log("set many keys=%s", list(mapping))
+            self.cache_backend.set_many(mapping, timeout=timeout, **cache_kwargs)
+
+    def get_many(
+        self, keys, func_for_missing, disable_cache=False, disable_cache_overwrite=False,
+        single_flight=None, stale_ttl=None, cache_none=None, negative_timeout=None,
+        early_expiration_beta=None, ttl_jitter=None, **cache_kwargs
+    ):
+        '''
+        Bulk version of `get`. Cached values are fetched in one backend operation and
+        the missing ones are computed by a single `func_for_missing` call and written
+        back in one backend operation (per timeout).
+
+        Args:
+            keys (list): the `BaseCacheKey` instances to be queried on cache.
+            func_for_missing (function): called with the list of keys not cached, must
+                return a list with their values, in the same order.
+            disable_cache (:obj:`bool`, optional): Defaults to `False`. If `True` the
+                cache backend is not queried and every value is computed.
+            disable_cache_overwrite (:obj:`bool`, optional): Defaults to `False`. If
+                `True` computed values are not written to cache.
+
+        The other options are the ones of `get`. Stale values are refreshed by
+        `func_for_missing` calls with a single key, values expiring early are
+        computed with the missing ones. Misses are not collapsed, so
+        `single_flight` is accepted only for compatibility.
+
+        Returns:
+            list: the values, in the same order as `keys`.
+        '''
+        set_options = {
+            'stale_ttl': stale_ttl,
+            'negative_timeout': negative_timeout,
+            'ttl_jitter': ttl_jitter,
+        }
+        keys = list(keys)
+        cache_none = self._use_cache_none(cache_none, negative_timeout)
+        if disable_cache:
+            values = [MISS] * len(keys)
+        else:
+            values = self._lookup_many(
+                keys, cache_none, early_expiration_beta, cache_kwargs, set_options,
+                func_for_missing)
+        missing = [i for i, value in enumerate(values) if value is MISS]
+        self.log("cache get many: %s hits, %s misses", len(keys) - len(missing), len(missing))
+        if self.metrics is not None and not disable_cache:
+            for i, value in enumerate(values):
+                self.metrics.increment('misses' if value is MISS else 'hits', keys[i].key_type)
+        if not missing:
+            return values
+
+        start = time.perf_counter()
+        computed = list(func_for_missing([keys[i] for i in missing]))
+        if len(computed) != len(missing):
+            raise ValueError(
+                "func_for_missing returned {} values for {} keys".format(
+                    len(computed), len(missing))
+            )
+        for i, value in zip(missing, computed):
+            values[i] = value
+        if not disable_cache_overwrite:
+            if early_expiration_beta is not None:
+                # What recomputing one key costs, roughly.
+                set_options['delta'] = (time.perf_counter() - start) / len(missing)
+            set_options.update(cache_kwargs)
+            self.set_many(
+                [(keys[i], value) for i, value in zip(missing, computed)], **set_options)
+        return values
+
+    def _lookup_many(
+        self, keys, cache_none, early_expiration_beta, cache_kwargs, set_options,
+        func_for_missing,
+    ):
+        '''
+        Returns the cached values for `keys`, `MISS` for the ones not cached
+        (see `_lookup`) or expiring early. Schedules the refresh of stale ones.
+        '''
+        found = self.cache_backend.get_many([key.key_str for key in keys], **cache_kwargs)
+        values = []
+        for key in keys:
+            value = self._decode(found.get(key.key_str, MISS))
+            if isinstance(value, CacheEntry):
+                entry = value
+                value = entry.value
+                if early_expiration_beta is not None and entry.expires_early(
+                        early_expiration_beta):
+                    self.log("early expiration for key=%s", key)
+                    if self.metrics is not None:
+                        self.metrics.increment('early_expirations', key.key_type)
+                    value = MISS
+                elif entry.is_stale():
+                    self._schedule_refresh(
+                        key, functools.partial(_refresh_one, func_for_missing, key),
+                        cache_kwargs, dict(set_options))
+            if value is None and not cache_none:
+                value = MISS
+            values.append(value)
+        return values
+
+    def flush_many(self, keys, **cache_kwargs):
+        '''
+        Flushes (deletes) many keys with a single `cache_backend.delete_many` call.
+        '''
+        self.log("flush many keys=%s", keys)
+        scope = current_scope()
+        for key in keys:
+            if scope is not None:
+                scope.discard(self.cache_backend, key.key_str)
+            if self.hot_keys is not None:
+                self.hot_keys.unpin(key.key_str)
+        return self.cache_backend.delete_many([key.key_str for key in keys], **cache_kwargs)
+
     def flush(self, key, **cache_kwargs):
         '''
         Flushes (deletes) the key from the cache backend. It is expected that `key` is a
         `BaseCacheKey` instance. Aditional cache kwargs will be forwarded to cache backend
         method `delete`.
         '''
-        self.log("flush key={}".format(key))
+        self.log("flush key=%s", key)
+        scope = current_scope()
+        if scope is not None:
+            scope.discard(self.cache_backend, key.key_str)
+        if self.hot_keys is not None:
+            self.hot_keys.unpin(key.key_str)
         return self.cache_backend.delete(key.key_str, **cache_kwargs)
 
-    def get_key(self, key_type, *args, **kwargs):
+    def request_scope(self):
         '''
-        Generates a ArgsCacheKey based on the key_type, args and kwargs. This method
-        may be overridden to better suits the use case needs.
-        Args:
-            key_type(`str`): The base key_type for ArgsCacheKey
-        *args and **kwargs will be forward to ArgsCacheKey initializer.
-
-        Returns:
-            ArgsCacheKey: the generated key
+        Returns a new `scope.RequestScope`, a context manager memoizing the
+        values read and written while it is active. Wrap each request in one,
+        e.g. in a web framework middleware.
         '''
-        timeout = kwargs.pop('timeout', self.default_timeout)
-        return ArgsCacheKey(
-            self.key_prefix + key_type, timeout=timeout, *args, **kwargs
-        )
+        return RequestScope()
@@ -0,0 +1,187 @@
+# Copyright (c) 2018, Globo.com (https://github.com/globocom)
+#
+# License: MIT
+
+import json
+import pickle
+import threading
+import zlib
+
+from .cache import CacheEntry
+
+__all__ = [
+    'BaseSerializer', 'PickleSerializer', 'JSONSerializer', 'MsgpackSerializer', 'Codec',
+]
+
+_MAGIC = b'\xc7'
+_HEADER_SIZE = 3
+_NO_COMPRESSION = 0
+_ZLIB = 1
+
+
+class BaseSerializer(object):
+    '''
+    Abstract class for value serializers. Every serializer has a unique one byte
+    `tag`, written in front of each payload so values can be decoded even after
+    the serializer in use changes.
+    '''
+
+    tag = None
+
+    def dumps(self, value):
+        raise NotImplementedError("Subclasses should implement this method")
+
+    def loads(self, data):
+        raise NotImplementedError("Subclasses should implement this method")
+
+
+class PickleSerializer(BaseSerializer):
+    tag = 1
+
+    def __init__(self, protocol=pickle.HIGHEST_PROTOCOL):
+        self.protocol = protocol
+
+    def dumps(self, value):
+        return pickle.dumps(value, self.protocol)
+
+    def loads(self, data):
+        return pickle.loads(data)
+
+
+def _json_default(obj):
+    if isinstance(obj, CacheEntry):
+        return {'__cache_entry__': obj.__getstate__()}
+    raise TypeError("{!r} is not JSON serializable".format(obj))
+
+
+def _json_object_hook(obj):
+    state = obj.get('__cache_entry__')
+    if state is not None and len(obj) == 1:
+        entry = CacheEntry.__new__(CacheEntry)
+        entry.__setstate__(state)
+        return entry
+    return obj
+
+
+class JSONSerializer(BaseSerializer):
+    '''
+    Serializes JSON compatible values (tuples come back as lists). Safer than
+    pickle when the cache is shared with untrusted parties.
+    '''
+    tag = 2
+
+    def dumps(self, value):
+        return json.dumps(value, separators=(',', ':'), default=_json_default).encode('utf-8')
+
+    def loads(self, data):
+        return json.loads(data.decode('utf-8'), object_hook=_json_object_hook)
+
+
+class MsgpackSerializer(BaseSerializer):
+    '''
+    Serializes values with msgpack, a compact binary JSON-like format. Requires
+    the `msgpack` package. Only msgpack compatible values (and `CacheEntry`
+    envelopes) are supported.
+    '''
+    tag = 3
+
+    def __init__(self):
+        try:
+            import msgpack
+        except ImportError:
+            raise ImportError("MsgpackSerializer requires the msgpack package")
+        self._msgpack = msgpack
+
+    def dumps(self, value):
+        return self._msgpack.packb(value, default=_json_default, use_bin_type=True)
+
+    def loads(self, data):
+        return self._msgpack.unpackb(data, object_hook=_json_object_hook, raw=False)
+
+
+class Codec(object):
+    '''
+    Serializes values before they are written to the cache backend, compressing
+    the ones bigger than `compress_threshold` bytes, and does the opposite after
+    they are read. Each payload starts with a small header tagging the serializer
+    and the compression used, so the codec configuration may change without
+    breaking the values already cached. Values read from the backend without the
+    header (e.g. written before the codec was enabled) are returned untouched.
+
+    Args:
+        serializer (:obj:`BaseSerializer`, optional): used to encode new values.
+            Defaults to `PickleSerializer()`.
+        compress_threshold (:obj:`int`, optional): serialized values bigger than
+            this are zlib compressed. `None` disables compression. Defaults to 1024.
+        compress_level (int): zlib compression level. Defaults to 6.
+        serializers (:obj:`list`, optional): other serializers accepted when
+            decoding, e.g. the previous one while switching serializers. Only
+            `serializer` and these are accepted: payloads tagged with another
+            serializer raise `ValueError`, so a JSON codec never unpickles.
+
+    Attributes:
+        encoded (int): number of encoded values.
+        compressed (int): number of encoded values that were compressed.
+        serialized_bytes (int): accumulated size of the serialized values.
+        stored_bytes (int): accumulated size of the encoded payloads.
+    '''
+
+    def __init__(
+        self, serializer=None, compress_threshold=1024, compress_level=6, serializers=None,
+    ):
+        self.serializer = serializer or PickleSerializer()
+        self.compress_threshold = compress_threshold
+        self.compress_level = compress_level
+        self._serializers = {}
+        for accepted in serializers or []:
+            self._serializers[accepted.tag] = accepted
+        self._serializers[self.serializer.tag] = self.serializer
+        self._lock = threading.Lock()
+        self.encoded = 0
+        self.compressed = 0
+        self.serialized_bytes = 0
+        self.stored_bytes = 0
+
+    def encode(self, value):
+        '''
+        Returns the payload for `value`. `len()` of it is the size stored on the
+        backend.
+        '''
+        data = self.serializer.dumps(value)
+        serialized_size = len(data)
+        compression = _NO_COMPRESSION
+        if self.compress_threshold is not None and serialized_size > self.compress_threshold:
+            compressed = zlib.compress(data, self.compress_level)
+            if len(compressed) < serialized_size:
+                data = compressed
+                compression = _ZLIB
+        payload = _MAGIC + bytes(bytearray([self.serializer.tag, compression])) + data
+        with self._lock:
+            self.encoded += 1
+            self.compressed += compression != _NO_COMPRESSION
+            self.serialized_bytes += serialized_size
+            self.stored_bytes += len(payload)
+        return payload
+
+    def decode(self, payload):
+        if not isinstance(payload, bytes) or payload[:1] != _MAGIC or len(payload) < _HEADER_SIZE:
+            return payload
+        tag, compression = bytearray(payload[1:_HEADER_SIZE])
+        serializer = self._serializers.get(tag)
+        if serializer is None:
+            raise ValueError("Serializer tag {} is not accepted".format(tag))
+        data = payload[_HEADER_SIZE:]
+        if compression == _ZLIB:
+            data = zlib.decompress(data)
+        elif compression != _NO_COMPRESSION:
+            raise ValueError("Unknown compression tag {}".format(compression))
+        return serializer.loads(data)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'encoded': self.encoded,
+                'compressed': self.compressed,
+                'serialized_bytes': self.serialized_bytes,
+                'stored_bytes': self.stored_bytes,
+            }
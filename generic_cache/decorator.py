@@ -3,21 +3,88 @@
 # License: MIT
 
 class CacheDecorator(object):
-    def __init__(self, key_prefix, cache_backend, key_builder, default_timeout=None):
+    '''
+    Decorator factory. Extra keyword arguments (e.g. `single_flight=True`) are
+    forwarded to the underlying `GenericCache`.
+
+    `cache_kwargs` given when decorating a function are forwarded to the cache
+    backend `get` and `set` calls, e.g. `cache_kwargs={'l1_timeout': 1}` for a
+    `backend.TieredBackend`.
+
+    Coroutine functions (`async def`) are detected and cached through an
+    `aio.AsyncGenericCache`, which gets the same extra keyword arguments.
+    `cache_backend` may then also be an `aio.AsyncBaseBackend`.
+
+    `namespace_generations` enables group invalidation (see `invalidate_key_type`
+    and `invalidate_instance`). Pass a `namespace.NamespaceGenerations`, or `True`
+    to keep the generations on `cache_backend`. Coroutine functions can't be
+    decorated with it enabled.
+
+    `early_expiration_beta` and `ttl_jitter`, given when decorating a function,
+    spread the recomputations of its keys expiring together (see
+    `GenericCache.get`).
+
+    Within a `request_scope` repeated calls with the same key are answered from
+    memory, without querying the cache backend.
+
+    `profiler` (a `profiling.Profiler`) reports how long a sample of the calls
+    spends building the key, reading from the backend, in the function and
+    writing its result. Coroutine functions are not profiled.
+    '''
+    def __init__(
+        self, key_prefix, cache_backend, key_builder, default_timeout=None,
+        namespace_generations=None, profiler=None, **generic_cache_kwargs
+    ):
         self._key_prefix = key_prefix
         self._cache_backend = cache_backend
         self._key_builder = key_builder
         self._default_timeout = default_timeout
+        if namespace_generations is True:
+            from inspect import iscoroutinefunction
+            from .namespace import NamespaceGenerations
+            if iscoroutinefunction(getattr(cache_backend, 'get', None)):
+                raise ValueError("namespace_generations can't be kept on asyncio backends")
+            namespace_generations = NamespaceGenerations(cache_backend)
+        self._namespace_generations = namespace_generations
+        self._profiler = profiler
+        self._generic_cache_kwargs = generic_cache_kwargs
         self._build_generic_cache()
 
-    def __call__(self, key_type, key_timeout=None, key_version=""):
+    def __call__(
+        self, key_type, key_timeout=None, key_version="", single_flight=None,
+        stale_ttl=None, negative_timeout=None, cache_kwargs=None, early_expiration_beta=None,
+        ttl_jitter=None,
+    ):
         if key_timeout == None:
             key_timeout = self._default_timeout
-        return self._build_decorator(key_type, key_timeout, key_version)
+        return self._build_decorator(
+            key_type, key_timeout, key_version, single_flight=single_flight,
+            stale_ttl=stale_ttl, negative_timeout=negative_timeout,
+            early_expiration_beta=early_expiration_beta, ttl_jitter=ttl_jitter,
+            **(cache_kwargs or {})
+        )
 
-    def _build_decorator(self, key_type, key_timeout, key_version):
+    def _build_decorator(self, key_type, key_timeout, key_version, **get_kwargs):
         from functools import wraps
+        from inspect import iscoroutinefunction
         def decorator(func):
+            build_key = self._compile_key(key_type, func, key_version)
+            if iscoroutinefunction(func):
+                from .aio import build_async_decorated
+                if self._namespace_generations is not None:
+                    # NamespaceGenerations would block the event loop on the backend.
+                    raise ValueError(
+                        "namespace_generations is not supported for coroutine functions")
+                # Built now so options it doesn't support fail at decoration.
+                self._get_async_generic_cache()
+                return build_async_decorated(
+                    self, func, build_key, key_type, key_timeout, key_version, get_kwargs
+                )
+            if iscoroutinefunction(getattr(self._cache_backend, 'get', None)):
+                raise ValueError("asyncio backends can only cache coroutine functions")
+            profiler = self._profiler
+            profiled_key_type = self._key_prefix + key_type
+
             @wraps(func)
             def decorated(*args, **kwargs):
                 disable_cache = kwargs.pop('disable_cache', False)
@@ -28,13 +95,28 @@ class CacheDecorator(object):
                 def call_original():
                     return func(*args, **kwargs)
 
-                key = self._build_key(key_type, func, *args, key_version=key_version, **kwargs)
-                key.timeout = key_timeout
-                return self._generic_cache.get(
-                    key, call_original, disable_cache=disable_cache,
-                    disable_cache_overwrite=disable_cache_overwrite
-                )
-            decorated.cache = CacheHandler(func, self, key_type, key_version)
+                call = None if profiler is None else profiler.sample(profiled_key_type)
+                if call is None:
+                    key = build_key(*args, **kwargs)
+                    key.timeout = key_timeout
+                    return self._generic_cache.get(
+                        key, call_original, disable_cache=disable_cache,
+                        disable_cache_overwrite=disable_cache_overwrite, **get_kwargs
+                    )
+                with call:
+                    def build():
+                        key = build_key(*args, **kwargs)
+                        # Most keys build their string lazily, it's key building too.
+                        call.key = key.key_str
+                        return key
+                    key = call.measure('build_key', build)
+                    key.timeout = key_timeout
+                    return self._generic_cache.get(
+                        key, call_original, disable_cache=disable_cache,
+                        disable_cache_overwrite=disable_cache_overwrite, **get_kwargs
+                    )
+            decorated.cache = CacheHandler(
+                func, self, key_type, key_version, key_timeout, get_kwargs)
             return decorated
         return decorator
 
@@ -43,28 +125,243 @@ class CacheDecorator(object):
         self._generic_cache = GenericCache(
             self._cache_backend,
             self._default_timeout,
-            key_prefix=self._key_prefix
+            key_prefix=self._key_prefix,
+            **self._generic_cache_kwargs
         )
 
+    def _get_async_generic_cache(self):
+        '''
+        Returns the `aio.AsyncGenericCache` used for coroutine functions, sharing
+        this decorator backend. Built on first use.
+        '''
+        if getattr(self, '_async_generic_cache', None) is None:
+            from .aio import AsyncGenericCache
+            self._async_generic_cache = AsyncGenericCache(
+                self._cache_backend,
+                self._default_timeout,
+                key_prefix=self._key_prefix,
+                **self._generic_cache_kwargs
+            )
+        return self._async_generic_cache
+
+    def request_scope(self):
+        '''
+        Returns a new `scope.RequestScope` (see `GenericCache.request_scope`).
+        '''
+        return self._generic_cache.request_scope()
+
+    def _compile_key(self, key_type, original_func, key_version):
+        '''
+        Returns the function used to build the keys of `original_func` calls. Key
+        builders can precompute most of the work once here (see
+        `key_builder.KeyPlan`), others get their `build_key` called on each call.
+        '''
+        key_prefix = self._key_prefix + key_type
+        compile_key = getattr(self._key_builder, 'compile', None)
+        if compile_key is None:
+            def build_key(*func_args, **func_kwargs):
+                return self._build_key(
+                    key_type, original_func, *func_args, key_version=key_version, **func_kwargs
+                )
+            return build_key
+
+        build_key = compile_key(key_prefix, original_func, key_version)
+        if self._namespace_generations is None:
+            return build_key
+
+        def build_namespaced_key(*func_args, **func_kwargs):
+            return self._namespace_key(key_type, build_key(*func_args, **func_kwargs), func_args)
+        return build_namespaced_key
+
     def _build_key(self, key_type, original_func, *func_args, **func_kwargs):
         key_prefix = self._key_prefix + key_type
-        return self._key_builder.build_key(key_prefix, original_func, *func_args, **func_kwargs)
+        key = self._key_builder.build_key(key_prefix, original_func, *func_args, **func_kwargs)
+        if self._namespace_generations is None:
+            return key
+        return self._namespace_key(key_type, key, func_args)
+
+    def _namespace_key(self, key_type, key, func_args):
+        from .namespace import NamespacedCacheKey
+        namespaces = [self._key_prefix + key_type]
+        get_namespaces = getattr(self._key_builder, 'get_namespaces', None)
+        if get_namespaces is not None:
+            namespaces.extend(get_namespaces(self._key_prefix, func_args))
+        return NamespacedCacheKey(key, self._namespace_generations.get_many(namespaces))
+
+    def _get_namespace_generations(self):
+        if self._namespace_generations is None:
+            raise ValueError("namespace_generations is not enabled")
+        return self._namespace_generations
+
+    def invalidate_key_type(self, key_type):
+        '''
+        Invalidates every cached result of the functions decorated with
+        `key_type`, with a single backend write.
+        '''
+        return self._get_namespace_generations().bump(self._key_prefix + key_type)
+
+    def invalidate_instance(self, instance):
+        '''
+        Invalidates every cached result of the methods of `instance` decorated by
+        this decorator, with a single backend write. Requires a key builder with
+        instance namespaces, like `key_builder.AttrsMethodKeyBuilder`.
+        '''
+        generations = self._get_namespace_generations()
+        get_instance_namespace = getattr(self._key_builder, 'get_instance_namespace', None)
+        if get_instance_namespace is None:
+            raise ValueError("{} has no instance namespaces".format(
+                type(self._key_builder).__name__))
+        return generations.bump(get_instance_namespace(self._key_prefix, instance))
+
+
+class WarmReport(object):
+    '''
+    Progress of a `CacheHandler.warm` call.
+
+    Attributes:
+        total (int): argument sets seen so far.
+        skipped (int): argument sets whose result was already cached.
+        computed (int): results computed and cached.
+        failed (int): argument sets whose key building or computation raised.
+        failures (list): `(args, exception)` pairs of the failed argument sets.
+        elapsed (float): seconds since the warm up started.
+    '''
+
+    def __init__(self):
+        self.total = 0
+        self.skipped = 0
+        self.computed = 0
+        self.failed = 0
+        self.failures = []
+        self.elapsed = 0
+
+    @property
+    def done(self):
+        return self.skipped + self.computed + self.failed
+
+    def __repr__(self):
+        return "<WarmReport total={} skipped={} computed={} failed={} elapsed={:.3f}s>".format(
+            self.total, self.skipped, self.computed, self.failed, self.elapsed)
 
 
 class CacheHandler(object):
-    def __init__(self, func, decorator_factory, key_type, key_version):
+    def __init__(
+        self, func, decorator_factory, key_type, key_version, key_timeout=None, get_kwargs=None,
+    ):
         self.func = func
         self.decorator_factory = decorator_factory
         self.key_version = key_version
         self.key_type = key_type
-    
+        self.key_timeout = key_timeout
+        self.get_kwargs = get_kwargs or {}
+
+    def _build_key(self, *args, **kwargs):
+        key = self.decorator_factory._build_key(
+            self.key_type, self.func, *args, key_version=self.key_version, **kwargs
+        )
+        key.timeout = self.key_timeout
+        return key
+
     def _call_cache(self, method, *args, **kwargs):
-        key = self.decorator_factory._build_key(self.key_type, self.func, *args, **kwargs)
+        key = self._build_key(*args, **kwargs)
         method = getattr(self.decorator_factory._generic_cache, method)
         return method(key)
-    
+
     def get(self, *args, **kwargs):
         return self._call_cache("get_from_cache", *args, **kwargs)
-    
+
     def flush(self, *args, **kwargs):
         return self._call_cache("flush", *args, **kwargs)
+
+    def invalidate_all(self):
+        '''
+        Invalidates every cached result of the decorated function. Requires
+        `namespace_generations` on the decorator.
+        '''
+        return self.decorator_factory.invalidate_key_type(self.key_type)
+
+    def get_many(self, args_list):
+        '''
+        Returns the results of calling the decorated function with each args tuple
+        of `args_list`, in order. Cached results are fetched with a single backend
+        operation, the missing ones are computed and then written with a single
+        backend operation.
+        '''
+        args_list = [tuple(args) for args in args_list]
+        keys = [self._build_key(*args) for args in args_list]
+        args_by_key = dict((id(key), args) for key, args in zip(keys, args_list))
+
+        def compute_missing(missing_keys):
+            return [self.func(*args_by_key[id(key)]) for key in missing_keys]
+
+        return self.decorator_factory._generic_cache.get_many(
+            keys, compute_missing, **self.get_kwargs)
+
+    def warm(self, args_list, concurrency=4, batch_size=100, force=False, progress=None):
+        '''
+        Computes and caches the results of calling the decorated function with
+        each args tuple of `args_list` (any iterable, consumed `batch_size` at a
+        time), on `concurrency` threads. Results already cached are skipped,
+        checked with one backend operation per batch, unless `force` is `True`.
+
+        Failures don't stop the warm up, they are collected in the returned
+        `WarmReport`. `progress`, if given, is called with the report after each
+        batch.
+        '''
+        import threading
+        import time
+        from concurrent.futures import ThreadPoolExecutor, wait
+        from itertools import islice
+
+        generic_cache = self.decorator_factory._generic_cache
+        report = WarmReport()
+        lock = threading.Lock()
+        start = time.time()
+
+        def fail(args, error):
+            with lock:
+                report.failed += 1
+                report.failures.append((args, error))
+
+        def compute(key, args):
+            try:
+                generic_cache.get(
+                    key, lambda: self.func(*args), disable_cache=True, **self.get_kwargs)
+            except Exception as error:
+                fail(args, error)
+            else:
+                with lock:
+                    report.computed += 1
+
+        iterator = iter(args_list)
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            while True:
+                chunk = [tuple(args) for args in islice(iterator, batch_size)]
+                if not chunk:
+                    break
+                report.total += len(chunk)
+                batch = []
+                for args in chunk:
+                    try:
+                        batch.append((self._build_key(*args), args))
+                    except Exception as error:
+                        fail(args, error)
+                if force:
+                    cached = [False] * len(batch)
+                else:
+                    cached = generic_cache.exists_many([key for key, _ in batch])
+                futures = []
+                for (key, args), is_cached in zip(batch, cached):
+                    if is_cached:
+                        report.skipped += 1
+                    else:
+                        futures.append(executor.submit(compute, key, args))
+                wait(futures)
+                report.elapsed = time.time() - start
+                if progress is not None:
+                    progress(report)
+        return report
+
+    def flush_many(self, args_list):
+        keys = [self._build_key(*args) for args in args_list]
+        return self.decorator_factory._generic_cache.flush_many(keys)
@@ -0,0 +1,184 @@
+# Copyright (c) 2018, Globo.com (https://github.com/globocom)
+#
+# License: MIT
+
+from collections import OrderedDict
+from .sketch import CountMinSketch
+
+__all__ = [
+    'BaseEvictionPolicy', 'LRUPolicy', 'LFUPolicy', 'TinyLFUPolicy', 'get_policy',
+]
+
+
+class BaseEvictionPolicy(object):
+    '''
+    Abstract class for the eviction policies used by bounded in memory backends.
+    The backend notifies the policy about every insert, access and removal of keys
+    and asks it for a victim when it runs out of room. Every method is expected
+    to be O(1).
+    '''
+
+    def record_insert(self, key):
+        raise NotImplementedError("Subclasses should implement this method")
+
+    def record_access(self, key):
+        raise NotImplementedError("Subclasses should implement this method")
+
+    def record_remove(self, key):
+        raise NotImplementedError("Subclasses should implement this method")
+
+    def victim(self):
+        '''
+        Returns the key that should be evicted next, or `None` if there is none.
+        '''
+        raise NotImplementedError("Subclasses should implement this method")
+
+    def admit(self, candidate, victim):
+        '''
+        Returns `True` if `candidate` is worth evicting `victim` for. Policies
+        without an admission filter always admit.
+        '''
+        return True
+
+    def clear(self):
+        raise NotImplementedError("Subclasses should implement this method")
+
+
+class LRUPolicy(BaseEvictionPolicy):
+    '''
+    Evicts the least recently used key.
+    '''
+
+    def __init__(self):
+        self._order = OrderedDict()
+
+    def record_insert(self, key):
+        self._order[key] = None
+
+    def record_access(self, key):
+        self._order.move_to_end(key)
+
+    def record_remove(self, key):
+        self._order.pop(key, None)
+
+    def victim(self):
+        return next(iter(self._order), None)
+
+    def clear(self):
+        self._order.clear()
+
+
+class LFUPolicy(BaseEvictionPolicy):
+    '''
+    Evicts the least frequently used key, breaking ties by least recent use.
+    Keys are kept in one bucket per access count, so every operation is O(1).
+    '''
+
+    def __init__(self):
+        self._freqs = {}
+        self._buckets = {}
+        self._min_freq = 0
+
+    def _bucket(self, freq):
+        bucket = self._buckets.get(freq)
+        if bucket is None:
+            bucket = self._buckets[freq] = OrderedDict()
+        return bucket
+
+    def _discard(self, key, freq):
+        bucket = self._buckets[freq]
+        del bucket[key]
+        if not bucket:
+            del self._buckets[freq]
+
+    def record_insert(self, key):
+        self._freqs[key] = 1
+        self._bucket(1)[key] = None
+        self._min_freq = 1
+
+    def record_access(self, key):
+        freq = self._freqs[key]
+        self._discard(key, freq)
+        if self._min_freq == freq and freq not in self._buckets:
+            self._min_freq = freq + 1
+        self._freqs[key] = freq + 1
+        self._bucket(freq + 1)[key] = None
+
+    def record_remove(self, key):
+        freq = self._freqs.pop(key, None)
+        if freq is not None:
+            self._discard(key, freq)
+
+    def victim(self):
+        if not self._buckets:
+            return None
+        if self._min_freq not in self._buckets:
+            # Only happens after arbitrary removals (deletes or expirations).
+            self._min_freq = min(self._buckets)
+        return next(iter(self._buckets[self._min_freq]))
+
+    def clear(self):
+        self._freqs.clear()
+        self._buckets.clear()
+        self._min_freq = 0
+
+
+class TinyLFUPolicy(LRUPolicy):
+    '''
+    LRU eviction guarded by a TinyLFU admission filter: a new key is only admitted
+    if it was requested more often than the key that would be evicted for it.
+    Request frequencies are estimated by an aging `CountMinSketch`, so one hit
+    wonders can't flush popular keys out of the cache.
+
+    Args:
+        sketch_width (int): width of the frequency sketch. A good value is a few
+            times the expected number of cached entries.
+    '''
+
+    def __init__(self, sketch_width=4096):
+        super(TinyLFUPolicy, self).__init__()
+        self.sketch = CountMinSketch(width=sketch_width)
+
+    def record_insert(self, key):
+        super(TinyLFUPolicy, self).record_insert(key)
+        self.sketch.add(key)
+
+    def record_access(self, key):
+        super(TinyLFUPolicy, self).record_access(key)
+        self.sketch.add(key)
+
+    def record_rejection(self, key):
+        # Rejected writes still count as requests, so a key that keeps coming
+        # back eventually earns its place in the cache.
+        self.sketch.add(key)
+
+    def admit(self, candidate, victim):
+        return self.sketch.estimate(candidate) >= self.sketch.estimate(victim)
+
+    def clear(self):
+        super(TinyLFUPolicy, self).clear()
+        self.sketch.clear()
+
+
+_POLICIES = {
+    'lru': LRUPolicy,
+    'lfu': LFUPolicy,
+    'tinylfu': TinyLFUPolicy,
+}
+
+
+def get_policy(policy):
+    '''
+    Returns an eviction policy instance. `policy` may be one of `'lru'`, `'lfu'`,
+    `'tinylfu'` or an already built `BaseEvictionPolicy` instance.
+    '''
+    if isinstance(policy, BaseEvictionPolicy):
+        return policy
+    try:
+        return _POLICIES[policy]()
+    except KeyError:
+        raise ValueError(
+            "Unknown eviction policy {!r}. Choose one of {}".format(
+                policy, ", ".join(sorted(_POLICIES))
+            )
+        )
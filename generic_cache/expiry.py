@@ -0,0 +1,90 @@
+# Copyright (c) 2018, Globo.com (https://github.com/globocom)
+#
+# License: MIT
+
+import heapq
+import itertools
+import threading
+import time
+import weakref
+
+__all__ = [
+    'monotonic', 'ExpiryQueue', 'Sweeper',
+]
+
+monotonic = getattr(time, 'monotonic', time.time)
+
+
+class ExpiryQueue(object):
+    '''
+    A min heap of `(deadline, key)` pairs used to find expired keys without
+    scanning the whole cache. Pairs with the same deadline are ordered by
+    insertion, so keys never need to be comparable. Entries are never removed
+    from the middle of the heap: when a key is overwritten or deleted its old
+    pair simply stays there and must be ignored by the caller when popped (the
+    deadline won't match the one currently stored for the key).
+    '''
+
+    def __init__(self):
+        self._heap = []
+        self._sequence = itertools.count()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def push(self, deadline, key):
+        heapq.heappush(self._heap, (deadline, next(self._sequence), key))
+
+    def pop_expired(self, now, limit=None):
+        '''
+        Pops and yields `(deadline, key)` pairs whose deadline is not after `now`,
+        at most `limit` of them (all of them if `limit` is `None`).
+        '''
+        heap = self._heap
+        popped = 0
+        while heap and heap[0][0] <= now and (limit is None or popped < limit):
+            popped += 1
+            deadline, _, key = heapq.heappop(heap)
+            yield deadline, key
+
+    def rebuild(self, deadlines):
+        '''
+        Rebuilds the heap from a `{key: deadline}` mapping, dropping every stale
+        pair. Used to keep the heap from growing when keys are rewritten often.
+        '''
+        sequence = self._sequence
+        self._heap = [
+            (deadline, next(sequence), key) for key, deadline in deadlines.items()]
+        heapq.heapify(self._heap)
+
+    def clear(self):
+        self._heap = []
+
+
+class Sweeper(object):
+    '''
+    Background daemon thread calling `method()` every `interval` seconds. Only a
+    weak reference to the method owner is kept, so the sweeper stops by itself
+    when the owner is garbage collected.
+    '''
+
+    def __init__(self, method, interval):
+        self.interval = interval
+        self._method = weakref.WeakMethod(method)
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='generic_cache-sweeper')
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            method = self._method()
+            if method is None:
+                return
+            method()
+            del method
@@ -0,0 +1,243 @@
+# Copyright (c) 2018, Globo.com (https://github.com/globocom)
+#
+# License: MIT
+
+import logging
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from .backend import BaseBackend
+
+__all__ = [
+    'CircuitBreaker', 'GuardedBackend',
+]
+
+
+class CircuitBreaker(object):
+    '''
+    Circuit breaker: after `failure_threshold` consecutive failures it opens
+    and rejects every call for `reset_timeout` seconds. It then turns half open
+    and lets a single probe call through: a success closes it again, a failure
+    opens it for another `reset_timeout`.
+
+    Args:
+        failure_threshold (int): consecutive failures that open the breaker.
+            Defaults to 5.
+        reset_timeout (float): seconds the breaker stays open before probing.
+            Defaults to 30.
+        on_change (:obj:`function`, optional): called with the old and the new
+            state on every transition.
+        clock (function): returns the current time, in seconds. Defaults to
+            `time.monotonic`.
+
+    Attributes:
+        state (str): `'closed'`, `'open'` or `'half_open'`.
+        failures (int): consecutive failures.
+    '''
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30, on_change=None, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.on_change = on_change
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def _set_state(self, state):
+        # Must hold the lock.
+        previous, self.state = self.state, state
+        if previous != state and self.on_change is not None:
+            self.on_change(previous, state)
+
+    def allow(self):
+        '''
+        Returns whether a call may go through.
+        '''
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if self.clock() < self._opened_at + self.reset_timeout:
+                    return False
+                self._set_state(self.HALF_OPEN)
+                self._probing = False
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._probing = False
+            self._set_state(self.CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self._opened_at = self.clock()
+                self._set_state(self.OPEN)
+
+
+class GuardedBackend(BaseBackend):
+    '''
+    Wraps a backend so that a degraded backend can't make caching slower than
+    not caching at all. Every call gets a latency budget: calls taking longer,
+    or raising, are failures, and the call returns as a miss (writes are
+    dropped). Repeated failures open a `CircuitBreaker`, and while it is open
+    calls don't reach the backend at all: reads are misses, so `GenericCache`
+    goes straight to `func()`. After `reset_timeout` seconds one probe call
+    checks whether the backend recovered.
+
+    The budget is enforced by running the calls on a thread pool of
+    `max_workers` threads. Timed out calls can't be interrupted, they go on in
+    the background while the caller moves on.
+
+    While the breaker is open `add` returns `True`, so callers holding locks
+    through it (e.g. `single_flight_lock`) compute the value instead of waiting.
+    Deletes are dropped too, so values flushed during an outage may be served
+    again once the backend recovers, until they expire.
+
+    Args:
+        backend (BaseBackend): the guarded backend.
+        budget (:obj:`float`, optional): seconds a call may take. Defaults to
+            `None`: calls run on the caller's thread and only errors count as
+            failures.
+        failure_threshold (int): consecutive failures opening the breaker.
+            Defaults to 5.
+        reset_timeout (float): seconds before probing an open breaker. Defaults
+            to 30.
+        max_workers (int): threads running the budgeted calls. Defaults to 8.
+        metrics (:obj:`metrics.BaseMetricsSink`, optional): receives the
+            `guard_timeouts`, `guard_errors` and `guard_bypassed` counters and
+            one `breaker_<state>` counter per breaker transition, labeled with
+            `name`.
+        name (str): label of the metrics and logs. Defaults to `'backend'`.
+        clock (function): clock of the breaker. Defaults to `time.monotonic`.
+
+    Attributes:
+        breaker (CircuitBreaker): the circuit breaker.
+        timeouts (int): calls that exceeded the budget.
+        errors (int): calls that raised an exception.
+        bypassed (int): calls rejected by the open breaker.
+    '''
+
+    def __init__(
+        self, backend, budget=None, failure_threshold=5, reset_timeout=30, max_workers=8,
+        metrics=None, name='backend', clock=time.monotonic,
+    ):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.backend = backend
+        self.budget = budget
+        self.max_workers = max_workers
+        self.metrics = metrics
+        self.name = name
+        self.breaker = CircuitBreaker(
+            failure_threshold, reset_timeout, on_change=self._on_change, clock=clock)
+        self.timeouts = 0
+        self.errors = 0
+        self.bypassed = 0
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def in_process(self):
+        return getattr(self.backend, 'in_process', False)
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                from concurrent.futures import ThreadPoolExecutor
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix='GuardedBackend')
+            return self._executor
+
+    def _on_change(self, previous, state):
+        self.logger.warning("%s circuit breaker %s -> %s", self.name, previous, state)
+        self._increment('breaker_' + state)
+
+    def _increment(self, name):
+        if self.metrics is not None:
+            self.metrics.increment(name, self.name)
+
+    def _call(self, fallback, method, *args, **kwargs):
+        '''
+        Calls `method(*args, **kwargs)` within the budget, returning `fallback`
+        if the breaker is open or the call fails.
+        '''
+        if not self.breaker.allow():
+            self.bypassed += 1
+            self._increment('guard_bypassed')
+            return fallback
+        try:
+            if self.budget is None:
+                result = method(*args, **kwargs)
+            else:
+                future = self._get_executor().submit(method, *args, **kwargs)
+                try:
+                    result = future.result(timeout=self.budget)
+                except FutureTimeout:
+                    future.cancel()
+                    self.timeouts += 1
+                    self._increment('guard_timeouts')
+                    self.breaker.record_failure()
+                    return fallback
+        except Exception:
+            self.logger.warning("%s call failed", self.name, exc_info=True)
+            self.errors += 1
+            self._increment('guard_errors')
+            self.breaker.record_failure()
+            return fallback
+        self.breaker.record_success()
+        return result
+
+    def get(self, key, default=None, **kwargs):
+        if default is not None:
+            kwargs['default'] = default
+        return self._call(default, self.backend.get, key, **kwargs)
+
+    def set(self, key, value, timeout=None, **kwargs):
+        self._call(None, self.backend.set, key, value, timeout=timeout, **kwargs)
+
+    def delete(self, key, **kwargs):
+        self._call(None, self.backend.delete, key, **kwargs)
+
+    def add(self, key, value, timeout=None, **kwargs):
+        return self._call(True, self.backend.add, key, value, timeout=timeout, **kwargs)
+
+    def get_many(self, keys, **kwargs):
+        return self._call({}, self.backend.get_many, list(keys), **kwargs)
+
+    def set_many(self, mapping, timeout=None, **kwargs):
+        self._call(None, self.backend.set_many, mapping, timeout=timeout, **kwargs)
+
+    def delete_many(self, keys, **kwargs):
+        self._call(None, self.backend.delete_many, list(keys), **kwargs)
+
+    def stats(self):
+        return {
+            'state': self.breaker.state,
+            'failures': self.breaker.failures,
+            'timeouts': self.timeouts,
+            'errors': self.errors,
+            'bypassed': self.bypassed,
+        }
+
+    def close(self):
+        '''
+        Stops the thread pool, without waiting for calls still running.
+        '''
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
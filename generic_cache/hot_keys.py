@@ -0,0 +1,149 @@
+# Copyright (c) 2018, Globo.com (https://github.com/globocom)
+#
+# License: MIT
+
+import threading
+
+from .backend import InMemoryCache
+from .sketch import CountMinSketch
+
+__all__ = [
+    'HotKeyDetector',
+]
+
+
+class HotKeyDetector(object):
+    '''
+    Finds the hottest keys of a stream of reads with bounded memory: an aging
+    `CountMinSketch` estimates how often every key is read, and the `capacity`
+    keys with the highest estimates are tracked as the top keys (replacing the
+    least read one when a key overtakes it). Counts are halved every
+    `sample_size` reads, so the top follows recent traffic.
+
+    Pass it as `hot_keys` to `GenericCache` (or `CacheDecorator`), which records
+    every read. With `pin_timeout` the values of hot keys are also pinned in a
+    small in process replica for `pin_timeout` seconds, taking their load off
+    the cache backend node holding them. Writes and flushes from the process
+    unpin the key, but values changed by other processes may be served for up
+    to `pin_timeout` seconds.
+
+    Args:
+        capacity (int): number of top keys tracked, and size of the replica.
+            Defaults to 100.
+        min_count (int): estimated reads within the aging window for a top key
+            to be hot. Defaults to 50.
+        width (int): counters per row of the sketch. Defaults to 4096.
+        depth (int): rows of the sketch. Defaults to 4.
+        sample_size (:obj:`int`, optional): reads between agings. Defaults to
+            `10 * width`.
+        pin_timeout (:obj:`float`, optional): seconds hot values are pinned.
+            Defaults to `None` (no pinning).
+
+    Attributes:
+        replica (InMemoryCache): the in process replica, if `pin_timeout` is
+            given.
+    '''
+
+    def __init__(
+        self, capacity=100, min_count=50, width=4096, depth=4, sample_size=None,
+        pin_timeout=None,
+    ):
+        self.capacity = capacity
+        self.min_count = min_count
+        self.pin_timeout = pin_timeout
+        self.sketch = CountMinSketch(width=width, depth=depth, sample_size=sample_size)
+        self.replica = None
+        if pin_timeout is not None:
+            self.replica = InMemoryCache(max_entries=capacity)
+        self._top = {}
+        self._min_key = None
+        self._ages = 0
+        self._lock = threading.Lock()
+
+    def record(self, key):
+        '''
+        Counts a read of `key` and returns whether it is hot.
+        '''
+        with self._lock:
+            sketch = self.sketch
+            estimate = sketch.add(key)
+            if sketch.ages != self._ages:
+                self._age_top()
+                estimate = sketch.estimate(key)
+            top = self._top
+            if key in top:
+                top[key] = estimate
+                if key == self._min_key:
+                    self._min_key = None
+            elif len(top) < self.capacity:
+                top[key] = estimate
+                self._min_key = None
+            else:
+                if self._min_key is None:
+                    self._min_key = min(top, key=top.get)
+                if estimate <= top[self._min_key]:
+                    return False
+                del top[self._min_key]
+                top[key] = estimate
+                self._min_key = None
+            return estimate >= self.min_count
+
+    def _age_top(self):
+        # Must hold the lock. Halving keeps the order, so the min key stays.
+        self._ages = self.sketch.ages
+        for key in self._top:
+            self._top[key] >>= 1
+
+    def is_hot(self, key):
+        return self._top.get(key, 0) >= self.min_count
+
+    def top(self, n=None):
+        '''
+        Returns up to `n` (all tracked by default) `(key, estimated reads)`
+        pairs, the hottest first.
+        '''
+        with self._lock:
+            items = sorted(self._top.items(), key=lambda item: -item[1])
+        return items if n is None else items[:n]
+
+    def hot_keys(self):
+        '''
+        Returns the hot keys, the hottest first.
+        '''
+        return [key for key, count in self.top() if count >= self.min_count]
+
+    def pinned(self, key, default=None):
+        '''
+        Returns the value pinned for `key`, or `default`.
+        '''
+        if self.replica is None:
+            return default
+        return self.replica.get(key, default)
+
+    def pin(self, key, value):
+        if self.replica is not None:
+            self.replica.set(key, value, timeout=self.pin_timeout)
+
+    def unpin(self, key):
+        if self.replica is not None:
+            self.replica.delete(key)
+
+    def report(self, n=10):
+        '''
+        Returns a dict with the `n` hottest keys, how many keys are hot and
+        pinned, and the replica stats.
+        '''
+        return {
+            'top': self.top(n),
+            'hot': len(self.hot_keys()),
+            'pinned': len(self.replica) if self.replica is not None else 0,
+            'replica': self.replica.stats() if self.replica is not None else None,
+        }
+
+    def clear(self):
+        with self._lock:
+            self.sketch.clear()
+            self._top.clear()
+            self._min_key = None
+        if self.replica is not None:
+            self.replica = InMemoryCache(max_entries=self.capacity)
@@ -2,7 +2,9 @@
 #
 # License: MIT
 
-import logging
+import inspect
+import weakref
+from operator import attrgetter
 
 
 class BaseCacheKey(object):
@@ -27,6 +29,31 @@ class BaseCacheKey(object):
         return self.key_str
 
 
+_ARG_NAMES = weakref.WeakKeyDictionary()
+
+
+def _get_arg_names(method):
+    '''
+    Returns the names of `method` positional arguments, computed once per function.
+    Bound methods share the cache entry of their function (`self` included).
+    '''
+    func = getattr(method, '__func__', method)
+    try:
+        return _ARG_NAMES[func]
+    except (KeyError, TypeError):
+        pass
+    getargspec = getattr(inspect, 'getfullargspec', None) or inspect.getargspec
+    args_spec = getargspec(method)
+    if args_spec.varargs is not None:
+        raise ValueError("method must not have vargargs on its signature")
+    arg_names = tuple(args_spec.args)
+    try:
+        _ARG_NAMES[func] = arg_names
+    except TypeError:
+        pass
+    return arg_names
+
+
 def _get_func_kwargs(method, *args, **kwargs):
     '''
     Normalizes a method call args to kwargs.
@@ -52,17 +79,13 @@ def _get_func_kwargs(method, *args, **kwargs):
     ... get_method_kwargs(instancemethod, (1, 2), {'c': 3})
     {'a': 1, 'b': 2, 'c': 3}
     '''
-    import inspect
-    from copy import copy
     from collections import OrderedDict
-    
-    normalized_kwargs = OrderedDict()
-    args_spec = inspect.getargspec(method)
-    if args_spec.varargs is not None:
-        raise ValueError("method must not have vargargs on its signature")
 
-    for i, arg in enumerate(args):
-        normalized_kwargs[args_spec.args[i]] = arg
+    arg_names = _get_arg_names(method)
+    if len(args) > len(arg_names):
+        raise TypeError("{} takes {} positional arguments but {} were given".format(
+            method.__name__, len(arg_names), len(args)))
+    normalized_kwargs = OrderedDict(zip(arg_names, args))
     normalized_kwargs.update(kwargs)
     return normalized_kwargs
 
@@ -72,8 +95,15 @@ class ArgsCacheKey(BaseCacheKey):
     Transforms args and kwargs on a key string. Useful for caching functions called
     with different values for args and/or kwargs. The timeout kwarg is reserved.
     See `key_str` docs for more information.
+
+    Attributes:
+        key_encoder (BaseKeyEncoder): set by key builders to encode the key
+            instead of the default format. Not a keyword argument, so functions
+            may have a `key_encoder` argument.
     '''
 
+    key_encoder = None
+
     def __init__(self, key_type, *args, **kwargs):
         timeout = kwargs.pop('timeout', None)
         key_version = kwargs.pop('key_version', "")
@@ -102,7 +132,13 @@ class ArgsCacheKey(BaseCacheKey):
         'myfunc__1__2__3__alpha_first_key_hey__some_kw_key_test'
         Not as the expected
         'othertype__1__2__3__alpha_first_key_hey__some_kw_key_test'
+
+        If the key has a `key_encoder` (see `key_encoder.HashedKeyEncoder`), it is
+        used instead.
         '''
+        if self._key_str is None and self.key_encoder is not None:
+            self._key_str = self.key_encoder.encode(
+                self.key_type, self.version, self.args, self.kwargs)
         if self._key_str is None:
             base_key = str(self.key_type)
             args_str = "__".join(str(a) for a in self.args)
@@ -117,18 +153,121 @@ class ArgsCacheKey(BaseCacheKey):
         return self._key_str
 
 
+class KeyPlan(object):
+    '''
+    A key building plan compiled once per decorated function: argument names, the
+    position of `self` and the instance attribute getters are resolved at
+    decoration time, so each call only maps its arguments and formats the key
+    string. Calling the plan returns the same `ArgsCacheKey` the key builder
+    `build_key` would, with `key_str` already computed.
+    '''
+
+    def __init__(
+        self, key_prefix, func, key_version="", skip_self=False, attrs=(), key_encoder=None,
+    ):
+        self.key_prefix = key_prefix
+        self.key_version = key_version
+        self.key_encoder = key_encoder
+        self.func_name = func.__name__
+        self.arg_names = _get_arg_names(func)
+        self.skip_self = skip_self
+        self.attrs = tuple((attr, attrgetter(attr)) for attr in attrs)
+        names = set(self.arg_names) | set(attrs)
+        if skip_self:
+            names.discard('self')
+        names.difference_update(('timeout', 'key_version'))
+        self.sorted_names = sorted(names)
+        self.base_key_str = u"{}{}".format(key_prefix, key_version)
+
+    def __call__(self, *func_args, **func_kwargs):
+        arg_names = self.arg_names
+        if len(func_args) > len(arg_names):
+            raise TypeError("{} takes {} positional arguments but {} were given".format(
+                self.func_name, len(arg_names), len(func_args)))
+        kwargs = dict(zip(arg_names, func_args))
+        kwargs.update(func_kwargs)
+        if self.skip_self:
+            kwargs.pop('self')
+        if self.attrs:
+            instance = func_args[0]
+            for attr, getter in self.attrs:
+                kwargs[attr] = getter(instance)
+
+        key = ArgsCacheKey(self.key_prefix, key_version=self.key_version, **kwargs)
+        if self.key_encoder is None:
+            key._key_str = self.format_key_str(key.kwargs)
+        else:
+            key.key_encoder = self.key_encoder
+        return key
+
+    def format_key_str(self, kwargs):
+        if not kwargs:
+            return self.base_key_str
+        names = [name for name in self.sorted_names if name in kwargs]
+        if len(names) != len(kwargs):
+            # **kwargs functions may receive names we don't know beforehand.
+            names = sorted(kwargs)
+        return self.base_key_str + "__" + "__".join(
+            u"{}_{}".format(name, kwargs[name]) for name in names
+        )
+
+
 class BaseKeyBuilder(object):
     def build_key(self, *args, **kwargs):
         raise NotImplementedError()
 
+    def compile(self, key_prefix, func, key_version=""):
+        '''
+        Returns a function that builds the key for a call of `func`, given the call
+        args and kwargs. Called once per decorated function. The default
+        implementation calls `build_key` on every call, key builders may return
+        something faster (see `KeyPlan`).
+        '''
+        def build(*func_args, **func_kwargs):
+            return self.build_key(
+                key_prefix, func, *func_args, key_version=key_version, **func_kwargs
+            )
+        return build
+
+    def get_namespaces(self, key_prefix, func_args):
+        '''
+        Returns the namespaces, besides the key type, the keys of a call with
+        `func_args` belong to (see `namespace.NamespaceGenerations`). `key_prefix`
+        is the decorator key prefix.
+        '''
+        return ()
+
 
 class FunctionKeyBuilder(BaseKeyBuilder):
+    '''
+    Builds keys from the function arguments names and values.
+
+    Args:
+        key_encoder (:obj:`BaseKeyEncoder`, optional): translates the keys to
+            strings, e.g. `key_encoder.HashedKeyEncoder()` for fixed length
+            hashed keys. Defaults to the readable `ArgsCacheKey` format.
+    '''
+    def __init__(self, key_encoder=None):
+        self.key_encoder = key_encoder
+
     def get_normalized_kwargs(self, func, *func_args, **func_kwargs):
         return _get_func_kwargs(func, *func_args, **func_kwargs)
 
     def build_key(self, key_prefix, func, *func_args, **func_kwargs):
         kwargs = self.get_normalized_kwargs(func, *func_args, **func_kwargs)
-        return ArgsCacheKey(key_prefix, **kwargs)
+        key = ArgsCacheKey(key_prefix, **kwargs)
+        key.key_encoder = self.key_encoder
+        return key
+
+    def get_plan_options(self):
+        return {'key_encoder': self.key_encoder}
+
+    def compile(self, key_prefix, func, key_version=""):
+        # Subclasses customizing get_normalized_kwargs can't be planned, they fall
+        # back to calling build_key.
+        if type(self).get_normalized_kwargs not in _PLANNED_NORMALIZERS:
+            return super(FunctionKeyBuilder, self).compile(key_prefix, func, key_version)
+        return KeyPlan(key_prefix, func, key_version, **self.get_plan_options())
 
 
 class MethodKeyBuilder(FunctionKeyBuilder):
@@ -137,6 +276,11 @@ class MethodKeyBuilder(FunctionKeyBuilder):
         kwargs.pop('self')
         return kwargs
 
+    def get_plan_options(self):
+        options = super(MethodKeyBuilder, self).get_plan_options()
+        options['skip_self'] = True
+        return options
+
 
 class AttrsMethodKeyBuilder(MethodKeyBuilder):
     def __init__(self, attrs, *args, **kwargs):
@@ -149,3 +293,27 @@ class AttrsMethodKeyBuilder(MethodKeyBuilder):
         for attr in self.attrs:
             kwargs[attr] = getattr(instance, attr)
         return kwargs
+
+    def get_plan_options(self):
+        options = super(AttrsMethodKeyBuilder, self).get_plan_options()
+        options['attrs'] = self.attrs
+        return options
+
+    def get_instance_namespace(self, key_prefix, instance):
+        '''
+        Returns the namespace shared by the keys of every method of `instance`
+        decorated with this key builder and `key_prefix`.
+        '''
+        return u"{}{}".format(key_prefix, "__".join(
+            u"{}_{}".format(attr, getattr(instance, attr)) for attr in self.attrs
+        ))
+
+    def get_namespaces(self, key_prefix, func_args):
+        return (self.get_instance_namespace(key_prefix, func_args[0]),)
+
+
+_PLANNED_NORMALIZERS = (
+    FunctionKeyBuilder.get_normalized_kwargs,
+    MethodKeyBuilder.get_normalized_kwargs,
+    AttrsMethodKeyBuilder.get_normalized_kwargs,
+)
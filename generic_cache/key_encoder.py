@@ -0,0 +1,119 @@
+# Copyright (c) 2018, Globo.com (https://github.com/globocom)
+#
+# License: MIT
+
+import hashlib
+
+__all__ = [
+    'BaseKeyEncoder', 'HashedKeyEncoder', 'canonical_encode',
+]
+
+
+class BaseKeyEncoder(object):
+    '''
+    Translates a key (its type, version, args and kwargs) into the string used on
+    the cache backend. See `ArgsCacheKey` for the default, `str()` based, format.
+    '''
+
+    def encode(self, key_type, version, args, kwargs):
+        raise NotImplementedError("Subclasses should implement this method")
+
+
+class HashedKeyEncoder(BaseKeyEncoder):
+    '''
+    Encodes args and kwargs canonically (see `canonical_encode`) and hashes them
+    into a fixed length hex digest, so keys have a bounded size whatever the
+    arguments are, dict and set arguments give the same key regardless of their
+    order and arguments can't collide by their string representation.
+
+    Example:
+    >>> encoder = HashedKeyEncoder(digest_size=8)
+    >>> encoder.encode('myfunc', 'v1', (), {'ids': {3, 1, 2}})
+    'myfuncv1__132f86fdde2ba486'
+
+    Args:
+        digest_size (int): size of the digest in bytes. The hex digest has twice
+            as many characters. Defaults to 16.
+        readable_prefix (bool): If `True` (default) the key type and version are
+            kept in front of the digest, which helps inspecting the cache.
+        max_length (int): maximum key length. The readable prefix is truncated to
+            fit it. Defaults to 250, memcached's limit.
+    '''
+
+    def __init__(self, digest_size=16, readable_prefix=True, max_length=250):
+        self.digest_size = digest_size
+        self.readable_prefix = readable_prefix
+        self.max_length = max_length
+
+    def digest(self, data):
+        blake2b = getattr(hashlib, 'blake2b', None)
+        if blake2b is not None:
+            return blake2b(data, digest_size=self.digest_size).hexdigest()
+        return hashlib.sha256(data).hexdigest()[:2 * self.digest_size]
+
+    def encode(self, key_type, version, args, kwargs):
+        prefix = u"{}{}".format(key_type, version)
+        data = canonical_encode((prefix, tuple(args), kwargs))
+        digest = self.digest(data)
+        if not self.readable_prefix:
+            return digest
+        prefix = prefix[:max(self.max_length - len(digest) - 2, 0)]
+        return prefix + "__" + digest
+
+
+def canonical_encode(obj):
+    '''
+    Serializes `obj` into bytes that are the same for equal values, no matter
+    dict or set ordering. Every value is tagged with its type and strings are
+    length prefixed, so `('a__b',)` and `('a', 'b')`, or `1` and `'1'`, never
+    encode the same. Objects of other types are encoded by their type name and
+    `str()`, or by the value returned by their `__cache_key__()` method if they
+    have one.
+    '''
+    chunks = []
+    _encode(obj, chunks)
+    return b''.join(chunks)
+
+
+def _encode_text(tag, text, chunks):
+    data = text.encode('utf-8')
+    chunks.append(tag + str(len(data)).encode('ascii') + b':' + data)
+
+
+def _encode(obj, chunks):
+    if obj is None:
+        chunks.append(b'N')
+    elif obj is True:
+        chunks.append(b'T')
+    elif obj is False:
+        chunks.append(b'F')
+    elif isinstance(obj, int):
+        chunks.append(b'i' + str(obj).encode('ascii') + b';')
+    elif isinstance(obj, float):
+        chunks.append(b'f' + repr(obj).encode('ascii') + b';')
+    elif isinstance(obj, str):
+        _encode_text(b's', obj, chunks)
+    elif isinstance(obj, bytes):
+        chunks.append(b'b' + str(len(obj)).encode('ascii') + b':' + obj)
+    elif isinstance(obj, (tuple, list)):
+        chunks.append((b'l' if isinstance(obj, list) else b't') + str(len(obj)).encode('ascii') + b':')
+        for item in obj:
+            _encode(item, chunks)
+    elif isinstance(obj, dict):
+        pairs = sorted(
+            (canonical_encode(key), canonical_encode(value)) for key, value in obj.items()
+        )
+        chunks.append(b'd' + str(len(pairs)).encode('ascii') + b':')
+        for key, value in pairs:
+            chunks.append(key)
+            chunks.append(value)
+    elif isinstance(obj, (set, frozenset)):
+        items = sorted(canonical_encode(item) for item in obj)
+        chunks.append(b'S' + str(len(items)).encode('ascii') + b':')
+        chunks.extend(items)
+    elif hasattr(obj, '__cache_key__'):
+        _encode_text(b'o', type(obj).__name__, chunks)
+        _encode(obj.__cache_key__(), chunks)
+    else:
+        _encode_text(b'o', type(obj).__name__, chunks)
+        _encode_text(b's', str(obj), chunks)
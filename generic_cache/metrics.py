@@ -0,0 +1,208 @@
+# Copyright (c) 2018, Globo.com (https://github.com/globocom)
+#
+# License: MIT
+
+import bisect
+import socket
+import threading
+
+__all__ = [
+    'BaseMetricsSink', 'Histogram', 'InMemoryMetrics', 'StatsdMetrics', 'PrometheusExporter',
+    'DEFAULT_BUCKETS',
+]
+
+# Latency buckets, in seconds.
+DEFAULT_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1,
+    2.5, 5, 10,
+)
+
+
+class BaseMetricsSink(object):
+    '''
+    Receives the metrics reported by `GenericCache`, labeled by key type.
+
+    Counters: `hits`, `misses`, `sets`, `backend_errors` and `compute_errors`.
+    Timings (seconds): `backend_get_seconds`, `backend_set_seconds` and
+    `compute_seconds`.
+
+    `guarded_backend.GuardedBackend` reports its own counters, labeled with its
+    name instead of a key type.
+    '''
+
+    def increment(self, name, key_type, value=1):
+        raise NotImplementedError("Subclasses should implement this method")
+
+    def observe(self, name, key_type, value):
+        raise NotImplementedError("Subclasses should implement this method")
+
+
+class Histogram(object):
+    '''
+    Cumulative histogram with fixed bucket upper bounds, Prometheus style.
+    '''
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self):
+        '''
+        Returns a list of `(upper_bound, count)` pairs, ending with `'+Inf'`.
+        '''
+        pairs = []
+        total = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+
+class InMemoryMetrics(BaseMetricsSink):
+    '''
+    Keeps counters and histograms in memory. Read them with `counter`,
+    `histogram` or `snapshot`, or expose them with `PrometheusExporter`.
+
+    Args:
+        buckets (tuple): histogram bucket upper bounds, in seconds.
+    '''
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name, key_type, value=1):
+        key = (name, key_type)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, key_type, value):
+        key = (name, key_type)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    def counter(self, name, key_type):
+        return self.counters.get((name, key_type), 0)
+
+    def histogram(self, name, key_type):
+        return self.histograms.get((name, key_type))
+
+    def snapshot(self):
+        '''
+        Returns `{key_type: {metric_name: value}}`. Histograms are summarized as
+        `{'count': ..., 'sum': ...}`.
+        '''
+        result = {}
+        with self._lock:
+            for (name, key_type), value in self.counters.items():
+                result.setdefault(key_type, {})[name] = value
+            for (name, key_type), histogram in self.histograms.items():
+                result.setdefault(key_type, {})[name] = {
+                    'count': histogram.count, 'sum': histogram.sum,
+                }
+        return result
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+
+class StatsdMetrics(BaseMetricsSink):
+    '''
+    Sends the metrics to a statsd server over UDP, as `<prefix>.<key_type>.<name>`.
+    Timings are sent in milliseconds. Sending is fire and forget: socket errors
+    are ignored.
+
+    Args:
+        host (str): Defaults to `'localhost'`.
+        port (int): Defaults to 8125.
+        prefix (str): Defaults to `'generic_cache'`.
+    '''
+
+    def __init__(self, host='localhost', port=8125, prefix='generic_cache'):
+        self.address = (host, port)
+        self.prefix = prefix
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def _name(self, name, key_type):
+        key_type = str(key_type).replace(':', '_').replace('|', '_')
+        return "{}.{}.{}".format(self.prefix, key_type, name)
+
+    def _send(self, data):
+        try:
+            self._sock.sendto(data.encode('utf-8'), self.address)
+        except socket.error:
+            pass
+
+    def increment(self, name, key_type, value=1):
+        self._send("{}:{}|c".format(self._name(name, key_type), value))
+
+    def observe(self, name, key_type, value):
+        self._send("{}:{:.3f}|ms".format(self._name(name, key_type), value * 1000))
+
+    def close(self):
+        self._sock.close()
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class PrometheusExporter(object):
+    '''
+    Renders an `InMemoryMetrics` in the Prometheus text exposition format, e.g.
+    to be served on a `/metrics` endpoint. Counters become
+    `<namespace>_<name>_total` and timings `<namespace>_<name>` histograms, all
+    labeled by `key_type`.
+
+    Args:
+        metrics (InMemoryMetrics): the metrics to export.
+        namespace (str): metric name prefix. Defaults to `'generic_cache'`.
+    '''
+
+    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def __init__(self, metrics, namespace='generic_cache'):
+        self.metrics = metrics
+        self.namespace = namespace
+
+    def render(self):
+        lines = []
+        with self.metrics._lock:
+            counters = sorted(self.metrics.counters.items())
+            histograms = sorted(
+                (key, histogram.cumulative_counts(), histogram.sum, histogram.count)
+                for key, histogram in self.metrics.histograms.items()
+            )
+        last_name = None
+        for (name, key_type), value in counters:
+            metric = "{}_{}_total".format(self.namespace, name)
+            if metric != last_name:
+                lines.append("# TYPE {} counter".format(metric))
+                last_name = metric
+            lines.append('{}{{key_type="{}"}} {}'.format(metric, _escape_label(key_type), value))
+        for (name, key_type), buckets, total, count in histograms:
+            metric = "{}_{}".format(self.namespace, name)
+            if metric != last_name:
+                lines.append("# TYPE {} histogram".format(metric))
+                last_name = metric
+            label = _escape_label(key_type)
+            for bound, cumulative in buckets:
+                lines.append('{}_bucket{{key_type="{}",le="{}"}} {}'.format(
+                    metric, label, bound, cumulative))
+            lines.append('{}_sum{{key_type="{}"}} {}'.format(metric, label, total))
+            lines.append('{}_count{{key_type="{}"}} {}'.format(metric, label, count))
+        return "\n".join(lines) + "\n"
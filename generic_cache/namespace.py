@@ -0,0 +1,153 @@
+# Copyright (c) 2018, Globo.com (https://github.com/globocom)
+#
+# License: MIT
+
+import threading
+import time
+
+from .backend import InMemoryCache
+from .expiry import monotonic
+from .key_builder import BaseCacheKey
+
+__all__ = [
+    'NamespaceGenerations', 'NamespacedCacheKey',
+]
+
+
+class NamespaceGenerations(object):
+    '''
+    Keeps a generation number for each cache namespace (e.g. a key type, or an
+    instance) on the cache backend. Keys embed the generations of their
+    namespaces (see `NamespacedCacheKey`), so bumping a generation makes every
+    key of the namespace unreachable with a single backend write. The old
+    entries are left to expire or be evicted.
+
+    Generations are cached locally for `local_ttl` seconds, so a bump made by
+    another process is seen up to `local_ttl` seconds later. At most
+    `local_max_entries` of them are kept, the least recently used are evicted
+    (e.g. the namespaces of instances no longer in use).
+
+    Generations are derived from the wall clock rather than incremented, so a
+    bump needs no read and a generation lost by the backend (e.g. evicted) is
+    replaced by a new one instead of going back to a previous value.
+
+    Args:
+        cache_backend (BaseBackend): where generations are stored. Must keep
+            values without timeout.
+        key_prefix (str): prepended to namespaces to build the generation keys.
+            Defaults to `'generation__'`.
+        local_ttl (float): seconds a generation is cached locally. Defaults to 1.
+        local_max_entries (int): maximum number of generations cached locally.
+            Defaults to 10000.
+        clock (:obj:`function`, optional): monotonic clock used for the local
+            cache.
+    '''
+
+    def __init__(
+        self, cache_backend, key_prefix='generation__', local_ttl=1, local_max_entries=10000,
+        clock=monotonic,
+    ):
+        self.cache_backend = cache_backend
+        self.key_prefix = key_prefix
+        self.local_ttl = local_ttl
+        self.local_max_entries = local_max_entries
+        self._clock = clock
+        self._local = self._new_local()
+        self._lock = threading.Lock()
+        self._last_generation = 0
+
+    def _new_generation(self):
+        with self._lock:
+            generation = max(int(time.time() * 1e6), self._last_generation + 1)
+            self._last_generation = generation
+        return generation
+
+    def _new_local(self):
+        return InMemoryCache(max_entries=self.local_max_entries, clock=self._clock)
+
+    def _remember(self, namespace, generation):
+        self._local.set(namespace, generation, timeout=self.local_ttl)
+
+    def _initialize(self, key):
+        generation = self._new_generation()
+        try:
+            if self.cache_backend.add(key, generation):
+                return generation
+        except NotImplementedError:
+            self.cache_backend.set(key, generation)
+            return generation
+        # Another process initialized it first.
+        return self.cache_backend.get(key) or generation
+
+    def get_many(self, namespaces):
+        '''
+        Returns the generations of `namespaces`, in order. Those not cached
+        locally are fetched with a single `cache_backend.get_many` call.
+        '''
+        generations = []
+        missing = []
+        for i, namespace in enumerate(namespaces):
+            generation = self._local.get(namespace)
+            generations.append(generation)
+            if generation is None:
+                missing.append(i)
+        if not missing:
+            return generations
+
+        keys = [self.key_prefix + namespaces[i] for i in missing]
+        found = self.cache_backend.get_many(keys)
+        for i, key in zip(missing, keys):
+            generation = found.get(key)
+            if generation is None:
+                generation = self._initialize(key)
+            generations[i] = generation
+            self._remember(namespaces[i], generation)
+        return generations
+
+    def get(self, namespace):
+        return self.get_many([namespace])[0]
+
+    def bump(self, namespace):
+        '''
+        Moves `namespace` to a new generation, invalidating all its keys, and
+        returns it.
+        '''
+        generation = self._new_generation()
+        self.cache_backend.set(self.key_prefix + namespace, generation)
+        self._remember(namespace, generation)
+        return generation
+
+    def clear_local(self):
+        '''
+        Forgets the locally cached generations.
+        '''
+        self._local = self._new_local()
+
+
+class NamespacedCacheKey(BaseCacheKey):
+    '''
+    Wraps a key appending the generations of its namespaces to its `key_str`.
+    Keys with a `key_encoder` (see `key_builder.ArgsCacheKey`) are encoded with
+    the generations appended to their version instead, so the encoder limits
+    (e.g. `key_encoder.HashedKeyEncoder` `max_length`) still hold.
+    '''
+
+    def __init__(self, key, generations):
+        super(NamespacedCacheKey, self).__init__(
+            key.key_type, key_version=key.version, timeout=key.timeout)
+        self.key = key
+        self.generations = generations
+        self._key_str = None
+
+    @property
+    def key_str(self):
+        if self._key_str is None:
+            suffix = u"__g{}".format("_".join("{:x}".format(g) for g in self.generations))
+            key_encoder = getattr(self.key, 'key_encoder', None)
+            if key_encoder is None:
+                self._key_str = self.key.key_str + suffix
+            else:
+                self._key_str = key_encoder.encode(
+                    self.key.key_type, self.key.version + suffix, self.key.args,
+                    self.key.kwargs)
+        return self._key_str
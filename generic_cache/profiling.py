@@ -0,0 +1,295 @@
+# Copyright (c) 2018, Globo.com (https://github.com/globocom)
+#
+# License: MIT
+
+import contextvars
+import random
+import threading
+import time
+from collections import deque
+
+__all__ = [
+    'BaseProfilerHook', 'Profiler', 'ProfiledCall', 'ProfileCollector', 'current_call',
+    'PHASES',
+]
+
+# Phases of a decorated function call, in the order they happen.
+PHASES = ('build_key', 'backend_get', 'compute', 'backend_set')
+
+_current_call = contextvars.ContextVar('generic_cache_profiled_call', default=None)
+
+
+def current_call():
+    '''
+    Returns the `ProfiledCall` being profiled, or `None`.
+    '''
+    return _current_call.get()
+
+
+def _new_id(bits):
+    return '{:0{}x}'.format(random.getrandbits(bits), bits // 4)
+
+
+class BaseProfilerHook(object):
+    '''
+    Receives the events of profiled calls. Every method does nothing by
+    default, override the ones you need. Hooks run on the caller's thread, keep
+    them fast.
+    '''
+
+    def on_phase_start(self, call, phase):
+        pass
+
+    def on_phase_end(self, call, phase, duration, error):
+        '''
+        Called when `phase` of `call` ends, `duration` seconds after it
+        started. `error` is the exception it raised, if any.
+        '''
+
+    def on_call_end(self, call):
+        pass
+
+
+class ProfiledCall(object):
+    '''
+    One profiled call of a decorated function. While active (as a context
+    manager) it's the `current_call`, and `GenericCache` reports its backend
+    and `func()` phases to it.
+
+    Attributes:
+        key_type (str): key type of the decorated function.
+        key (str): the cache key, once built.
+        phases (list): `(phase, start, end, error)` tuples, `start` and `end`
+            from `time.perf_counter`.
+        start (float): `time.perf_counter` when the call started.
+        end (float): `time.perf_counter` when the call ended.
+        start_unix_nano (int): wall clock start time, in nanoseconds.
+        error (Exception): the exception the call raised, if any.
+        parent (ProfiledCall): the profiled call this one was made from.
+        trace_id (str): shared by every call of the same trace.
+        span_id (str): identifies this call.
+    '''
+
+    def __init__(self, profiler, key_type):
+        self.profiler = profiler
+        self.key_type = key_type
+        self.key = None
+        self.phases = []
+        self.start = None
+        self.end = None
+        self.start_unix_nano = None
+        self.error = None
+        self.parent = None
+        self.trace_id = None
+        self.span_id = _new_id(64)
+        self._token = None
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+    @property
+    def hit(self):
+        '''
+        `False` if `func()` was called.
+        '''
+        return not any(phase[0] == 'compute' for phase in self.phases)
+
+    def measure(self, phase, func, *args, **kwargs):
+        '''
+        Calls `func(*args, **kwargs)` recording it as `phase`.
+        '''
+        hooks = self.profiler.hooks
+        for hook in hooks:
+            hook.on_phase_start(self, phase)
+        error = None
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            end = time.perf_counter()
+            self.phases.append((phase, start, end, error))
+            for hook in hooks:
+                hook.on_phase_end(self, phase, end - start, error)
+
+    def __enter__(self):
+        self.parent = _current_call.get()
+        self.trace_id = _new_id(128) if self.parent is None else self.parent.trace_id
+        self._token = _current_call.set(self)
+        self.start_unix_nano = time.time_ns()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.end = time.perf_counter()
+        _current_call.reset(self._token)
+        self.error = exc_value
+        for hook in self.profiler.hooks:
+            hook.on_call_end(self)
+
+
+class Profiler(object):
+    '''
+    Profiles a sample of the calls of decorated functions (see the `profiler`
+    argument of `CacheDecorator`), reporting the time spent building the key,
+    reading from the cache backend, calling the function and writing its
+    result (see `PHASES`) to `hooks`.
+
+    Args:
+        hooks (list): `BaseProfilerHook` instances, e.g. a `ProfileCollector`.
+        sample_rate (float): fraction of the calls profiled. Defaults to `1.0`.
+    '''
+
+    def __init__(self, hooks=(), sample_rate=1.0):
+        self.hooks = list(hooks)
+        self.sample_rate = sample_rate
+
+    def sample(self, key_type):
+        '''
+        Returns a `ProfiledCall` for a call of `key_type` if it's sampled, else
+        `None`.
+        '''
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return None
+        return ProfiledCall(self, key_type)
+
+
+def _percentile(ordered, fraction):
+    # Nearest rank.
+    index = max(int(round(fraction * len(ordered))) - 1, 0)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+class ProfileCollector(BaseProfilerHook):
+    '''
+    Aggregates the phase timings of the profiled calls per key type, and keeps
+    the latest calls to export them as spans.
+
+    Args:
+        max_samples (int): timings kept per key type and phase to compute the
+            percentiles. Defaults to 1000.
+        max_traces (int): latest calls kept for `export_spans`. Defaults to 100.
+    '''
+
+    def __init__(self, max_samples=1000, max_traces=100):
+        self.max_samples = max_samples
+        self.samples = {}
+        self.counts = {}
+        self.totals = {}
+        self.calls = deque(maxlen=max_traces)
+        self._lock = threading.Lock()
+
+    def _add(self, key_type, phase, duration):
+        key = (key_type, phase)
+        samples = self.samples.get(key)
+        if samples is None:
+            samples = self.samples[key] = deque(maxlen=self.max_samples)
+        samples.append(duration)
+        self.counts[key] = self.counts.get(key, 0) + 1
+        self.totals[key] = self.totals.get(key, 0) + duration
+
+    def on_call_end(self, call):
+        with self._lock:
+            for phase, start, end, _ in call.phases:
+                self._add(call.key_type, phase, end - start)
+            self._add(call.key_type, 'total', call.duration)
+            self.calls.append(call)
+
+    def report(self):
+        '''
+        Returns `{key_type: {phase: stats}}`, where stats has the `count`,
+        `total`, `mean`, `p50`, `p90`, `p99` and `max` seconds. The `total`
+        phase is the whole call. Percentiles cover the latest `max_samples`
+        timings.
+        '''
+        result = {}
+        with self._lock:
+            for (key_type, phase), samples in self.samples.items():
+                ordered = sorted(samples)
+                count = self.counts[(key_type, phase)]
+                total = self.totals[(key_type, phase)]
+                result.setdefault(key_type, {})[phase] = {
+                    'count': count,
+                    'total': total,
+                    'mean': total / count,
+                    'p50': _percentile(ordered, 0.5),
+                    'p90': _percentile(ordered, 0.9),
+                    'p99': _percentile(ordered, 0.99),
+                    'max': ordered[-1],
+                }
+        return result
+
+    def format_report(self):
+        '''
+        Returns the report as a text table, key types sorted by total time
+        (the most worth optimizing first). Times are in milliseconds.
+        '''
+        report = self.report()
+        lines = ["{:<40} {:<12} {:>8} {:>10} {:>9} {:>9} {:>9}".format(
+            'key_type', 'phase', 'count', 'total', 'p50', 'p90', 'p99')]
+        by_total = sorted(report, key=lambda key_type: -report[key_type]['total']['total'])
+        for key_type in by_total:
+            phases = report[key_type]
+            for phase in PHASES + ('total',):
+                if phase not in phases:
+                    continue
+                stats = phases[phase]
+                lines.append("{:<40} {:<12} {:>8} {:>10.3f} {:>9.3f} {:>9.3f} {:>9.3f}".format(
+                    key_type, phase, stats['count'], stats['total'] * 1e3, stats['p50'] * 1e3,
+                    stats['p90'] * 1e3, stats['p99'] * 1e3))
+        return "\n".join(lines)
+
+    def export_spans(self):
+        '''
+        Returns the latest calls as spans following the OpenTelemetry (OTLP
+        JSON) span structure: one span per call, with a child span per phase.
+        Calls made from other profiled calls share their trace.
+        '''
+        with self._lock:
+            calls = list(self.calls)
+        spans = []
+        for call in calls:
+            def unix_nano(perf_time):
+                return call.start_unix_nano + int((perf_time - call.start) * 1e9)
+
+            spans.append(_span(
+                call.trace_id, call.span_id, call.parent and call.parent.span_id,
+                call.key_type, call.start_unix_nano, unix_nano(call.end), call.error, {
+                    'cache.key_type': call.key_type,
+                    'cache.key': call.key,
+                    'cache.hit': call.hit,
+                }))
+            for phase, start, end, error in call.phases:
+                spans.append(_span(
+                    call.trace_id, _new_id(64), call.span_id, phase, unix_nano(start),
+                    unix_nano(end), error, {'cache.key_type': call.key_type}))
+        return spans
+
+
+def _span(trace_id, span_id, parent_span_id, name, start, end, error, attributes):
+    span = {
+        'traceId': trace_id,
+        'spanId': span_id,
+        'parentSpanId': parent_span_id or '',
+        'name': name,
+        'kind': 1,  # SPAN_KIND_INTERNAL
+        'startTimeUnixNano': str(start),
+        'endTimeUnixNano': str(end),
+        'attributes': [
+            {'key': key, 'value': _attribute_value(value)}
+            for key, value in sorted(attributes.items()) if value is not None
+        ],
+        'status': {'code': 1},  # STATUS_CODE_OK
+    }
+    if error is not None:
+        span['status'] = {'code': 2, 'message': repr(error)}  # STATUS_CODE_ERROR
+    return span
+
+
+def _attribute_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    return {'stringValue': str(value)}
@@ -0,0 +1,336 @@
+# Copyright (c) 2018, Globo.com (https://github.com/globocom)
+#
+# License: MIT
+
+import socket
+import threading
+from contextlib import contextmanager
+
+from .backend import BaseBackend
+from .codec import Codec
+
+__all__ = [
+    'RedisError', 'RedisConnectionError', 'RedisConnection', 'ConnectionPool', 'RedisBackend',
+]
+
+_DEFAULT_CODEC = object()
+
+
+class RedisError(Exception):
+    '''
+    Error replied by the server.
+    '''
+
+
+class RedisConnectionError(RedisError):
+    '''
+    The connection failed, timed out or was closed by the server.
+    '''
+
+
+def _to_bytes(value):
+    if isinstance(value, bytes):
+        return value
+    if isinstance(value, str):
+        return value.encode('utf-8')
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        # Numeric arguments, like TTLs and database numbers.
+        return str(value).encode('ascii')
+    raise TypeError("can't send {!r} to redis, encode it first".format(type(value)))
+
+
+def pack_command(*args):
+    '''
+    Encodes a command as a RESP array of bulk strings.
+    '''
+    chunks = [b'*' + str(len(args)).encode('ascii') + b'\r\n']
+    for arg in args:
+        arg = _to_bytes(arg)
+        chunks.append(b'$' + str(len(arg)).encode('ascii') + b'\r\n')
+        chunks.append(arg)
+        chunks.append(b'\r\n')
+    return b''.join(chunks)
+
+
+class RedisConnection(object):
+    '''
+    A single connection speaking the RESP2 protocol. Not thread safe, connections
+    are meant to be used through a `ConnectionPool`.
+
+    Args:
+        host (str): server host.
+        port (int): server port.
+        db (int): database selected after connecting. Defaults to 0.
+        password (:obj:`str`, optional): sent with `AUTH` after connecting.
+        socket_timeout (:obj:`float`, optional): seconds to wait on each socket
+            read or write. `None` waits forever.
+        connect_timeout (:obj:`float`, optional): seconds to wait for the
+            connection to be established. Defaults to `socket_timeout`.
+    '''
+
+    def __init__(
+        self, host, port, db=0, password=None, socket_timeout=None, connect_timeout=None,
+    ):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.socket_timeout = socket_timeout
+        self.connect_timeout = socket_timeout if connect_timeout is None else connect_timeout
+        self._sock = None
+        self._reader = None
+
+    def connect(self):
+        try:
+            sock = socket.create_connection((self.host, self.port), self.connect_timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.settimeout(self.socket_timeout)
+        except (socket.error, socket.timeout) as error:
+            raise RedisConnectionError(
+                "error connecting to {}:{}: {}".format(self.host, self.port, error))
+        self._sock = sock
+        self._reader = sock.makefile('rb')
+        setup = []
+        if self.password is not None:
+            setup.append(('AUTH', self.password))
+        if self.db:
+            setup.append(('SELECT', self.db))
+        if setup:
+            try:
+                self.execute_many(setup)
+            except RedisError:
+                self.close()
+                raise
+
+    def close(self):
+        if self._sock is None:
+            return
+        try:
+            self._reader.close()
+            self._sock.close()
+        except socket.error:
+            pass
+        self._sock = None
+        self._reader = None
+
+    @property
+    def connected(self):
+        return self._sock is not None
+
+    def execute(self, *args):
+        return self.execute_many([args])[0]
+
+    def execute_many(self, commands):
+        '''
+        Pipelines `commands` (a list of argument tuples): they are all sent in one
+        write and then every reply is read. Raises the first error replied, after
+        reading every reply so the connection stays usable.
+        '''
+        if self._sock is None:
+            self.connect()
+        try:
+            self._sock.sendall(b''.join(pack_command(*args) for args in commands))
+            replies = [self._read_reply() for _ in commands]
+        except (socket.error, socket.timeout) as error:
+            self.close()
+            raise RedisConnectionError(
+                "error talking to {}:{}: {}".format(self.host, self.port, error))
+        for reply in replies:
+            if isinstance(reply, RedisError):
+                raise reply
+        return replies
+
+    def _read_line(self):
+        line = self._reader.readline()
+        if not line.endswith(b'\r\n'):
+            self.close()
+            raise RedisConnectionError("connection closed by the server")
+        return line[:-2]
+
+    def _read_reply(self):
+        line = self._read_line()
+        kind, rest = line[:1], line[1:]
+        if kind == b'+':
+            return rest
+        if kind == b'-':
+            return RedisError(rest.decode('utf-8', 'replace'))
+        if kind == b':':
+            return int(rest)
+        if kind == b'$':
+            length = int(rest)
+            if length < 0:
+                return None
+            data = self._reader.read(length + 2)
+            if len(data) != length + 2:
+                self.close()
+                raise RedisConnectionError("connection closed by the server")
+            return data[:-2]
+        if kind == b'*':
+            length = int(rest)
+            if length < 0:
+                return None
+            return [self._read_reply() for _ in range(length)]
+        self.close()
+        raise RedisConnectionError("protocol error, unexpected reply {!r}".format(line))
+
+
+class ConnectionPool(object):
+    '''
+    Thread safe pool of `RedisConnection` instances. Idle connections are reused
+    most recently released first, so bursts don't keep every connection warm.
+
+    Args:
+        max_connections (int): maximum number of open connections. Defaults to 10.
+        timeout (:obj:`float`, optional): seconds to wait for a free connection
+            when the pool is exhausted. `None` waits forever.
+        **connection_kwargs: forwarded to `RedisConnection`.
+    '''
+
+    def __init__(self, max_connections=10, timeout=None, **connection_kwargs):
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.connection_kwargs = connection_kwargs
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_connections)
+
+    def acquire(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise RedisConnectionError("timed out waiting for a free connection")
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return RedisConnection(**self.connection_kwargs)
+
+    def release(self, connection):
+        if connection.connected:
+            with self._lock:
+                self._idle.append(connection)
+        self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        connection = self.acquire()
+        try:
+            yield connection
+        finally:
+            self.release(connection)
+
+    def disconnect(self):
+        '''
+        Closes the idle connections.
+        '''
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+
+class RedisBackend(BaseBackend):
+    '''
+    Cache backend for Redis (or any server speaking its protocol), implemented
+    with plain sockets. Timeouts are set natively on the server (`PX`), batch
+    operations are pipelined in a single round trip and `add` is an atomic
+    `SET NX`, so it can hold `GenericCache` single flight locks.
+
+    Args:
+        host (str): Defaults to `'localhost'`.
+        port (int): Defaults to 6379.
+        db (int): Defaults to 0.
+        password (:obj:`str`, optional): password for `AUTH`.
+        socket_timeout (:obj:`float`, optional): seconds to wait on socket reads
+            and writes. Defaults to 1.
+        connect_timeout (:obj:`float`, optional): seconds to wait for new
+            connections. Defaults to `socket_timeout`.
+        max_connections (int): connection pool size. Defaults to 10.
+        pool_timeout (:obj:`float`, optional): seconds to wait for a pooled
+            connection. Defaults to `socket_timeout`.
+        codec (:obj:`codec.Codec`, optional): serializes the values. Defaults to
+            a pickle `Codec`. Pass `None` to store values as they are, when they
+            are already bytes (e.g. encoded by `GenericCache` codec): other values
+            raise `TypeError`.
+        pool (:obj:`ConnectionPool`, optional): pool to use instead of building
+            one from the arguments above.
+    '''
+
+    def __init__(
+        self, host='localhost', port=6379, db=0, password=None, socket_timeout=1,
+        connect_timeout=None, max_connections=10, pool_timeout=None, codec=_DEFAULT_CODEC,
+        pool=None,
+    ):
+        if pool is None:
+            pool = ConnectionPool(
+                max_connections=max_connections,
+                timeout=socket_timeout if pool_timeout is None else pool_timeout,
+                host=host, port=port, db=db, password=password,
+                socket_timeout=socket_timeout, connect_timeout=connect_timeout,
+            )
+        self.pool = pool
+        self.codec = Codec() if codec is _DEFAULT_CODEC else codec
+
+    def _execute(self, *args):
+        with self.pool.connection() as connection:
+            return connection.execute(*args)
+
+    def _execute_many(self, commands):
+        with self.pool.connection() as connection:
+            return connection.execute_many(commands)
+
+    def _encode(self, value):
+        if self.codec is not None:
+            return self.codec.encode(value)
+        if not isinstance(value, bytes):
+            raise TypeError(
+                "values must be bytes when codec is None, got {!r}".format(type(value)))
+        return value
+
+    def _decode(self, value):
+        return value if self.codec is None else self.codec.decode(value)
+
+    def _ttl_args(self, timeout):
+        if timeout is None:
+            return ()
+        # Redis rejects non positive TTLs, the shortest one expires them at once.
+        return ('PX', max(int(timeout * 1000), 1))
+
+    def get(self, key, default=None):
+        value = self._execute('GET', key)
+        if value is None:
+            return default
+        return self._decode(value)
+
+    def set(self, key, value, timeout=None):
+        self._execute('SET', key, self._encode(value), *self._ttl_args(timeout))
+
+    def delete(self, key):
+        self._execute('DEL', key)
+
+    def add(self, key, value, timeout=None):
+        reply = self._execute('SET', key, self._encode(value), 'NX', *self._ttl_args(timeout))
+        return reply is not None
+
+    def get_many(self, keys):
+        keys = list(keys)
+        if not keys:
+            return {}
+        values = {}
+        for key, value in zip(keys, self._execute('MGET', *keys)):
+            if value is not None:
+                values[key] = self._decode(value)
+        return values
+
+    def set_many(self, mapping, timeout=None):
+        if not mapping:
+            return
+        ttl_args = self._ttl_args(timeout)
+        self._execute_many([
+            ('SET', key, self._encode(value)) + ttl_args for key, value in mapping.items()
+        ])
+
+    def delete_many(self, keys):
+        keys = list(keys)
+        if keys:
+            self._execute('DEL', *keys)
+
+    def close(self):
+        self.pool.disconnect()
@@ -0,0 +1,106 @@
+# Copyright (c) 2018, Globo.com (https://github.com/globocom)
+#
+# License: MIT
+
+import logging
+import threading
+
+__all__ = [
+    'RefreshExecutor',
+]
+
+
+class RefreshExecutor(object):
+    '''
+    Bounded thread pool used to refresh stale cache entries in background.
+    Refreshes are deduplicated by key: while a refresh for a key is queued or
+    running, new refresh requests for it are dropped.
+
+    Args:
+        max_workers (int): number of refresh threads. Defaults to 4.
+        max_pending (int): maximum number of queued or running refreshes. New
+            requests are rejected when the limit is reached. Defaults to 1000.
+
+    Attributes:
+        queued (int): refreshes accepted.
+        deduplicated (int): refreshes dropped because one was already pending for
+            the same key.
+        rejected (int): refreshes dropped because `max_pending` was reached.
+        completed (int): refreshes that finished successfully.
+        failed (int): refreshes that raised an exception.
+    '''
+
+    def __init__(self, max_workers=4, max_pending=1000):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending = set()
+        self.queued = 0
+        self.deduplicated = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+
+    def _get_executor(self):
+        if self._executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    def submit(self, key, func):
+        '''
+        Schedules `func()` to refresh `key`. Returns `True` if it was scheduled and
+        `False` if it was deduplicated or rejected.
+        '''
+        with self._lock:
+            if key in self._pending:
+                self.deduplicated += 1
+                return False
+            if len(self._pending) >= self.max_pending:
+                self.rejected += 1
+                return False
+            self._pending.add(key)
+            self.queued += 1
+            executor = self._get_executor()
+        executor.submit(self._run, key, func)
+        return True
+
+    def _run(self, key, func):
+        try:
+            func()
+        except Exception:
+            self.logger.exception("failed to refresh key=%s", key)
+            with self._lock:
+                self.failed += 1
+        else:
+            with self._lock:
+                self.completed += 1
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+
+    def pending(self):
+        return len(self._pending)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queued': self.queued,
+                'deduplicated': self.deduplicated,
+                'rejected': self.rejected,
+                'completed': self.completed,
+                'failed': self.failed,
+                'pending': len(self._pending),
+            }
+
+    def shutdown(self, wait=True):
+        '''
+        Stops the refresh threads. If `wait` is `True`, blocks until pending
+        refreshes are done.
+        '''
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
@@ -0,0 +1,72 @@
+# Copyright (c) 2018, Globo.com (https://github.com/globocom)
+#
+# License: MIT
+
+import contextvars
+
+from .backend import MISS
+
+__all__ = [
+    'RequestScope', 'current_scope',
+]
+
+_current_scope = contextvars.ContextVar('generic_cache_request_scope', default=None)
+
+
+def current_scope():
+    '''
+    Returns the active `RequestScope`, or `None` outside of one.
+    '''
+    return _current_scope.get()
+
+
+class RequestScope(object):
+    '''
+    Memoizes the values read from and written to cache while it is active, so
+    repeated calls for the same key within a request (e.g. a web request) skip
+    the cache backend. Use it as a context manager around the request:
+
+    ```
+    with RequestScope():
+        handle(request)
+    ```
+
+    The active scope is kept in a `contextvars.ContextVar`: it applies to every
+    `GenericCache` and `AsyncGenericCache` used in the same thread, and to the
+    asyncio tasks started within it, while other threads and tasks (other
+    requests) are unaffected. Values are memoized per cache backend and key
+    string, and dropped when the scope exits.
+
+    Attributes:
+        hits (int): lookups answered by the scope.
+    '''
+
+    def __init__(self):
+        self.values = {}
+        self.hits = 0
+        self._tokens = []
+
+    def get(self, backend, key_str, default=MISS):
+        value = self.values.get((backend, key_str), MISS)
+        if value is MISS:
+            return default
+        self.hits += 1
+        return value
+
+    def set(self, backend, key_str, value):
+        self.values[(backend, key_str)] = value
+
+    def discard(self, backend, key_str):
+        self.values.pop((backend, key_str), None)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __enter__(self):
+        self._tokens.append(_current_scope.set(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        _current_scope.reset(self._tokens.pop())
+        if not self._tokens:
+            self.values.clear()
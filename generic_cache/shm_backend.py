@@ -0,0 +1,317 @@
+# Copyright (c) 2018, Globo.com (https://github.com/globocom)
+#
+# License: MIT
+
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from .backend import MISS, BaseBackend
+from .codec import Codec
+
+__all__ = [
+    'SharedMemoryCache',
+]
+
+_DEFAULT_CODEC = object()
+_MAGIC = b'GCSHM001'
+# magic, buckets, ways, slot size
+_HEADER = struct.Struct('<8sIII')
+_HEADER_SIZE = 64
+_SEQ = struct.Struct('<I')
+# sequence, key hash, expires at, written at, key length, value length
+_SLOT = struct.Struct('<IQddHI')
+_SLOT_HEADER_SIZE = 40
+_SEQ_MASK = 0xFFFFFFFF
+
+
+def _anonymous_file():
+    '''
+    Returns the descriptor of a new file, already unlinked: its memory is freed
+    once every process that mapped it is gone.
+    '''
+    directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    fd, path = tempfile.mkstemp(prefix='generic_cache_', dir=directory)
+    os.unlink(path)
+    return fd
+
+
+class SharedMemoryCache(BaseBackend):
+    '''
+    A cache backend shared by every process on the host: entries live in a
+    memory mapped file (on `/dev/shm` by default, so nothing touches the disk)
+    organized as a fixed size hash table. Create it before forking workers (e.g.
+    in the gunicorn master), or give every process the same `path`. Without a
+    `path` the file is unlinked right away, so only forked processes share it
+    and its memory is freed when they all exit.
+
+    The table has `buckets` buckets of `ways` slots each. A key may live in any
+    slot of its bucket; when they are all taken, the slot expiring first or, if
+    none expires, the least recently written one is evicted. Keys and encoded
+    values larger than a slot are not cached.
+
+    Reads don't lock: every slot has a sequence number (a seqlock) that writers
+    make odd while they write, so readers detect and retry torn reads. Writers
+    lock the bucket with a byte range `fcntl` lock (plus a thread lock within
+    the process).
+
+    Args:
+        path (:obj:`str`, optional): the mapped file. Created if needed. If it
+            exists with another layout (`buckets`, `ways`, `slot_size`),
+            `ValueError` is raised: other processes may be using it. Defaults to
+            an unlinked file.
+        buckets (int): number of buckets. Defaults to 1024.
+        ways (int): slots per bucket. Defaults to 8.
+        slot_size (int): bytes per slot, including a 40 bytes header. Defaults
+            to 1024.
+        codec (:obj:`codec.Codec`, optional): serializes the values. Defaults to
+            a pickle `Codec`. With `None` values must be bytes.
+        read_retries (int): how many times a torn read is retried before being
+            treated as a miss. Defaults to 10.
+    '''
+
+    def __init__(
+        self, path=None, buckets=1024, ways=8, slot_size=1024, codec=_DEFAULT_CODEC,
+        read_retries=10,
+    ):
+        if slot_size <= _SLOT_HEADER_SIZE:
+            raise ValueError("slot_size must be larger than {}".format(_SLOT_HEADER_SIZE))
+        self.path = path
+        self.buckets = buckets
+        self.ways = ways
+        self.slot_size = slot_size
+        self.capacity = slot_size - _SLOT_HEADER_SIZE
+        self.codec = Codec() if codec is _DEFAULT_CODEC else codec
+        self.read_retries = read_retries
+        self.size = _HEADER_SIZE + buckets * ways * slot_size
+        self._locks = [threading.Lock() for _ in range(min(buckets, 64))]
+        self.evictions = 0
+        self.rejections = 0
+        if path is None:
+            self._fd = _anonymous_file()
+        else:
+            self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            self._map = self._open_map()
+        except Exception:
+            os.close(self._fd)
+            raise
+
+    def _open_map(self):
+        fcntl.lockf(self._fd, fcntl.LOCK_EX)
+        try:
+            header = _HEADER.pack(_MAGIC, self.buckets, self.ways, self.slot_size)
+            size = os.fstat(self._fd).st_size
+            if size == 0:
+                os.ftruncate(self._fd, self.size)
+                os.pwrite(self._fd, header, 0)
+            elif size != self.size or os.pread(self._fd, _HEADER.size, 0) != header:
+                # Resizing a file other processes have mapped would crash them
+                # (SIGBUS) on their next access.
+                raise ValueError(
+                    "{} has another layout, remove it or use another path".format(self.path))
+            return mmap.mmap(self._fd, self.size)
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN)
+
+    def _hash(self, key):
+        digest = hashlib.blake2b(key, digest_size=8).digest()
+        # 0 marks empty slots.
+        return struct.unpack('<Q', digest)[0] or 1
+
+    def _encode_key(self, key):
+        return key if isinstance(key, bytes) else str(key).encode('utf-8')
+
+    def _bucket_offset(self, key_hash):
+        return _HEADER_SIZE + (key_hash % self.buckets) * self.ways * self.slot_size
+
+    @contextmanager
+    def _locked(self, bucket_offset):
+        bucket_size = self.ways * self.slot_size
+        with self._locks[(bucket_offset // bucket_size) % len(self._locks)]:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, bucket_size, bucket_offset)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, bucket_size, bucket_offset)
+
+    def _read_slot(self, offset, key_hash, key):
+        '''
+        Returns `(expires_at, value bytes)` if the slot at `offset` holds `key`.
+        '''
+        data = self._map
+        for _ in range(self.read_retries):
+            seq, slot_hash, expires_at, _, key_len, value_len = _SLOT.unpack_from(data, offset)
+            if seq & 1:
+                continue
+            if slot_hash != key_hash:
+                return None
+            start = offset + _SLOT_HEADER_SIZE
+            payload = data[start:start + min(key_len + value_len, self.capacity)]
+            if _SEQ.unpack_from(data, offset)[0] != seq:
+                continue
+            if payload[:key_len] != key:
+                return None
+            return expires_at, payload[key_len:]
+        return None
+
+    def _find(self, bucket_offset, key_hash, key):
+        for way in range(self.ways):
+            offset = bucket_offset + way * self.slot_size
+            found = self._read_slot(offset, key_hash, key)
+            if found is not None:
+                return offset, found
+        return None, None
+
+    def _write_slot(self, offset, key_hash, key, value, expires_at, now):
+        data = self._map
+        seq = _SEQ.unpack_from(data, offset)[0]
+        # An odd sequence means a writer died midway, keep it odd while writing.
+        start = (seq | 1) & _SEQ_MASK
+        _SEQ.pack_into(data, offset, start)
+        _SLOT.pack_into(data, offset, start, key_hash, expires_at, now, len(key), len(value))
+        if key or value:
+            begin = offset + _SLOT_HEADER_SIZE
+            data[begin:begin + len(key) + len(value)] = key + value
+        _SEQ.pack_into(data, offset, (start + 1) & _SEQ_MASK)
+
+    def _choose_slot(self, bucket_offset, key_hash, key, now):
+        # Must hold the bucket lock. Returns the slot holding `key`, else an empty
+        # or expired one, else the victim to evict.
+        victim = None
+        victim_rank = None
+        for way in range(self.ways):
+            offset = bucket_offset + way * self.slot_size
+            _, slot_hash, expires_at, written_at, key_len, _ = _SLOT.unpack_from(
+                self._map, offset)
+            if slot_hash == key_hash:
+                start = offset + _SLOT_HEADER_SIZE
+                if self._map[start:start + key_len] == key:
+                    return offset, False
+            if slot_hash == 0 or (expires_at and expires_at <= now):
+                rank = (0, 0)
+            elif expires_at:
+                rank = (1, expires_at)
+            else:
+                rank = (2, written_at)
+            if victim_rank is None or rank < victim_rank:
+                victim, victim_rank = offset, rank
+        return victim, victim_rank[0] != 0
+
+    def _live_value(self, found, now, default):
+        expires_at, payload = found
+        if expires_at and expires_at <= now:
+            return default
+        return payload if self.codec is None else self.codec.decode(payload)
+
+    def get(self, key, default=None):
+        key = self._encode_key(key)
+        key_hash = self._hash(key)
+        _, found = self._find(self._bucket_offset(key_hash), key_hash, key)
+        if found is None:
+            return default
+        return self._live_value(found, time.time(), default)
+
+    def _set(self, key, value, timeout, only_if_missing=False):
+        key = self._encode_key(key)
+        key_hash = self._hash(key)
+        if self.codec is not None:
+            value = self.codec.encode(value)
+        bucket_offset = self._bucket_offset(key_hash)
+        now = time.time()
+        expires_at = 0.0 if timeout is None else now + timeout
+        with self._locked(bucket_offset):
+            offset, evicting = self._choose_slot(bucket_offset, key_hash, key, now)
+            if only_if_missing and not evicting:
+                found = self._read_slot(offset, key_hash, key)
+                if found is not None and not (found[0] and found[0] <= now):
+                    return False
+            if len(key) + len(value) > self.capacity:
+                self.rejections += 1
+                # Don't leave an outdated value behind.
+                if self._read_slot(offset, key_hash, key) is not None:
+                    self._write_slot(offset, 0, b'', b'', 0.0, 0.0)
+                return False
+            if evicting:
+                self.evictions += 1
+            self._write_slot(offset, key_hash, key, value, expires_at, now)
+            return True
+
+    def set(self, key, value, timeout=None):
+        self._set(key, value, timeout)
+
+    def add(self, key, value, timeout=None):
+        return self._set(key, value, timeout, only_if_missing=True)
+
+    def delete(self, key):
+        key = self._encode_key(key)
+        key_hash = self._hash(key)
+        bucket_offset = self._bucket_offset(key_hash)
+        with self._locked(bucket_offset):
+            offset, _ = self._find(bucket_offset, key_hash, key)
+            if offset is not None:
+                self._write_slot(offset, 0, b'', b'', 0.0, 0.0)
+
+    def get_many(self, keys):
+        values = {}
+        for key in keys:
+            value = self.get(key, MISS)
+            if value is not MISS:
+                values[key] = value
+        return values
+
+    def __len__(self):
+        now = time.time()
+        count = 0
+        for index in range(self.buckets * self.ways):
+            _, slot_hash, expires_at, _, _, _ = _SLOT.unpack_from(
+                self._map, _HEADER_SIZE + index * self.slot_size)
+            if slot_hash and not (expires_at and expires_at <= now):
+                count += 1
+        return count
+
+    def stats(self):
+        '''
+        Returns the number of live entries and slots, and this process eviction
+        and rejection (values too large for a slot) counters.
+        '''
+        return {
+            'entries': len(self),
+            'slots': self.buckets * self.ways,
+            'evictions': self.evictions,
+            'rejections': self.rejections,
+        }
+
+    def clear(self):
+        '''
+        Removes every entry, for every process.
+        '''
+        for bucket in range(self.buckets):
+            bucket_offset = _HEADER_SIZE + bucket * self.ways * self.slot_size
+            with self._locked(bucket_offset):
+                for way in range(self.ways):
+                    offset = bucket_offset + way * self.slot_size
+                    if _SLOT.unpack_from(self._map, offset)[1]:
+                        self._write_slot(offset, 0, b'', b'', 0.0, 0.0)
+
+    def close(self, unlink=False):
+        '''
+        Unmaps the file. With `unlink=True` the file is removed too; processes
+        that already mapped it keep working on their mapping.
+        '''
+        if self._map is None:
+            return
+        self._map.close()
+        os.close(self._fd)
+        self._map = None
+        if unlink and self.path is not None:
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
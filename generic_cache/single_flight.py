@@ -0,0 +1,71 @@
+# Copyright (c) 2018, Globo.com (https://github.com/globocom)
+#
+# License: MIT
+
+import threading
+
+__all__ = [
+    'SingleFlight', 'SingleFlightTimeout',
+]
+
+
+class SingleFlightTimeout(Exception):
+    '''
+    Raised when a caller gave up waiting for another caller's computation.
+    '''
+
+
+class _Call(object):
+    __slots__ = ('event', 'value', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight(object):
+    '''
+    Collapses concurrent calls for the same key into a single call: the first
+    caller (the leader) runs the function while the others wait for its result.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func, timeout=None):
+        '''
+        Returns `func()`, making sure only one thread runs it for `key` at a time.
+        Threads arriving while it runs get the leader's result (or exception)
+        instead. If they wait more than `timeout` seconds `SingleFlightTimeout`
+        is raised.
+        '''
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            if not call.event.wait(timeout):
+                raise SingleFlightTimeout(
+                    "timed out waiting for key={} computation".format(key)
+                )
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            call.value = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.value
+
+    def in_flight(self, key):
+        return key in self._calls
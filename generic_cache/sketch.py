@@ -0,0 +1,82 @@
+# Copyright (c) 2018, Globo.com (https://github.com/globocom)
+#
+# License: MIT
+
+import random
+
+__all__ = [
+    'CountMinSketch',
+]
+
+
+class CountMinSketch(object):
+    '''
+    A small count-min sketch used to estimate how often a key was seen without
+    keeping one counter per key. Counters are periodically halved ("aged") so
+    that the estimates follow recent popularity instead of all time popularity.
+
+    Args:
+        width (int): number of counters per row. Bigger means less collisions.
+        depth (int): number of rows (independent hash functions).
+        sample_size (:obj:`int`, optional): after this many increments every
+            counter is halved. Defaults to `10 * width`.
+
+    Attributes:
+        ages (int): how many times the counters were halved.
+    '''
+
+    def __init__(self, width=1024, depth=4, sample_size=None):
+        if width <= 0 or depth <= 0:
+            raise ValueError("width and depth must be positive")
+        self.width = width
+        self.depth = depth
+        self.sample_size = sample_size or 10 * width
+        self._rows = [[0] * width for _ in range(depth)]
+        # Odd multipliers for multiply-shift hashing: the high bits of the
+        # product depend on every bit of the key hash, so rows are independent
+        # (hashing `(seed, key)` tuples gives rows that are shifts of each other).
+        generator = random.Random(depth)
+        self._seeds = [generator.getrandbits(64) | 1 for _ in range(depth)]
+        self._additions = 0
+        self.ages = 0
+
+    def _indexes(self, key):
+        width = self.width
+        hashed = hash(key) & 0xFFFFFFFFFFFFFFFF
+        return [(((hashed * seed) & 0xFFFFFFFFFFFFFFFF) >> 32) % width for seed in self._seeds]
+
+    def add(self, key, count=1):
+        '''
+        Increments the estimate for `key` and returns the new estimate.
+        '''
+        estimate = None
+        for row, index in zip(self._rows, self._indexes(key)):
+            row[index] += count
+            if estimate is None or row[index] < estimate:
+                estimate = row[index]
+        self._additions += count
+        if self._additions >= self.sample_size:
+            self.age()
+        return estimate
+
+    def estimate(self, key):
+        '''
+        Returns the estimated number of times `key` was added.
+        '''
+        return min(row[index] for row, index in zip(self._rows, self._indexes(key)))
+
+    def age(self):
+        '''
+        Halves every counter. Called automatically every `sample_size` additions.
+        '''
+        for row in self._rows:
+            for i in range(self.width):
+                row[i] >>= 1
+        self._additions = 0
+        self.ages += 1
+
+    def clear(self):
+        for row in self._rows:
+            for i in range(self.width):
+                row[i] = 0
+        self._additions = 0
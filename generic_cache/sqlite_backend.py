@@ -0,0 +1,253 @@
+# Copyright (c) 2018, Globo.com (https://github.com/globocom)
+#
+# License: MIT
+
+import sqlite3
+import threading
+import time
+import weakref
+
+from .backend import BaseBackend
+from .codec import Codec
+from .expiry import Sweeper
+
+__all__ = [
+    'SQLiteCache',
+]
+
+_DEFAULT_CODEC = object()
+# Stays below SQLite's default limit of host parameters per statement.
+_BATCH_SIZE = 500
+
+
+class _ConnectionHolder(object):
+    # Thread local values are released when their thread ends, finalizing the
+    # holder closes its connection then.
+    def __init__(self, connection):
+        self.connection = connection
+
+
+def _release(connection, connections, lock):
+    with lock:
+        connections.discard(connection)
+    connection.close()
+
+
+class SQLiteCache(BaseBackend):
+    '''
+    A persistent cache backend kept in a local SQLite database, so cached values
+    survive restarts and deploys. It can be used on its own or under an in
+    memory cache, e.g. `TieredBackend(SQLiteCache(path))`, which then warms up
+    lazily from disk after a restart (see also `load_into`).
+
+    The database runs in WAL mode, so many processes may share the file, and
+    reads go through a memory mapping of `mmap_size` bytes. Expired entries are
+    ignored when read and deleted by `compact`, which may run periodically on a
+    background thread (see `compact_interval`). Each thread gets its own
+    connection, closed when the thread ends.
+
+    Args:
+        path (str): database file. Created if needed.
+        codec (:obj:`codec.Codec`, optional): serializes the values. Defaults to
+            a pickle `Codec`. With `None` values must be bytes.
+        mmap_size (int): bytes of the database file memory mapped for reads.
+            Defaults to 256MB. `0` disables it.
+        compact_interval (:obj:`float`, optional): if given, a daemon thread
+            calls `compact` every `compact_interval` seconds. Call `close` to
+            stop it.
+        synchronous (str): SQLite `synchronous` pragma. Defaults to `'NORMAL'`,
+            which is durable enough for a cache and much faster than `'FULL'`.
+    '''
+
+    def __init__(
+        self, path, codec=_DEFAULT_CODEC, mmap_size=256 * 1024 * 1024, compact_interval=None,
+        synchronous='NORMAL',
+    ):
+        self.path = path
+        self.codec = Codec() if codec is _DEFAULT_CODEC else codec
+        self.mmap_size = mmap_size
+        self.synchronous = synchronous
+        self._local = threading.local()
+        self._connections = set()
+        self._lock = threading.Lock()
+        connection = self._connection()
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS cache ('
+            ' key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL, updated_at REAL'
+            ') WITHOUT ROWID'
+        )
+        connection.execute(
+            'CREATE INDEX IF NOT EXISTS cache_expires_at ON cache (expires_at)'
+            ' WHERE expires_at IS NOT NULL'
+        )
+        self._sweeper = None
+        if compact_interval is not None:
+            self._sweeper = Sweeper(self.compact, compact_interval)
+            self._sweeper.start()
+
+    def _connection(self):
+        # sqlite3 connections can't be shared among threads, each gets its own,
+        # closed when the thread ends.
+        holder = getattr(self._local, 'holder', None)
+        if holder is None:
+            connection = sqlite3.connect(
+                self.path, isolation_level=None, timeout=5, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous={}'.format(self.synchronous))
+            connection.execute('PRAGMA mmap_size={:d}'.format(self.mmap_size))
+            holder = self._local.holder = _ConnectionHolder(connection)
+            with self._lock:
+                self._connections.add(connection)
+            weakref.finalize(holder, _release, connection, self._connections, self._lock)
+        return holder.connection
+
+    def _encode(self, value):
+        return sqlite3.Binary(value if self.codec is None else self.codec.encode(value))
+
+    def _decode(self, value):
+        value = bytes(value)
+        return value if self.codec is None else self.codec.decode(value)
+
+    def _expires_at(self, timeout, now):
+        return None if timeout is None else now + timeout
+
+    def get(self, key, default=None):
+        row = self._connection().execute(
+            'SELECT value FROM cache WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)',
+            (key, time.time())
+        ).fetchone()
+        if row is None:
+            return default
+        return self._decode(row[0])
+
+    def set(self, key, value, timeout=None):
+        now = time.time()
+        self._connection().execute(
+            'INSERT OR REPLACE INTO cache (key, value, expires_at, updated_at) VALUES (?, ?, ?, ?)',
+            (key, self._encode(value), self._expires_at(timeout, now), now)
+        )
+
+    def delete(self, key):
+        self._connection().execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    def add(self, key, value, timeout=None):
+        now = time.time()
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute(
+                'DELETE FROM cache WHERE key = ? AND expires_at <= ?', (key, now))
+            cursor = connection.execute(
+                'INSERT OR IGNORE INTO cache (key, value, expires_at, updated_at)'
+                ' VALUES (?, ?, ?, ?)',
+                (key, self._encode(value), self._expires_at(timeout, now), now)
+            )
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        return cursor.rowcount == 1
+
+    def get_many(self, keys):
+        keys = list(keys)
+        values = {}
+        now = time.time()
+        connection = self._connection()
+        for start in range(0, len(keys), _BATCH_SIZE):
+            batch = keys[start:start + _BATCH_SIZE]
+            rows = connection.execute(
+                'SELECT key, value FROM cache WHERE key IN ({})'
+                ' AND (expires_at IS NULL OR expires_at > ?)'.format(','.join('?' * len(batch))),
+                batch + [now]
+            )
+            for key, value in rows:
+                values[key] = self._decode(value)
+        return values
+
+    def set_many(self, mapping, timeout=None):
+        '''
+        Writes every pair of `mapping` in a single transaction.
+        '''
+        now = time.time()
+        expires_at = self._expires_at(timeout, now)
+        rows = [(key, self._encode(value), expires_at, now) for key, value in mapping.items()]
+        self._in_transaction(
+            'INSERT OR REPLACE INTO cache (key, value, expires_at, updated_at) VALUES (?, ?, ?, ?)',
+            rows
+        )
+
+    def delete_many(self, keys):
+        self._in_transaction('DELETE FROM cache WHERE key = ?', [(key,) for key in keys])
+
+    def _in_transaction(self, statement, rows):
+        if not rows:
+            return
+        connection = self._connection()
+        connection.execute('BEGIN')
+        try:
+            connection.executemany(statement, rows)
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+
+    def compact(self, vacuum_ratio=0.25):
+        '''
+        Deletes the expired entries and returns how many were deleted. If the
+        free pages exceed `vacuum_ratio` of the database, it is also vacuumed to
+        give the space back.
+        '''
+        connection = self._connection()
+        deleted = connection.execute(
+            'DELETE FROM cache WHERE expires_at <= ?', (time.time(),)).rowcount
+        page_count = connection.execute('PRAGMA page_count').fetchone()[0]
+        free_pages = connection.execute('PRAGMA freelist_count').fetchone()[0]
+        if page_count and free_pages > page_count * vacuum_ratio:
+            connection.execute('VACUUM')
+        return deleted
+
+    def load_into(self, backend, limit=None):
+        '''
+        Copies the entries that are not expired into `backend` (e.g. an
+        `InMemoryCache` at startup), keeping their remaining timeouts. With
+        `limit`, only the most recently written ones. Returns how many were
+        copied.
+        '''
+        now = time.time()
+        query = (
+            'SELECT key, value, expires_at FROM cache'
+            ' WHERE expires_at IS NULL OR expires_at > ? ORDER BY updated_at DESC'
+        )
+        params = (now,)
+        if limit is not None:
+            query += ' LIMIT ?'
+            params = (now, limit)
+        rows = self._connection().execute(query, params).fetchall()
+        # Oldest first, so recency based eviction policies keep the newest.
+        for key, value, expires_at in reversed(rows):
+            timeout = None if expires_at is None else expires_at - now
+            backend.set(key, self._decode(value), timeout=timeout)
+        return len(rows)
+
+    def __len__(self):
+        return self._connection().execute(
+            'SELECT COUNT(*) FROM cache WHERE expires_at IS NULL OR expires_at > ?',
+            (time.time(),)
+        ).fetchone()[0]
+
+    def clear(self):
+        self._connection().execute('DELETE FROM cache')
+
+    def close(self):
+        '''
+        Stops the compaction thread, if any, and closes the connections.
+        '''
+        if self._sweeper is not None:
+            self._sweeper.stop()
+            self._sweeper = None
+        with self._lock:
+            connections = list(self._connections)
+            self._connections.clear()
+        for connection in connections:
+            connection.close()
+        self._local = threading.local()
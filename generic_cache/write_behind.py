@@ -0,0 +1,291 @@
+# Copyright (c) 2018, Globo.com (https://github.com/globocom)
+#
+# License: MIT
+
+import atexit
+import logging
+import threading
+from collections import OrderedDict
+
+from .backend import BaseBackend
+from .expiry import monotonic
+
+__all__ = [
+    'WriteBehindBackend',
+]
+
+_DELETED = object()
+OVERFLOW_POLICIES = ('drop_oldest', 'drop_newest', 'block', 'write_through')
+
+
+class WriteBehindBackend(BaseBackend):
+    '''
+    Wraps a backend so that writes don't wait for it: `set` and `delete` only
+    queue the operation, and a background thread writes the queue in bulk with
+    `set_many` (one call per timeout) and `delete_many`. Operations queued for
+    the same key are coalesced, the last one wins. Reads see the queued writes,
+    so a process always reads its own writes.
+
+    The worker writes when `batch_size` keys are queued or `flush_interval`
+    seconds after the first one was. Since timeouts count from the actual
+    write, values may live up to `flush_interval` seconds longer. Failed writes
+    are logged and dropped. `add` is not queued, it's atomic on the backend.
+
+    At most `max_pending` keys are queued. When full, `overflow` chooses what
+    happens to the writes of other keys:
+
+    - `'drop_oldest'`: the least recently queued write is dropped (default).
+    - `'drop_newest'`: the new write is dropped.
+    - `'block'`: the caller waits up to `block_timeout` seconds for room, then
+      drops the write.
+    - `'write_through'`: the write goes synchronously to the backend.
+
+    Deletes are never dropped, they are done synchronously instead.
+
+    Call `flush` to wait for the queued writes and `close` before exiting
+    (done automatically at interpreter exit with `flush_on_exit`).
+
+    Args:
+        backend (BaseBackend): the backend written to.
+        max_pending (int): maximum number of queued keys. Defaults to 10000.
+        batch_size (int): queued keys that trigger a write. Defaults to 100.
+        flush_interval (float): maximum seconds a write stays queued. Defaults
+            to 0.1.
+        overflow (str): one of `'drop_oldest'`, `'drop_newest'`, `'block'` and
+            `'write_through'`.
+        block_timeout (:obj:`float`, optional): seconds `'block'` waits.
+            Defaults to `None` (forever).
+        flush_on_exit (bool): flushes and closes at interpreter exit. Defaults
+            to `True`.
+
+    Attributes:
+        queued (int): operations queued.
+        coalesced (int): queued operations replaced by a newer one.
+        dropped (int): writes dropped because the queue was full.
+        written_through (int): writes done synchronously because the queue was
+            full.
+        written (int): keys written (or deleted) by the worker.
+        failed (int): keys whose write failed.
+    '''
+
+    def __init__(
+        self, backend, max_pending=10000, batch_size=100, flush_interval=0.1,
+        overflow='drop_oldest', block_timeout=None, flush_on_exit=True,
+    ):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError("overflow must be one of {}".format(', '.join(OVERFLOW_POLICIES)))
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.backend = backend
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        # A full queue is written right away too.
+        self._batch_limit = min(batch_size, max_pending)
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.queued = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.written_through = 0
+        self.written = 0
+        self.failed = 0
+        self._pending = OrderedDict()
+        self._in_flight = {}
+        self._flush_requests = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name='generic_cache-write-behind')
+        self._thread.daemon = True
+        self._thread.start()
+        self._flush_on_exit = flush_on_exit
+        if flush_on_exit:
+            atexit.register(self.close)
+
+    @property
+    def in_process(self):
+        return getattr(self.backend, 'in_process', False)
+
+    def _enqueue(self, key, operation, can_drop=True):
+        '''
+        Queues `operation` for `key`. Must hold the lock. Returns `False` if it
+        must be done synchronously instead, or was dropped.
+        '''
+        if self._closed:
+            return False
+        if key in self._pending:
+            self.coalesced += 1
+            del self._pending[key]
+        elif len(self._pending) >= self.max_pending and not self._make_room(can_drop):
+            return False
+        self._pending[key] = operation
+        self.queued += 1
+        if len(self._pending) == 1 or len(self._pending) >= self._batch_limit:
+            self._cond.notify_all()
+        return True
+
+    def _make_room(self, can_drop):
+        if self.overflow == 'drop_oldest':
+            # Deletes are never dropped.
+            for key, operation in self._pending.items():
+                if operation is not _DELETED:
+                    del self._pending[key]
+                    self.dropped += 1
+                    return True
+        if self.overflow == 'block':
+            self._cond.wait_for(
+                lambda: len(self._pending) < self.max_pending or self._closed,
+                self.block_timeout)
+            if len(self._pending) < self.max_pending and not self._closed:
+                return True
+        if can_drop and self.overflow != 'write_through':
+            self.dropped += 1
+        return False
+
+    def _queued(self, key):
+        # Lock free: the worker publishes a batch as in flight before taking it
+        # out of the queue.
+        operation = self._pending.get(key)
+        if operation is None:
+            operation = self._in_flight.get(key)
+        return operation
+
+    def get(self, key, default=None, **kwargs):
+        operation = self._queued(key)
+        if operation is None:
+            if default is not None:
+                kwargs['default'] = default
+            return self.backend.get(key, **kwargs)
+        if operation is _DELETED:
+            return default
+        return operation[0]
+
+    def set(self, key, value, timeout=None):
+        with self._cond:
+            if self._enqueue(key, (value, timeout)):
+                return
+            write_through = self._closed or self.overflow == 'write_through'
+            if write_through and not self._closed:
+                self.written_through += 1
+        if write_through:
+            self.backend.set(key, value, timeout=timeout)
+
+    def delete(self, key):
+        with self._cond:
+            if self._enqueue(key, _DELETED, can_drop=False):
+                return
+        self.backend.delete(key)
+
+    def add(self, key, value, timeout=None):
+        operation = self._queued(key)
+        if operation is not None and operation is not _DELETED:
+            return False
+        if operation is _DELETED:
+            # The backend may still hold the value being deleted.
+            self.flush()
+        return self.backend.add(key, value, timeout=timeout)
+
+    def get_many(self, keys):
+        values = {}
+        missing = []
+        for key in keys:
+            operation = self._queued(key)
+            if operation is None:
+                missing.append(key)
+            elif operation is not _DELETED:
+                values[key] = operation[0]
+        if missing:
+            values.update(self.backend.get_many(missing))
+        return values
+
+    def set_many(self, mapping, timeout=None):
+        for key, value in mapping.items():
+            self.set(key, value, timeout=timeout)
+
+    def delete_many(self, keys):
+        for key in keys:
+            self.delete(key)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending or self._closed)
+                if not self._pending:
+                    return
+                deadline = monotonic() + self.flush_interval
+                while (len(self._pending) < self._batch_limit and not self._flush_requests
+                       and not self._closed):
+                    remaining = deadline - monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._pending
+                self._in_flight = batch
+                self._pending = OrderedDict()
+                # Wakes up writers blocked on a full queue.
+                self._cond.notify_all()
+            self._write(batch)
+            with self._cond:
+                self._in_flight = {}
+                self._cond.notify_all()
+
+    def _write(self, batch):
+        groups = {}
+        deleted = []
+        for key, operation in batch.items():
+            if operation is _DELETED:
+                deleted.append(key)
+            else:
+                value, timeout = operation
+                groups.setdefault(timeout, {})[key] = value
+        for timeout, mapping in groups.items():
+            self._call(len(mapping), self.backend.set_many, mapping, timeout=timeout)
+        if deleted:
+            self._call(len(deleted), self.backend.delete_many, deleted)
+
+    def _call(self, count, method, *args, **kwargs):
+        try:
+            method(*args, **kwargs)
+        except Exception:
+            self.logger.exception("write behind failed for %s keys", count)
+            self.failed += count
+        else:
+            self.written += count
+
+    def flush(self, timeout=None):
+        '''
+        Writes the queued operations now and waits for them. Returns `False` if
+        `timeout` seconds elapsed first.
+        '''
+        with self._cond:
+            self._flush_requests += 1
+            self._cond.notify_all()
+            try:
+                return self._cond.wait_for(
+                    lambda: not self._pending and not self._in_flight, timeout)
+            finally:
+                self._flush_requests -= 1
+
+    def close(self, timeout=None):
+        '''
+        Flushes the queue and stops the worker. Writes after closing go
+        synchronously to the backend.
+        '''
+        self.flush(timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        if self._flush_on_exit:
+            atexit.unregister(self.close)
+            self._flush_on_exit = False
+
+    def stats(self):
+        return {
+            'pending': len(self._pending),
+            'queued': self.queued,
+            'coalesced': self.coalesced,
+            'dropped': self.dropped,
+            'written_through': self.written_through,
+            'written': self.written,
+            'failed': self.failed,
+        }
@@ -0,0 +1,323 @@
+# Copyright (c) 2018, Globo.com (https://github.com/globocom)
+#
+# License: MIT
+
+import asyncio
+import unittest
+
+import mock
+
+from generic_cache.aio import (
+    AsyncBaseBackend, AsyncInMemoryCache, AsyncGenericCache, AsyncCacheHandler,
+    SyncBackendAdapter,
+)
+from generic_cache.backend import MISS, InMemoryCache
+from generic_cache.cache import BaseCacheKey
+from generic_cache.codec import Codec
+from generic_cache.decorator import CacheDecorator
+from generic_cache.key_builder import BaseKeyBuilder, ArgsCacheKey
+from generic_cache.metrics import InMemoryMetrics
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+class RemoteCache(InMemoryCache):
+    # Stands for an out of process backend: values go through the codec.
+    in_process = False
+
+
+class DictBackend(AsyncBaseBackend):
+    def __init__(self):
+        self.values = {}
+
+    async def get(self, key, default=None):
+        return self.values.get(key, default)
+
+    async def set(self, key, value, timeout=None):
+        self.values[key] = value
+
+    async def delete(self, key):
+        self.values.pop(key, None)
+
+
+class PositionalKeyBuilder(BaseKeyBuilder):
+    def build_key(self, key_prefix, func, *func_args, **func_kwargs):
+        return ArgsCacheKey(key_prefix, *func_args, **func_kwargs)
+
+
+class AsyncBackendTestCase(unittest.TestCase):
+    def test_raise_not_implemented_error(self):
+        base = AsyncBaseBackend()
+        self.assertRaises(NotImplementedError, run, base.get('key'))
+        self.assertRaises(NotImplementedError, run, base.get('key', default=MISS))
+        self.assertRaises(NotImplementedError, run, base.set('key', 'value'))
+        self.assertRaises(NotImplementedError, run, base.delete('key'))
+
+    def test_async_in_memory_cache(self):
+        async def scenario():
+            cache = AsyncInMemoryCache(max_entries=10)
+            await cache.set('key', 'value', timeout=10)
+            value = await cache.get('key')
+            await cache.delete('key')
+            return value, await cache.get('key')
+        self.assertEqual(('value', None), run(scenario()))
+
+    def test_sync_adapter_in_executor(self):
+        backend = SyncBackendAdapter(InMemoryCache(), run_in_executor=True)
+
+        async def scenario():
+            await backend.set('key', 'value')
+            return await backend.get('key')
+        self.assertEqual('value', run(scenario()))
+
+
+class AsyncGenericCacheTestCase(unittest.TestCase):
+    cache_key = BaseCacheKey('async_key', timeout=10)
+
+    def setUp(self):
+        self.calls = []
+
+    async def slow(self):
+        self.calls.append(1)
+        await asyncio.sleep(0.01)
+        return 'computed'
+
+    def test_get(self):
+        generic = AsyncGenericCache(AsyncInMemoryCache())
+
+        async def scenario():
+            first = await generic.get(self.cache_key, self.slow)
+            second = await generic.get(self.cache_key, self.slow)
+            return first, second
+        self.assertEqual(('computed', 'computed'), run(scenario()))
+        self.assertEqual(1, len(self.calls))
+
+    def test_concurrent_misses_share_one_future(self):
+        generic = AsyncGenericCache(InMemoryCache())
+
+        async def scenario():
+            return await asyncio.gather(*[
+                generic.get(self.cache_key, self.slow) for _ in range(10)
+            ])
+        self.assertEqual(['computed'] * 10, run(scenario()))
+        self.assertEqual(1, len(self.calls))
+        self.assertEqual({}, generic._inflight)
+
+    def test_disable_cache(self):
+        generic = AsyncGenericCache(AsyncInMemoryCache())
+
+        async def scenario():
+            await generic.get(self.cache_key, self.slow)
+            await generic.get(self.cache_key, self.slow, disable_cache=True)
+        run(scenario())
+        self.assertEqual(2, len(self.calls))
+
+    def test_stale_value_is_refreshed_in_background(self):
+        generic = AsyncGenericCache(AsyncInMemoryCache())
+
+        async def scenario():
+            await generic.get(self.cache_key, self.slow, stale_ttl=-1)
+            stale = await generic.get(self.cache_key, self.slow, stale_ttl=-1)
+            await asyncio.sleep(0.05)
+            return stale
+        self.assertEqual('computed', run(scenario()))
+        self.assertEqual(2, len(self.calls))
+
+    def test_early_expiration(self):
+        generic = AsyncGenericCache(AsyncInMemoryCache())
+        key = BaseCacheKey('async_early_key', timeout=0.1)
+
+        async def scenario():
+            await generic.get(key, self.slow, early_expiration_beta=1)
+            entry = await generic.cache_backend.get(key.key_str)
+            self.assertGreater(entry.delta, 0)
+            # -log(1e-12) * delta is well beyond the 0.1 seconds left.
+            with mock.patch('generic_cache.cache.random.random', return_value=1 - 1e-12):
+                return await generic.get(key, self.slow, early_expiration_beta=1)
+        self.assertEqual('computed', run(scenario()))
+        self.assertEqual(2, len(self.calls))
+
+    def test_failed_refresh_is_logged_and_counted(self):
+        generic = AsyncGenericCache(AsyncInMemoryCache())
+
+        async def failing():
+            raise ValueError()
+
+        async def scenario():
+            await generic.get(self.cache_key, self.slow, stale_ttl=-1)
+            with mock.patch.object(generic.logger, 'error') as error:
+                stale = await generic.get(self.cache_key, failing, stale_ttl=-1)
+                await asyncio.sleep(0.01)
+            self.assertEqual(1, error.call_count)
+            return stale
+        self.assertEqual('computed', run(scenario()))
+        self.assertEqual(1, generic.refreshes_failed)
+        self.assertEqual(0, generic.pending_refreshes())
+
+    def test_pending_refreshes_are_capped(self):
+        generic = AsyncGenericCache(AsyncInMemoryCache(), max_pending_refreshes=1)
+        keys = [BaseCacheKey('stale_{}'.format(i), timeout=10) for i in range(3)]
+
+        async def scenario():
+            for key in keys:
+                await generic.set(key, 'stale', stale_ttl=-1)
+            for key in keys:
+                await generic.get(key, self.slow, stale_ttl=-1)
+            self.assertEqual(1, generic.pending_refreshes())
+            await asyncio.sleep(0.05)
+        run(scenario())
+        self.assertEqual(1, len(self.calls))
+        self.assertEqual(2, generic.refreshes_rejected)
+
+    def test_generic_cache_options(self):
+        backend = RemoteCache()
+        metrics = InMemoryMetrics()
+        generic = AsyncGenericCache(
+            backend, codec=Codec(), metrics=metrics, negative_timeout=5)
+
+        async def none():
+            self.calls.append(1)
+
+        async def scenario():
+            await generic.get(self.cache_key, self.slow)
+            await generic.get(self.cache_key, self.slow)
+            await generic.get(BaseCacheKey('none', timeout=10), none)
+            return await generic.get(BaseCacheKey('none', timeout=10), none)
+        self.assertIsNone(run(scenario()))
+        self.assertEqual(2, len(self.calls))
+        self.assertIsInstance(backend.get(self.cache_key.key_str), bytes)
+        self.assertEqual(1, metrics.counter('hits', 'async_key'))
+        self.assertEqual(1, metrics.counter('misses', 'async_key'))
+        self.assertEqual(1, metrics.counter('hits', 'none'))
+        self.assertEqual(1, metrics.counter('sets', 'none'))
+
+    def test_custom_backend_caches_none(self):
+        backend = DictBackend()
+        generic = AsyncGenericCache(backend, negative_timeout=5)
+
+        async def none():
+            self.calls.append(1)
+
+        async def scenario():
+            await generic.get(self.cache_key, none)
+            return await generic.get(self.cache_key, none)
+        self.assertIsNone(run(scenario()))
+        self.assertEqual(1, len(self.calls))
+        self.assertEqual({self.cache_key.key_str: None}, backend.values)
+
+    def test_single_flight_timeout(self):
+        generic = AsyncGenericCache(
+            AsyncInMemoryCache(), single_flight_timeout=0.01,
+            single_flight_fallback=lambda key: 'fallback')
+
+        async def slower():
+            await asyncio.sleep(0.1)
+            return 'computed'
+
+        async def scenario():
+            value = await generic.get(self.cache_key, slower)
+            # The shared computation goes on for later callers.
+            await asyncio.sleep(0.15)
+            return value, await generic.get_from_cache(self.cache_key)
+        self.assertEqual(('fallback', 'computed'), run(scenario()))
+
+    def test_unsupported_options(self):
+        self.assertRaises(
+            ValueError, AsyncGenericCache, AsyncInMemoryCache(), single_flight_lock=True)
+        self.assertRaises(
+            ValueError, AsyncGenericCache, AsyncInMemoryCache(), refresh_executor=mock.Mock())
+
+    def test_flush(self):
+        generic = AsyncGenericCache(AsyncInMemoryCache())
+
+        async def scenario():
+            await generic.set(self.cache_key, 'value')
+            await generic.flush(self.cache_key)
+            return await generic.get_from_cache(self.cache_key)
+        self.assertIsNone(run(scenario()))
+
+
+class AsyncDecoratorTestCase(unittest.TestCase):
+    def test_coroutine_functions_are_detected(self):
+        calls = []
+        cache_dec = CacheDecorator("Test.", InMemoryCache(), PositionalKeyBuilder())
+
+        @cache_dec('async_sum')
+        async def async_sum(a, b):
+            calls.append(1)
+            await asyncio.sleep(0)
+            return a + b
+
+        self.assertIsInstance(async_sum.cache, AsyncCacheHandler)
+
+        async def scenario():
+            results = await asyncio.gather(async_sum(1, 2), async_sum(1, 2))
+            cached = await async_sum.cache.get(1, 2)
+            await async_sum.cache.flush(1, 2)
+            flushed = await async_sum.cache.get(1, 2)
+            return results, cached, flushed
+        self.assertEqual(([3, 3], 3, None), run(scenario()))
+        self.assertEqual(1, len(calls))
+
+    def test_async_backend(self):
+        cache_dec = CacheDecorator("Test.", AsyncInMemoryCache(), PositionalKeyBuilder())
+
+        @cache_dec('async_identity')
+        async def async_identity(a):
+            return a
+        self.assertEqual(1, run(async_identity(1)))
+        self.assertEqual(1, run(async_identity.cache.get(1)))
+
+    def test_generic_cache_options_are_forwarded(self):
+        backend = RemoteCache()
+        calls = []
+        cache_dec = CacheDecorator(
+            "Test.", backend, PositionalKeyBuilder(), codec=Codec(), cache_none=True)
+
+        @cache_dec('async_none')
+        async def async_none(a):
+            calls.append(a)
+
+        @cache_dec('sync_identity')
+        def sync_identity(a):
+            return a
+
+        self.assertIsNone(run(async_none(1)))
+        self.assertIsNone(run(async_none(1)))
+        self.assertEqual([1], calls)
+        sync_identity(1)
+        # Both flavors write the same encoding.
+        self.assertIsInstance(backend.get('Test.async_none__1'), bytes)
+        self.assertIsInstance(backend.get('Test.sync_identity__1'), bytes)
+
+    def test_unsupported_options_fail_at_decoration(self):
+        cache_dec = CacheDecorator(
+            "Test.", InMemoryCache(), PositionalKeyBuilder(), single_flight_lock=True)
+
+        async def identity(a):
+            return a
+        self.assertRaises(ValueError, cache_dec('identity'), identity)
+
+    def test_sync_function_with_async_backend_is_rejected(self):
+        cache_dec = CacheDecorator("Test.", AsyncInMemoryCache(), PositionalKeyBuilder())
+
+        def identity(a):
+            return a
+        self.assertRaises(ValueError, cache_dec('identity'), identity)
+
+    def test_namespace_generations_are_rejected(self):
+        self.assertRaises(
+            ValueError, CacheDecorator, "Test.", AsyncInMemoryCache(), PositionalKeyBuilder(),
+            namespace_generations=True)
+        cache_dec = CacheDecorator(
+            "Test.", InMemoryCache(), PositionalKeyBuilder(), namespace_generations=True)
+
+        async def identity(a):
+            return a
+        self.assertRaises(ValueError, cache_dec('identity'), identity)
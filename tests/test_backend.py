@@ -0,0 +1,395 @@
+# Copyright (c) 2018, Globo.com (https://github.com/globocom)
+#
+# License: MIT
+
+import threading
+import time
+import unittest
+
+import mock
+
+from generic_cache.backend import (
+    MISS, BaseBackend, InMemoryCache, ShardedInMemoryCache, TieredBackend,
+)
+from generic_cache.cache import GenericCache, BaseCacheKey
+from generic_cache.eviction import LRUPolicy, LFUPolicy, TinyLFUPolicy, get_policy
+
+
+class InMemoryCacheTestCase(unittest.TestCase):
+    def test_unbounded_cache_keeps_every_key(self):
+        cache = InMemoryCache()
+        for i in range(100):
+            cache.set(i, i)
+        self.assertEqual(100, len(cache))
+        self.assertEqual(0, cache.stats()['evictions'])
+
+    def test_get_default(self):
+        cache = InMemoryCache()
+        cache.set('none', None)
+        cache.set('expired', 1, timeout=-1)
+        self.assertIsNone(cache.get('none', default=MISS))
+        self.assertIs(MISS, cache.get('missing', default=MISS))
+        self.assertIs(MISS, cache.get('expired', default=MISS))
+
+    def test_expired_key_is_removed_on_get(self):
+        cache = InMemoryCache()
+        cache.set('key', 'value', timeout=-1)
+        self.assertIsNone(cache.get('key'))
+        self.assertEqual(0, len(cache))
+
+    def test_max_entries_lru(self):
+        cache = InMemoryCache(max_entries=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(1, cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(3, cache.get('c'))
+        self.assertEqual(1, cache.stats()['evictions'])
+
+    def test_max_entries_lfu(self):
+        cache = InMemoryCache(max_entries=2, eviction_policy='lfu')
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.get('a')
+        cache.get('b')
+        cache.set('c', 3)
+        self.assertEqual(1, cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(3, cache.get('c'))
+
+    def test_overwrite_does_not_evict(self):
+        cache = InMemoryCache(max_entries=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.set('a', 10)
+        self.assertEqual(10, cache.get('a'))
+        self.assertEqual(2, cache.get('b'))
+
+    def test_max_bytes(self):
+        cache = InMemoryCache(max_bytes=10, sizeof=lambda key, value: len(value))
+        cache.set('a', 'xxxx')
+        cache.set('b', 'xxxx')
+        cache.set('c', 'xxxx')
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(8, cache.stats()['bytes'])
+        cache.set('big', 'x' * 11)
+        self.assertIsNone(cache.get('big'))
+        self.assertEqual(1, cache.stats()['rejections'])
+
+    def test_delete_releases_bytes(self):
+        cache = InMemoryCache(max_bytes=10, sizeof=lambda key, value: len(value))
+        cache.set('a', 'xxxx')
+        cache.delete('a')
+        cache.delete('a')
+        self.assertEqual(0, cache.stats()['bytes'])
+
+    def test_tinylfu_rejects_one_hit_wonders(self):
+        cache = InMemoryCache(max_entries=1, eviction_policy='tinylfu')
+        cache.set('hot', 1)
+        for _ in range(5):
+            cache.get('hot')
+        cache.set('cold', 2)
+        self.assertEqual(1, cache.get('hot'))
+        self.assertIsNone(cache.get('cold'))
+        self.assertEqual(1, cache.stats()['rejections'])
+
+    def test_works_with_generic_cache(self):
+        generic = GenericCache(InMemoryCache(max_entries=1))
+        key = BaseCacheKey('key')
+        self.assertEqual('value', generic.get(key, lambda: 'value'))
+        self.assertEqual('value', generic.get(key, lambda: 'other'))
+
+
+class DictBackend(BaseBackend):
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, timeout=None):
+        self.data[key] = value
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+
+class BatchOperationsTestCase(unittest.TestCase):
+    def _test_batch_operations(self, backend):
+        backend.set_many({'a': 1, 'b': 2}, timeout=10)
+        self.assertEqual({'a': 1, 'b': 2}, backend.get_many(['a', 'b', 'c']))
+        backend.delete_many(['a', 'd'])
+        self.assertEqual({'b': 2}, backend.get_many(['a', 'b']))
+
+    def test_base_backend_fallbacks(self):
+        self._test_batch_operations(DictBackend())
+
+    def test_in_memory_cache(self):
+        self._test_batch_operations(InMemoryCache())
+        self._test_batch_operations(InMemoryCache(max_entries=10, eviction_policy='lfu'))
+
+    def test_in_memory_cache_get_many_returns_cached_none(self):
+        cache = InMemoryCache()
+        cache.set('none', None)
+        self.assertEqual({'none': None}, cache.get_many(['none', 'missing']))
+
+    def test_in_memory_cache_get_many_skips_expired(self):
+        cache = InMemoryCache()
+        cache.set_many({'a': 1, 'b': 2}, timeout=-1)
+        cache.set('c', 3)
+        self.assertEqual({'c': 3}, cache.get_many(['a', 'b', 'c']))
+        self.assertEqual(2, cache.stats()['expired_entries'])
+
+
+class ShardedInMemoryCacheTestCase(unittest.TestCase):
+    def test_single_key_operations(self):
+        cache = ShardedInMemoryCache(shards=4)
+        cache.set('key', 'value', timeout=10)
+        self.assertEqual('value', cache.get('key'))
+        self.assertFalse(cache.add('key', 'other'))
+        cache.delete('key')
+        self.assertIs(MISS, cache.get('key', MISS))
+        self.assertTrue(cache.add('key', 'other'))
+        cache.set('none', None)
+        self.assertIsNone(cache.get('none', MISS))
+
+    def test_keys_are_spread_among_shards(self):
+        cache = ShardedInMemoryCache(shards=4)
+        for i in range(100):
+            cache.set(i, i)
+        self.assertEqual(100, len(cache))
+        self.assertEqual([25] * 4, [len(shard) for shard in cache._shards])
+
+    def test_batch_operations(self):
+        cache = ShardedInMemoryCache(shards=4)
+        mapping = dict(('key_{}'.format(i), i) for i in range(20))
+        cache.set_many(mapping, timeout=10)
+        self.assertEqual(mapping, cache.get_many(list(mapping) + ['missing']))
+        cache.delete_many(['key_{}'.format(i) for i in range(10)])
+        self.assertEqual(
+            dict(('key_{}'.format(i), i) for i in range(10, 20)), cache.get_many(mapping))
+
+    def test_limits_are_split_among_shards(self):
+        cache = ShardedInMemoryCache(shards=4, max_entries=40, eviction_policy=LFUPolicy)
+        self.assertEqual([10] * 4, [shard.max_entries for shard in cache._shards])
+        self.assertIsInstance(cache._shards[0]._policy, LFUPolicy)
+        self.assertIsNot(cache._shards[0]._policy, cache._shards[1]._policy)
+        for i in range(100):
+            cache.set(i, i)
+        self.assertEqual(40, len(cache))
+        self.assertEqual(60, cache.stats()['evictions'])
+
+    def test_policy_instances_are_rejected(self):
+        self.assertRaises(ValueError, ShardedInMemoryCache, max_entries=10, eviction_policy=LRUPolicy())
+        self.assertRaises(ValueError, ShardedInMemoryCache, shards=0)
+
+    def test_purge_expired(self):
+        clock = FakeClock()
+        cache = ShardedInMemoryCache(shards=4, reclaim_batch=0, clock=clock)
+        for i in range(10):
+            cache.set(i, i, timeout=1)
+        cache.set('forever', 1)
+        clock.now += 2
+        self.assertEqual(10, cache.purge_expired())
+        self.assertEqual(1, len(cache))
+
+    def test_concurrent_writers(self):
+        cache = ShardedInMemoryCache(shards=8, max_entries=800)
+
+        def write(offset):
+            for i in range(2000):
+                cache.set((offset, i), i, timeout=10)
+                cache.get((offset, i - 1))
+
+        threads = [threading.Thread(target=write, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(800, len(cache))
+        self.assertEqual(8 * 2000 - 800, cache.stats()['evictions'])
+
+
+class TieredBackendTestCase(unittest.TestCase):
+    def setUp(self):
+        self.l2 = InMemoryCache()
+        self.backend = TieredBackend(self.l2, l1_max_entries=2, l1_timeout=10)
+
+    def test_set_writes_both_tiers(self):
+        self.backend.set('key', 'value', timeout=100)
+        self.assertEqual('value', self.backend.l1.get('key'))
+        self.assertEqual('value', self.l2.get('key'))
+        self.assertEqual('value', self.backend.get('key'))
+        self.assertEqual(1, self.backend.stats()['l1_hits'])
+
+    def test_l2_hits_are_promoted(self):
+        self.l2.set('key', 'value')
+        self.assertEqual('value', self.backend.get('key'))
+        self.assertEqual('value', self.backend.get('key'))
+        self.assertIsNone(self.backend.get('missing'))
+        self.assertEqual(
+            {'l1_hits': 1, 'l2_hits': 1, 'misses': 1,
+             'l1_hit_rate': 1 / 3.0, 'l2_hit_rate': 0.5},
+            self.backend.stats())
+
+    def test_l1_timeout_caps_l1_entries(self):
+        l1 = mock.Mock(wraps=InMemoryCache())
+        backend = TieredBackend(self.l2, l1=l1, l1_timeout=10)
+        backend.set('a', 1, timeout=100)
+        l1.set.assert_called_with('a', 1, timeout=10)
+        backend.set('b', 1, timeout=5)
+        l1.set.assert_called_with('b', 1, timeout=5)
+        backend.set('c', 1, timeout=100, l1_timeout=1)
+        l1.set.assert_called_with('c', 1, timeout=1)
+
+    def test_delete(self):
+        self.backend.set('key', 'value')
+        self.backend.delete('key')
+        self.assertIsNone(self.backend.get('key'))
+        self.assertIsNone(self.l2.get('key'))
+
+    def test_cached_none(self):
+        self.backend.set('none', None)
+        self.assertIs(MISS, self.backend.get('missing', default=MISS))
+        self.assertIsNone(self.backend.get('none', default=MISS))
+
+    def test_batch_operations(self):
+        self.backend.set('a', 1)
+        self.l2.set_many({'b': 2, 'c': 3})
+        self.assertEqual({'a': 1, 'b': 2, 'c': 3}, self.backend.get_many(['a', 'b', 'c', 'd']))
+        self.assertEqual(1, self.backend.stats()['misses'])
+        self.backend.delete_many(['a', 'b'])
+        self.assertEqual({'c': 3}, self.backend.get_many(['a', 'b', 'c']))
+
+    def test_with_decorator(self):
+        from generic_cache.decorator import CacheDecorator
+        from generic_cache.key_builder import FunctionKeyBuilder
+        l1 = mock.Mock(wraps=InMemoryCache())
+        cache_dec = CacheDecorator(
+            "Test.", TieredBackend(self.l2, l1=l1), FunctionKeyBuilder(), default_timeout=60)
+
+        @cache_dec('identity', cache_kwargs={'l1_timeout': 2})
+        def identity(a):
+            return a
+        identity(1)
+        l1.set.assert_called_once_with('Test.identity__a_1', 1, timeout=2)
+        self.assertEqual(1, self.l2.get('Test.identity__a_1'))
+
+    def test_released_lock_is_taken_over(self):
+        import threading
+        import time
+        from generic_cache.cache import BaseCacheKey, GenericCache
+        # Two tiered backends sharing L2 act like two processes.
+        other = TieredBackend(self.l2, l1_timeout=10)
+        cache_key = BaseCacheKey('key', timeout=60)
+        lock_key = cache_key.key_str + GenericCache.lock_suffix
+        # The other process fails without writing a value.
+        other.add(lock_key, 1, timeout=3600)
+        threading.Timer(0.1, other.delete, [lock_key]).start()
+        generic = GenericCache(
+            self.backend, single_flight=True, single_flight_lock=True, single_flight_timeout=2)
+        generic.lock_poll_interval = 0.01
+        start = time.time()
+        self.assertEqual('computed', generic.get(cache_key, lambda: 'computed'))
+        self.assertLess(time.time() - start, 1)
+        self.assertIsNone(self.backend.l1.get(lock_key))
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class InMemoryCacheExpiryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def test_get_respects_deadline(self):
+        cache = InMemoryCache(clock=self.clock)
+        cache.set('key', 'value', timeout=10)
+        self.clock.now += 9
+        self.assertEqual('value', cache.get('key'))
+        self.clock.now += 1
+        self.assertIsNone(cache.get('key'))
+        self.assertEqual(1, cache.stats()['expired_entries'])
+
+    def test_set_reclaims_expired_entries_incrementally(self):
+        cache = InMemoryCache(clock=self.clock, reclaim_batch=2)
+        for i in range(5):
+            cache.set(i, 'value', timeout=1)
+        self.clock.now += 2
+        cache.set('new', 'value')
+        self.assertEqual(4, len(cache))
+        cache.set('other', 'value')
+        self.assertEqual(3, len(cache))
+        stats = cache.stats()
+        self.assertEqual(4, stats['expired_entries'])
+        self.assertTrue(stats['expired_bytes'] > 0)
+
+    def test_overwritten_deadline_is_ignored(self):
+        cache = InMemoryCache(clock=self.clock)
+        cache.set('key', 'value', timeout=1)
+        cache.set('key', 'value', timeout=100)
+        self.clock.now += 2
+        self.assertEqual(0, cache.purge_expired())
+        self.assertEqual('value', cache.get('key'))
+
+    def test_purge_expired(self):
+        cache = InMemoryCache(clock=self.clock, reclaim_batch=0)
+        for i in range(5):
+            cache.set(i, 'value', timeout=i + 1)
+        cache.set('forever', 'value')
+        self.clock.now += 3
+        self.assertEqual(3, cache.purge_expired())
+        self.assertEqual(3, len(cache))
+
+    def test_expiry_heap_does_not_grow_with_rewrites(self):
+        cache = InMemoryCache(clock=self.clock)
+        for _ in range(1000):
+            cache.set('key', 'value', timeout=10)
+        self.assertTrue(len(cache._expiry) <= 66)
+
+    def test_keys_sharing_a_deadline_need_not_be_comparable(self):
+        cache = InMemoryCache(clock=self.clock)
+        cache.set_many({1: 'a', 'b': 2, (3,): 'c'}, timeout=10)
+        self.assertEqual({1: 'a', 'b': 2, (3,): 'c'}, cache.get_many([1, 'b', (3,)]))
+        self.clock.now += 11
+        self.assertEqual(3, cache.purge_expired())
+
+    def test_sweeper_thread(self):
+        cache = InMemoryCache(sweep_interval=0.01)
+        try:
+            cache.set('key', 'value', timeout=0.01)
+            deadline = time.time() + 2
+            while len(cache) and time.time() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(0, len(cache))
+            self.assertEqual(1, cache.stats()['expired_entries'])
+        finally:
+            cache.close()
+
+
+class EvictionPolicyTestCase(unittest.TestCase):
+    def test_get_policy(self):
+        self.assertIsInstance(get_policy('lru'), LRUPolicy)
+        self.assertIsInstance(get_policy('lfu'), LFUPolicy)
+        self.assertIsInstance(get_policy('tinylfu'), TinyLFUPolicy)
+        policy = LFUPolicy()
+        self.assertIs(policy, get_policy(policy))
+        self.assertRaises(ValueError, get_policy, 'fifo')
+
+    def test_lfu_victim_after_arbitrary_removal(self):
+        policy = LFUPolicy()
+        policy.record_insert('a')
+        policy.record_insert('b')
+        policy.record_access('b')
+        policy.record_remove('a')
+        self.assertEqual('b', policy.victim())
+        policy.record_remove('b')
+        self.assertIsNone(policy.victim())
@@ -5,9 +5,9 @@
 import unittest
 import mock
 from generic_cache.cache import (
-    GenericCache, BaseCacheKey, ArgsCacheKey,
+    GenericCache, BaseCacheKey, ArgsCacheKey, CacheEntry, jitter_timeout,
 )
-from generic_cache.backend import BaseBackend, InMemoryCache
+from generic_cache.backend import MISS, BaseBackend, InMemoryCache
 
 
 class MockedCachedBacked(BaseBackend):
@@ -94,3 +94,433 @@ class TestGenericCache(CacheBaseTestCase):
         self.assertRaises(NotImplementedError, base.get, "key")
         self.assertRaises(NotImplementedError, base.set, "key", "value")
         self.assertRaises(NotImplementedError, base.delete, "key")
+
+
+class TestGenericCacheSingleFlight(unittest.TestCase):
+    cache_key = BaseCacheKey('single_flight_key', timeout=10)
+
+    def _run_concurrently(self, target, count=8):
+        import threading
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(target()))
+            for _ in range(count)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def _slow_func(self, calls, delay=0.1):
+        import time
+
+        def func():
+            calls.append(1)
+            time.sleep(delay)
+            return 'computed'
+        return func
+
+    def test_concurrent_misses_compute_once(self):
+        generic = GenericCache(InMemoryCache(), single_flight=True)
+        calls = []
+        func = self._slow_func(calls)
+        results = self._run_concurrently(lambda: generic.get(self.cache_key, func))
+        self.assertEqual(['computed'] * 8, results)
+        self.assertEqual(1, len(calls))
+
+    def test_disabled_by_default(self):
+        generic = GenericCache(InMemoryCache())
+        calls = []
+        func = self._slow_func(calls)
+        self._run_concurrently(lambda: generic.get(self.cache_key, func))
+        self.assertTrue(len(calls) > 1)
+
+    def test_per_call_override(self):
+        generic = GenericCache(InMemoryCache())
+        calls = []
+        func = self._slow_func(calls)
+        self._run_concurrently(
+            lambda: generic.get(self.cache_key, func, single_flight=True))
+        self.assertEqual(1, len(calls))
+
+    def test_wait_timeout_uses_fallback(self):
+        generic = GenericCache(
+            InMemoryCache(), single_flight=True, single_flight_timeout=0.01,
+            single_flight_fallback=lambda key: 'fallback',
+        )
+        calls = []
+        func = self._slow_func(calls, delay=0.3)
+        results = self._run_concurrently(lambda: generic.get(self.cache_key, func), 4)
+        self.assertEqual(1, len(calls))
+        self.assertEqual(['computed', 'fallback', 'fallback', 'fallback'], sorted(results))
+
+    def test_leader_error_is_propagated(self):
+        generic = GenericCache(InMemoryCache(), single_flight=True)
+
+        def func():
+            raise ValueError()
+        self.assertRaises(ValueError, generic.get, self.cache_key, func)
+        self.assertEqual('ok', generic.get(self.cache_key, lambda: 'ok'))
+
+    def test_backend_lock_collapses_across_instances(self):
+        # Two GenericCache instances sharing a backend act like two processes.
+        backend = InMemoryCache()
+        generics = [
+            GenericCache(backend, single_flight=True, single_flight_lock=True)
+            for _ in range(4)
+        ]
+        for generic in generics:
+            generic.lock_poll_interval = 0.01
+        calls = []
+        func = self._slow_func(calls)
+        instances = iter(generics * 2)
+        results = self._run_concurrently(
+            lambda: next(instances).get(self.cache_key, func))
+        self.assertEqual(['computed'] * 8, results)
+        self.assertEqual(1, len(calls))
+        self.assertIsNone(backend.get(self.cache_key.key_str + GenericCache.lock_suffix))
+
+    def test_lock_released_without_value_is_taken_over(self):
+        import threading
+        import time
+        backend = InMemoryCache()
+        lock_key = self.cache_key.key_str + GenericCache.lock_suffix
+        # Another process holding the lock fails without writing a value.
+        backend.add(lock_key, 1, timeout=3600)
+        threading.Timer(0.1, backend.delete, [lock_key]).start()
+        generic = GenericCache(backend, single_flight=True, single_flight_lock=True)
+        generic.lock_poll_interval = 0.01
+        start = time.time()
+        self.assertEqual('computed', generic.get(self.cache_key, lambda: 'computed'))
+        self.assertLess(time.time() - start, 1)
+        self.assertIsNone(backend.get(lock_key))
+
+    def test_lock_wait_is_bounded_by_single_flight_timeout(self):
+        import time
+        backend = InMemoryCache()
+        cache_key = BaseCacheKey('key', timeout=3600)
+        backend.add(cache_key.key_str + GenericCache.lock_suffix, 1, timeout=3600)
+        generic = GenericCache(
+            backend, single_flight=True, single_flight_lock=True, single_flight_timeout=0.1,
+            single_flight_fallback=lambda key: 'fallback')
+        generic.lock_poll_interval = 0.01
+        start = time.time()
+        self.assertEqual('fallback', generic.get(cache_key, lambda: 'computed'))
+        self.assertLess(time.time() - start, 1)
+
+    def test_lock_timeout_does_not_follow_key_timeout(self):
+        backend = mock.Mock(wraps=InMemoryCache())
+        generic = GenericCache(backend, single_flight=True, single_flight_lock=True)
+        generic.get(BaseCacheKey('key', timeout=3600), lambda: 'computed')
+        backend.add.assert_called_once_with(
+            'key' + GenericCache.lock_suffix, GenericCache.lock_value, timeout=30)
+
+    def test_backend_add(self):
+        backend = InMemoryCache()
+        self.assertTrue(backend.add('key', 1))
+        self.assertFalse(backend.add('key', 2))
+        self.assertEqual(1, backend.get('key'))
+        backend.set('expired', 1, timeout=-1)
+        self.assertTrue(backend.add('expired', 2))
+        self.assertRaises(NotImplementedError, BaseBackend().add, 'key', 1)
+
+
+class TestGenericCacheStaleWhileRevalidate(unittest.TestCase):
+    cache_key = BaseCacheKey('stale_key', timeout=100)
+
+    def _wait_refreshes(self, executor):
+        import time
+        deadline = time.time() + 2
+        while executor.pending() and time.time() < deadline:
+            time.sleep(0.01)
+
+    def test_concurrent_stale_hits_share_one_executor(self):
+        import threading
+        import time
+        from generic_cache.refresh import RefreshExecutor
+        created = []
+
+        def slow_executor():
+            time.sleep(0.05)
+            created.append(RefreshExecutor())
+            return created[-1]
+        generic = GenericCache(InMemoryCache())
+        keys = [BaseCacheKey('stale_{}'.format(i), timeout=100) for i in range(4)]
+        for key in keys:
+            generic.set(key, 'stale', stale_ttl=-1)
+        with mock.patch('generic_cache.cache.RefreshExecutor', side_effect=slow_executor):
+            threads = [
+                threading.Thread(target=generic.get, args=(key, lambda: 'fresh'),
+                                 kwargs={'stale_ttl': -1})
+                for key in keys]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(1, len(created))
+        generic.refresh_executor.shutdown()
+        self.assertEqual(4, generic.refresh_executor.stats()['queued'])
+
+    def test_fresh_value_is_returned_without_refresh(self):
+        generic = GenericCache(InMemoryCache())
+        generic.get(self.cache_key, lambda: 'first', stale_ttl=10)
+        self.assertEqual('first', generic.get(self.cache_key, lambda: 'second', stale_ttl=10))
+        self.assertIsNone(generic.refresh_executor)
+
+    def test_stale_value_is_returned_and_refreshed(self):
+        from generic_cache.refresh import RefreshExecutor
+        executor = RefreshExecutor(max_workers=1)
+        generic = GenericCache(InMemoryCache(), refresh_executor=executor)
+        generic.get(self.cache_key, lambda: 'first', stale_ttl=-1)
+        self.assertEqual('first', generic.get(self.cache_key, lambda: 'second', stale_ttl=-1))
+        self._wait_refreshes(executor)
+        self.assertEqual('second', generic.get_from_cache(self.cache_key))
+        self.assertEqual(1, executor.stats()['queued'])
+        self.assertEqual(1, executor.stats()['completed'])
+        executor.shutdown()
+
+    def test_refreshes_are_deduplicated(self):
+        import threading
+        from generic_cache.refresh import RefreshExecutor
+        executor = RefreshExecutor(max_workers=1)
+        generic = GenericCache(InMemoryCache(), refresh_executor=executor)
+        generic.get(self.cache_key, lambda: 'first', stale_ttl=-1)
+        release = threading.Event()
+
+        def slow():
+            release.wait(2)
+            return 'second'
+        for _ in range(3):
+            self.assertEqual('first', generic.get(self.cache_key, slow, stale_ttl=-1))
+        release.set()
+        self._wait_refreshes(executor)
+        stats = executor.stats()
+        self.assertEqual(1, stats['queued'])
+        self.assertEqual(2, stats['deduplicated'])
+        executor.shutdown()
+
+    def test_failed_refresh_is_counted(self):
+        from generic_cache.refresh import RefreshExecutor
+        executor = RefreshExecutor(max_workers=1)
+        generic = GenericCache(InMemoryCache(), refresh_executor=executor)
+        generic.get(self.cache_key, lambda: 'first', stale_ttl=-1)
+
+        def fail():
+            raise ValueError()
+        self.assertEqual('first', generic.get(self.cache_key, fail, stale_ttl=-1))
+        self._wait_refreshes(executor)
+        self.assertEqual(1, executor.stats()['failed'])
+        self.assertEqual('first', generic.get_from_cache(self.cache_key))
+        executor.shutdown()
+
+    def test_rejected_when_queue_is_full(self):
+        from generic_cache.refresh import RefreshExecutor
+        executor = RefreshExecutor(max_pending=0)
+        self.assertFalse(executor.submit('key', lambda: None))
+        self.assertEqual(1, executor.stats()['rejected'])
+
+
+class TestGenericCacheEarlyExpiration(unittest.TestCase):
+    cache_key = BaseCacheKey('early_key', timeout=100)
+
+    def test_compute_time_is_stored(self):
+        import time
+        backend = InMemoryCache()
+        generic = GenericCache(backend)
+        generic.get(self.cache_key, lambda: 'value', early_expiration_beta=1)
+        entry = backend.get(self.cache_key.key_str)
+        self.assertIsInstance(entry, CacheEntry)
+        self.assertGreaterEqual(entry.delta, 0)
+        self.assertAlmostEqual(time.time() + 100, entry.expires_at, delta=1)
+        self.assertIsNone(entry.stale_at)
+
+    def test_expires_early(self):
+        with mock.patch('generic_cache.cache.random.random', return_value=0.5):
+            # -log(0.5) * delta is about 0.69 seconds.
+            self.assertTrue(CacheEntry('value', delta=1, expires_at=100.5).expires_early(now=100))
+            self.assertFalse(CacheEntry('value', delta=1, expires_at=101).expires_early(now=100))
+            self.assertTrue(
+                CacheEntry('value', delta=1, expires_at=101).expires_early(beta=2, now=100))
+            self.assertFalse(CacheEntry('value', expires_at=100.5).expires_early(now=100))
+
+    def test_value_expiring_early_is_recomputed(self):
+        import time
+        backend = InMemoryCache()
+        generic = GenericCache(backend)
+        backend.set(
+            self.cache_key.key_str, CacheEntry('old', delta=10, expires_at=time.time() + 1))
+        self.assertEqual('old', generic.get(self.cache_key, lambda: 'new'))
+        with mock.patch('generic_cache.cache.random.random', return_value=0.5):
+            self.assertEqual('new', generic.get(
+                self.cache_key, lambda: 'new', early_expiration_beta=1))
+        self.assertEqual('new', generic.get_from_cache(self.cache_key))
+
+    def test_fresh_value_is_not_recomputed(self):
+        generic = GenericCache(InMemoryCache())
+        generic.get(self.cache_key, lambda: 'first', early_expiration_beta=1)
+        self.assertEqual('first', generic.get(
+            self.cache_key, lambda: 'second', early_expiration_beta=1))
+
+    def test_ttl_jitter(self):
+        backend = mock.Mock(wraps=InMemoryCache())
+        generic = GenericCache(backend)
+        for _ in range(20):
+            generic.get(self.cache_key, lambda: 'value', disable_cache=True, ttl_jitter=0.1)
+        timeouts = [call[1]['timeout'] for call in backend.set.call_args_list]
+        self.assertTrue(all(90 <= timeout <= 100 for timeout in timeouts))
+        self.assertGreater(len(set(timeouts)), 1)
+        self.assertIsNone(jitter_timeout(None, 0.1))
+        self.assertEqual(100, jitter_timeout(100, None))
+
+
+class TestGenericCacheBatch(unittest.TestCase):
+    def setUp(self):
+        self.backend = InMemoryCache()
+        self.generic = GenericCache(self.backend)
+        self.keys = [BaseCacheKey('key_{}'.format(i), timeout=10) for i in range(4)]
+
+    def test_get_many(self):
+        self.generic.set(self.keys[1], 'cached')
+        requested = []
+
+        def func_for_missing(missing):
+            requested.extend(missing)
+            return [key.key_type for key in missing]
+
+        values = self.generic.get_many(self.keys, func_for_missing)
+        self.assertEqual(['key_0', 'cached', 'key_2', 'key_3'], values)
+        self.assertEqual([self.keys[0], self.keys[2], self.keys[3]], requested)
+        self.assertEqual(values, self.generic.get_many_from_cache(self.keys))
+
+    def test_get_many_uses_one_backend_call_per_operation(self):
+        backend = mock.Mock(wraps=self.backend)
+        generic = GenericCache(backend)
+        generic.get_many(self.keys, lambda missing: [1] * len(missing))
+        self.assertEqual(1, backend.get_many.call_count)
+        self.assertEqual(1, backend.set_many.call_count)
+        self.assertEqual(0, backend.get.call_count)
+
+    def test_get_many_groups_writes_by_timeout(self):
+        backend = mock.Mock(wraps=self.backend)
+        generic = GenericCache(backend)
+        keys = [BaseCacheKey('a', timeout=1), BaseCacheKey('b', timeout=2)]
+        generic.get_many(keys, lambda missing: [1] * len(missing))
+        self.assertEqual(2, backend.set_many.call_count)
+
+    def test_get_many_checks_computed_values(self):
+        self.assertRaises(ValueError, self.generic.get_many, self.keys, lambda missing: [])
+
+    def test_get_many_disable_cache_overwrite(self):
+        self.generic.get_many(
+            self.keys, lambda missing: [1] * len(missing), disable_cache_overwrite=True)
+        self.assertEqual([None] * 4, self.generic.get_many_from_cache(self.keys))
+
+    def test_get_many_cache_none(self):
+        backend = mock.Mock(wraps=self.backend)
+        generic = GenericCache(backend, negative_timeout=5)
+        calls = []
+
+        def func_for_missing(missing):
+            calls.append(missing)
+            return [None] * len(missing)
+        self.assertEqual([None] * 4, generic.get_many(self.keys, func_for_missing))
+        backend.set_many.assert_called_once_with(
+            dict((key.key_str, None) for key in self.keys), timeout=5)
+        self.assertEqual([None] * 4, generic.get_many(self.keys, func_for_missing))
+        self.assertEqual(1, len(calls))
+
+    def test_get_many_stale_values_are_refreshed(self):
+        from generic_cache.refresh import RefreshExecutor
+        executor = RefreshExecutor(max_workers=1)
+        generic = GenericCache(self.backend, refresh_executor=executor)
+        generic.get_many(self.keys[:2], lambda missing: ['first'] * len(missing), stale_ttl=-1)
+        values = generic.get_many(
+            self.keys[:2], lambda missing: ['second'] * len(missing), stale_ttl=-1)
+        self.assertEqual(['first', 'first'], values)
+        executor.shutdown()
+        self.assertEqual(['second', 'second'], generic.get_many_from_cache(self.keys[:2]))
+        self.assertEqual(2, executor.stats()['completed'])
+
+    def test_get_many_early_expiration(self):
+        import time
+        keys = [BaseCacheKey('early', timeout=0.1)]
+
+        def slow(missing):
+            time.sleep(0.01)
+            return ['first']
+        self.generic.get_many(keys, slow, early_expiration_beta=1)
+        self.assertGreater(self.backend.get('early').delta, 0)
+        # -log(1e-12) * delta is well beyond the 0.1 seconds left.
+        with mock.patch('generic_cache.cache.random.random', return_value=1 - 1e-12):
+            values = self.generic.get_many(
+                keys, lambda missing: ['second'], early_expiration_beta=1)
+        self.assertEqual(['second'], values)
+
+    def test_set_many_jitters_once_per_timeout(self):
+        backend = mock.Mock(wraps=self.backend)
+        generic = GenericCache(backend)
+        generic.set_many([(key, 1) for key in self.keys], ttl_jitter=0.5)
+        self.assertEqual(1, backend.set_many.call_count)
+        self.assertTrue(5 <= backend.set_many.call_args[1]['timeout'] <= 10)
+
+    def test_flush_many(self):
+        self.generic.set_many([(key, 1) for key in self.keys])
+        self.generic.flush_many(self.keys[:2])
+        self.assertEqual([None, None, 1, 1], self.generic.get_many_from_cache(self.keys))
+
+
+class TestGenericCacheNone(unittest.TestCase):
+    cache_key = BaseCacheKey('none_key', timeout=100)
+
+    def setUp(self):
+        self.calls = []
+
+    def func(self):
+        self.calls.append(1)
+        return None
+
+    def test_none_is_a_miss_by_default(self):
+        generic = GenericCache(InMemoryCache())
+        generic.get(self.cache_key, self.func)
+        generic.get(self.cache_key, self.func)
+        self.assertEqual(2, len(self.calls))
+
+    def test_cache_none(self):
+        generic = GenericCache(InMemoryCache(), cache_none=True)
+        self.assertIsNone(generic.get(self.cache_key, self.func))
+        self.assertIsNone(generic.get(self.cache_key, self.func))
+        self.assertEqual(1, len(self.calls))
+
+    def test_negative_timeout(self):
+        backend = mock.Mock(wraps=InMemoryCache())
+        generic = GenericCache(backend, negative_timeout=5)
+        generic.get(self.cache_key, self.func)
+        generic.get(self.cache_key, self.func)
+        self.assertEqual(1, len(self.calls))
+        backend.get.assert_called_with(self.cache_key.key_str, default=MISS)
+        backend.set.assert_called_once_with(self.cache_key.key_str, None, timeout=5)
+        generic.get(self.cache_key, lambda: 'value', disable_cache=True)
+        backend.set.assert_called_with(self.cache_key.key_str, 'value', timeout=100)
+
+    def test_per_call_negative_timeout(self):
+        backend = mock.Mock(wraps=InMemoryCache())
+        generic = GenericCache(backend)
+        generic.get(self.cache_key, self.func, negative_timeout=1)
+        generic.get(self.cache_key, self.func, negative_timeout=1)
+        self.assertEqual(1, len(self.calls))
+        backend.set.assert_called_once_with(self.cache_key.key_str, None, timeout=1)
+
+    def test_cache_none_with_stale_entries(self):
+        generic = GenericCache(InMemoryCache())
+        generic.get(self.cache_key, self.func, stale_ttl=10)
+        generic.get(self.cache_key, self.func, stale_ttl=10)
+        self.assertEqual(2, len(self.calls))
+        generic.get(self.cache_key, self.func, stale_ttl=10, cache_none=True)
+        self.assertEqual(2, len(self.calls))
+
+    def test_cache_none_with_single_flight(self):
+        generic = GenericCache(InMemoryCache(), cache_none=True, single_flight=True)
+        generic.get(self.cache_key, self.func)
+        generic.get(self.cache_key, self.func)
+        self.assertEqual(1, len(self.calls))
@@ -0,0 +1,107 @@
+# Copyright (c) 2018, Globo.com (https://github.com/globocom)
+#
+# License: MIT
+
+import unittest
+
+import mock
+
+from generic_cache.backend import BaseBackend, InMemoryCache
+from generic_cache.cache import BaseCacheKey, CacheEntry, GenericCache
+from generic_cache.codec import Codec, JSONSerializer, PickleSerializer
+
+
+class BytesBackend(BaseBackend):
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def set(self, key, value, timeout=None):
+        self.data[key] = value
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+
+class CodecTestCase(unittest.TestCase):
+    def test_round_trip(self):
+        for serializer in (PickleSerializer(), JSONSerializer()):
+            codec = Codec(serializer)
+            payload = codec.encode({'a': [1, 2], 'b': None})
+            self.assertIsInstance(payload, bytes)
+            self.assertEqual({'a': [1, 2], 'b': None}, codec.decode(payload))
+
+    def test_cache_entry_round_trip(self):
+        codec = Codec(JSONSerializer())
+        entry = codec.decode(codec.encode(CacheEntry('value', stale_at=10.0)))
+        self.assertIsInstance(entry, CacheEntry)
+        self.assertEqual(('value', 10.0), (entry.value, entry.stale_at))
+
+    def test_compress_above_threshold(self):
+        codec = Codec(compress_threshold=100)
+        small = codec.encode('x' * 10)
+        big = codec.encode('x' * 10000)
+        self.assertLess(len(big), 10000)
+        self.assertEqual('x' * 10, codec.decode(small))
+        self.assertEqual('x' * 10000, codec.decode(big))
+        self.assertEqual(
+            {'encoded': 2, 'compressed': 1, 'stored_bytes': len(small) + len(big)},
+            dict((k, v) for k, v in codec.stats().items() if k != 'serialized_bytes')
+        )
+
+    def test_decode_values_written_by_other_serializer(self):
+        payload = Codec(JSONSerializer()).encode([1, 2])
+        codec = Codec(PickleSerializer(), serializers=[JSONSerializer()])
+        self.assertEqual([1, 2], codec.decode(payload))
+        self.assertRaises(ValueError, Codec(PickleSerializer()).decode, payload)
+
+    def test_json_codec_never_unpickles(self):
+        payload = Codec(PickleSerializer()).encode([1, 2])
+        with mock.patch('generic_cache.codec.pickle.loads') as loads:
+            self.assertRaises(ValueError, Codec(JSONSerializer()).decode, payload)
+        self.assertEqual(0, loads.call_count)
+
+    def test_decode_unencoded_value(self):
+        self.assertEqual('raw', Codec().decode('raw'))
+        self.assertEqual(b'raw', Codec().decode(b'raw'))
+
+    def test_unknown_serializer_tag(self):
+        payload = Codec().encode(1)
+        self.assertRaises(ValueError, Codec().decode, payload[:1] + b'\xff' + payload[2:])
+
+
+class GenericCacheCodecTestCase(unittest.TestCase):
+    key = BaseCacheKey('key', timeout=10)
+
+    def test_values_are_encoded(self):
+        backend = BytesBackend()
+        generic = GenericCache(backend, codec=Codec())
+        self.assertEqual([1, 2], generic.get(self.key, lambda: [1, 2]))
+        self.assertIsInstance(backend.data['key'], bytes)
+        self.assertEqual([1, 2], generic.get(self.key, lambda: None))
+
+    def test_batch_values_are_encoded(self):
+        backend = BytesBackend()
+        generic = GenericCache(backend, codec=Codec())
+        keys = [BaseCacheKey('a', timeout=10), BaseCacheKey('b', timeout=10)]
+        generic.set_many([(keys[0], 'va'), (keys[1], 'vb')])
+        self.assertIsInstance(backend.data['a'], bytes)
+        self.assertEqual(['va', 'vb'], generic.get_many_from_cache(keys))
+
+    def test_cached_none_and_stale_entries(self):
+        backend = BytesBackend()
+        generic = GenericCache(backend, codec=Codec(), cache_none=True)
+        generic.set(self.key, None)
+        self.assertIsNone(generic.get(self.key, lambda: 'computed'))
+        generic.set(self.key, 'value', stale_ttl=100)
+        self.assertEqual('value', generic.get(self.key, lambda: 'computed'))
+
+    def test_in_process_backend_skips_codec(self):
+        backend = InMemoryCache()
+        generic = GenericCache(backend, codec=Codec())
+        value = [1, 2]
+        generic.set(self.key, value)
+        self.assertIs(value, backend.get('key'))
+        self.assertEqual(0, generic.codec.encoded)
@@ -7,7 +7,9 @@ import unittest
 
 from generic_cache.decorator import CacheDecorator
 from generic_cache.backend import InMemoryCache, BaseBackend
-from generic_cache.key_builder import MethodKeyBuilder, AttrsMethodKeyBuilder, ArgsCacheKey
+from generic_cache.key_builder import (
+    MethodKeyBuilder, AttrsMethodKeyBuilder, ArgsCacheKey, BaseKeyBuilder,
+)
 
 
 class DecoratorTestCase(unittest.TestCase):
@@ -139,4 +141,137 @@ class TesteGenericCachedMethod(unittest.TestCase):
             'Test.attrs_test', a=1, key_version=3, uid=instance.uid
         )
         self.assertEqual(1, cache_backend.get(expected_key.key_str))
-        
\ No newline at end of file
+        
+
+class PositionalKeyBuilder(BaseKeyBuilder):
+    def build_key(self, key_prefix, func, *func_args, **func_kwargs):
+        return ArgsCacheKey(key_prefix, *func_args, **func_kwargs)
+
+
+class CacheHandlerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+        self.backend = mock.Mock(wraps=InMemoryCache())
+        cache_dec = CacheDecorator("Test.", self.backend, PositionalKeyBuilder())
+
+        @cache_dec('double', key_timeout=10, key_version='v2')
+        def double(a):
+            self.calls.append(a)
+            return a * 2
+        self.double = double
+
+    def test_get_many(self):
+        self.double(2)
+        self.assertEqual([2, 4, 6], self.double.cache.get_many([(1,), (2,), (3,)]))
+        self.assertEqual([2, 1, 3], self.calls)
+        self.assertEqual(1, self.backend.get_many.call_count)
+        self.backend.set_many.assert_called_once_with(
+            {'Test.doublev2__1': 2, 'Test.doublev2__3': 6}, timeout=10)
+        self.assertEqual([2, 4, 6], self.double.cache.get_many([(1,), (2,), (3,)]))
+        self.assertEqual([2, 1, 3], self.calls)
+
+    def test_get_many_uses_the_function_options(self):
+        backend = mock.Mock(wraps=InMemoryCache())
+        cache_dec = CacheDecorator("Test.", backend, PositionalKeyBuilder())
+
+        @cache_dec('find', key_timeout=10, negative_timeout=2, stale_ttl=5)
+        def find(a):
+            self.calls.append(a)
+            return None if a < 0 else a
+
+        self.assertEqual([None, 1], find.cache.get_many([(-1,), (1,)]))
+        self.assertEqual([None, 1], find.cache.get_many([(-1,), (1,)]))
+        self.assertEqual([-1, 1], self.calls)
+        timeouts = sorted(call[1]['timeout'] for call in backend.set_many.call_args_list)
+        self.assertEqual([2, 10], timeouts)
+        self.assertEqual(1, find.cache.get(1))
+        # Same envelope as the decorated call.
+        self.assertIsNotNone(backend.get('Test.find__1').stale_at)
+
+    def test_get_and_flush_use_key_version(self):
+        self.double(2)
+        self.assertEqual(4, self.double.cache.get(2))
+        self.double.cache.flush(2)
+        self.assertIsNone(self.double.cache.get(2))
+
+    def test_flush_many(self):
+        self.double.cache.get_many([(1,), (2,)])
+        self.double.cache.flush_many([(1,), (2,)])
+        self.assertEqual([None, None], [self.double.cache.get(1), self.double.cache.get(2)])
+
+
+class CacheHandlerWarmTestCase(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+        self.backend = mock.Mock(wraps=InMemoryCache())
+        cache_dec = CacheDecorator("Test.", self.backend, PositionalKeyBuilder())
+
+        @cache_dec('double', key_timeout=10)
+        def double(a):
+            if a < 0:
+                raise ValueError(a)
+            self.calls.append(a)
+            return a * 2
+        self.double = double
+
+    def test_warm_skips_cached_results(self):
+        self.double(1)
+        report = self.double.cache.warm(((i,) for i in range(10)), concurrency=3, batch_size=4)
+        self.assertEqual((10, 1, 9, 0), (report.total, report.skipped, report.computed, report.failed))
+        self.assertEqual(list(range(10)), sorted(self.calls))
+        self.assertEqual(3, self.backend.get_many.call_count)
+        self.assertEqual([0, 2, 4], [self.double.cache.get(i) for i in range(3)])
+        self.assertEqual(10, self.backend.set.call_args[1]['timeout'])
+
+    def test_warm_force(self):
+        self.double(1)
+        report = self.double.cache.warm([(1,)], force=True)
+        self.assertEqual(1, report.computed)
+        self.assertEqual([1, 1], self.calls)
+
+    def test_warm_reports_failures_and_progress(self):
+        progress = []
+        report = self.double.cache.warm(
+            [(1,), (-1,), (2,)], batch_size=2, progress=lambda r: progress.append(r.done))
+        self.assertEqual((2, 1), (report.computed, report.failed))
+        self.assertEqual((-1,), report.failures[0][0])
+        self.assertIsInstance(report.failures[0][1], ValueError)
+        self.assertEqual([2, 3], progress)
+
+
+class NegativeTimeoutTestCase(unittest.TestCase):
+    def test_none_results_are_cached_with_negative_timeout(self):
+        calls = []
+        backend = mock.Mock(wraps=InMemoryCache())
+        cache_dec = CacheDecorator("Test.", backend, MethodKeyBuilder(), default_timeout=60)
+
+        class User(object):
+            @cache_dec('get_photo', negative_timeout=5)
+            def get_photo(self, photo_type):
+                calls.append(photo_type)
+                return None
+
+        user = User()
+        self.assertIsNone(user.get_photo('avatar'))
+        self.assertIsNone(user.get_photo('avatar'))
+        self.assertEqual(['avatar'], calls)
+        backend.set.assert_called_once_with(
+            'Test.get_photo__photo_type_avatar', None, timeout=5)
+
+
+class EarlyExpirationTestCase(unittest.TestCase):
+    def test_options_are_forwarded(self):
+        backend = mock.Mock(wraps=InMemoryCache())
+        cache_dec = CacheDecorator("Test.", backend, MethodKeyBuilder(), default_timeout=100)
+
+        class User(object):
+            @cache_dec('get_photo', early_expiration_beta=1, ttl_jitter=0.5)
+            def get_photo(self, photo_type):
+                return photo_type
+
+        self.assertEqual('avatar', User().get_photo('avatar'))
+        args, kwargs = backend.set.call_args
+        self.assertLessEqual(50, kwargs['timeout'])
+        self.assertLessEqual(kwargs['timeout'], 100)
+        self.assertIsNotNone(args[1].delta)
+        self.assertEqual('avatar', User().get_photo('avatar'))
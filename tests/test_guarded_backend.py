@@ -0,0 +1,170 @@
+# Copyright (c) 2018, Globo.com (https://github.com/globocom)
+#
+# License: MIT
+
+import threading
+import time
+import unittest
+
+from generic_cache.backend import MISS, InMemoryCache
+from generic_cache.cache import BaseCacheKey, GenericCache
+from generic_cache.guarded_backend import CircuitBreaker, GuardedBackend
+from generic_cache.metrics import InMemoryMetrics
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class SlowBackend(InMemoryCache):
+    '''
+    Stand-in for a degraded backend: every call sleeps `delay` seconds, and
+    raises when `broken` is set.
+    '''
+
+    def __init__(self, *args, **kwargs):
+        super(SlowBackend, self).__init__(*args, **kwargs)
+        self.delay = 0
+        self.broken = False
+        self.calls = 0
+
+    def _degrade(self):
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        if self.broken:
+            raise IOError("backend is down")
+
+    def get(self, key, default=None):
+        self._degrade()
+        return super(SlowBackend, self).get(key, default)
+
+    def set(self, key, value, timeout=None):
+        self._degrade()
+        super(SlowBackend, self).set(key, value, timeout=timeout)
+
+    def add(self, key, value, timeout=None):
+        self._degrade()
+        return super(SlowBackend, self).add(key, value, timeout=timeout)
+
+
+class CircuitBreakerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.changes = []
+        self.breaker = CircuitBreaker(
+            failure_threshold=2, reset_timeout=10, clock=self.clock,
+            on_change=lambda previous, state: self.changes.append(state))
+
+    def test_opens_after_consecutive_failures(self):
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_failure()
+        self.assertEqual('open', self.breaker.state)
+        self.assertFalse(self.breaker.allow())
+
+    def test_half_open_probe(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.clock.now += 10
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual('half_open', self.breaker.state)
+        # Only one probe at a time.
+        self.assertFalse(self.breaker.allow())
+        self.breaker.record_failure()
+        self.assertEqual('open', self.breaker.state)
+        self.assertFalse(self.breaker.allow())
+        self.clock.now += 10
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_success()
+        self.assertEqual('closed', self.breaker.state)
+        self.assertEqual(['open', 'half_open', 'open', 'half_open', 'closed'], self.changes)
+
+
+class GuardedBackendTestCase(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.slow = SlowBackend()
+        self.metrics = InMemoryMetrics()
+        self.backend = GuardedBackend(
+            self.slow, budget=0.05, failure_threshold=2, reset_timeout=10,
+            metrics=self.metrics, name='slow', clock=self.clock)
+
+    def tearDown(self):
+        self.slow.delay = 0
+        self.backend.close()
+
+    def test_calls_within_budget(self):
+        self.backend.set('key', 'value')
+        self.assertEqual('value', self.backend.get('key'))
+        self.assertIs(MISS, self.backend.get('missing', MISS))
+        self.assertEqual({'key': 'value'}, self.backend.get_many(['key', 'missing']))
+        self.assertFalse(self.backend.add('key', 'other'))
+        self.assertEqual('closed', self.backend.stats()['state'])
+
+    def test_slow_calls_are_misses(self):
+        self.backend.set('key', 'value')
+        self.slow.delay = 0.5
+        start = time.time()
+        self.assertIsNone(self.backend.get('key'))
+        self.assertIs(MISS, self.backend.get('key', MISS))
+        self.assertLess(time.time() - start, 0.4)
+        self.assertEqual(2, self.backend.timeouts)
+        self.assertEqual(2, self.metrics.counter('guard_timeouts', 'slow'))
+
+    def test_breaker_bypasses_the_backend(self):
+        self.slow.broken = True
+        generic = GenericCache(self.backend)
+        key = BaseCacheKey('key', timeout=10)
+        for _ in range(5):
+            self.assertEqual('computed', generic.get(key, lambda: 'computed'))
+        # One failed get and set, then every call skips the backend.
+        self.assertEqual(2, self.slow.calls)
+        self.assertEqual('open', self.backend.stats()['state'])
+        self.assertEqual(8, self.backend.bypassed)
+        self.assertEqual(2, self.metrics.counter('guard_errors', 'slow'))
+        self.assertEqual(1, self.metrics.counter('breaker_open', 'slow'))
+        self.assertTrue(self.backend.add('lock', 1))
+
+    def test_recovery(self):
+        self.slow.broken = True
+        self.backend.get('key')
+        self.backend.get('key')
+        self.slow.broken = False
+        self.backend.get('key')
+        self.assertEqual(2, self.slow.calls)
+        self.clock.now += 10
+        self.backend.set('key', 'value')
+        self.assertEqual('closed', self.backend.stats()['state'])
+        self.assertEqual('value', self.backend.get('key'))
+        self.assertEqual(1, self.metrics.counter('breaker_half_open', 'slow'))
+        self.assertEqual(1, self.metrics.counter('breaker_closed', 'slow'))
+
+    def test_without_budget(self):
+        backend = GuardedBackend(self.slow, failure_threshold=1)
+        self.slow.broken = True
+        self.assertIsNone(backend.get('key'))
+        self.assertEqual('open', backend.stats()['state'])
+        self.assertIsNone(backend._executor)
+
+    def test_concurrent_slow_calls(self):
+        self.slow.delay = 0.2
+        results = []
+
+        def get():
+            results.append(self.backend.get('key', MISS))
+        threads = [threading.Thread(target=get) for _ in range(4)]
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertLess(time.time() - start, 0.15)
+        self.assertEqual([MISS] * 4, results)
+        self.assertEqual('open', self.backend.stats()['state'])
@@ -0,0 +1,113 @@
+# Copyright (c) 2018, Globo.com (https://github.com/globocom)
+#
+# License: MIT
+
+import random
+import unittest
+
+import mock
+
+from generic_cache.backend import InMemoryCache
+from generic_cache.cache import BaseCacheKey, GenericCache
+from generic_cache.decorator import CacheDecorator
+from generic_cache.hot_keys import HotKeyDetector
+from generic_cache.key_builder import FunctionKeyBuilder
+from generic_cache.metrics import InMemoryMetrics
+
+
+class HotKeyDetectorTestCase(unittest.TestCase):
+    def test_finds_the_hottest_keys(self):
+        detector = HotKeyDetector(capacity=10, min_count=100, width=1024)
+        generator = random.Random(42)
+        for _ in range(20000):
+            if generator.random() < 0.5:
+                detector.record('hot_{}'.format(generator.randrange(3)))
+            else:
+                detector.record('cold_{}'.format(generator.randrange(5000)))
+        self.assertEqual(
+            ['hot_0', 'hot_1', 'hot_2'], sorted(key for key, _ in detector.top(3)))
+        self.assertEqual(['hot_0', 'hot_1', 'hot_2'], sorted(detector.hot_keys()))
+        self.assertLessEqual(len(detector.top()), 10)
+        self.assertTrue(detector.is_hot('hot_0'))
+        self.assertFalse(detector.is_hot('cold_1'))
+
+    def test_record_tells_when_a_key_gets_hot(self):
+        detector = HotKeyDetector(min_count=3)
+        self.assertEqual([False, False, True], [detector.record('key') for _ in range(3)])
+
+    def test_counts_age(self):
+        detector = HotKeyDetector(min_count=4, width=16, sample_size=8)
+        for _ in range(7):
+            detector.record('key')
+        self.assertEqual([('key', 7)], detector.top())
+        detector.record('key')
+        self.assertEqual([('key', 4)], detector.top())
+        self.assertEqual(1, detector.sketch.ages)
+
+    def test_capacity(self):
+        detector = HotKeyDetector(capacity=2, min_count=1)
+        detector.record('a')
+        detector.record('a')
+        detector.record('b')
+        detector.record('c')
+        self.assertEqual(['a', 'b'], [key for key, _ in detector.top()])
+        detector.record('c')
+        self.assertEqual(['a', 'c'], sorted(key for key, _ in detector.top()))
+
+    def test_clear(self):
+        detector = HotKeyDetector(min_count=1, pin_timeout=10)
+        detector.record('key')
+        detector.pin('key', 'value')
+        detector.clear()
+        self.assertEqual([], detector.top())
+        self.assertIsNone(detector.pinned('key'))
+
+
+class HotKeyPinningTestCase(unittest.TestCase):
+    cache_key = BaseCacheKey('key', timeout=60)
+
+    def setUp(self):
+        self.backend = mock.Mock(wraps=InMemoryCache())
+        self.detector = HotKeyDetector(min_count=3, pin_timeout=10)
+        self.metrics = InMemoryMetrics()
+        self.generic = GenericCache(self.backend, hot_keys=self.detector, metrics=self.metrics)
+
+    def test_hot_keys_are_served_locally(self):
+        for _ in range(10):
+            self.assertEqual('value', self.generic.get(self.cache_key, lambda: 'value'))
+        # The miss, two reads before the key gets hot and the one pinning it.
+        self.assertEqual(3, self.backend.get.call_count)
+        self.assertEqual(7, self.metrics.counter('hot_key_hits', 'key'))
+        self.assertEqual(9, self.metrics.counter('hits', 'key'))
+        report = self.detector.report()
+        self.assertEqual([('key', 10)], report['top'])
+        self.assertEqual(1, report['pinned'])
+
+    def test_writes_and_flushes_unpin(self):
+        for _ in range(4):
+            self.generic.get(self.cache_key, lambda: 'value')
+        self.generic.set(self.cache_key, 'new')
+        self.assertEqual('new', self.generic.get(self.cache_key, lambda: 'value'))
+        self.generic.flush(self.cache_key)
+        self.assertEqual('computed', self.generic.get(self.cache_key, lambda: 'computed'))
+
+    def test_without_pinning(self):
+        generic = GenericCache(self.backend, hot_keys=HotKeyDetector(min_count=3))
+        for _ in range(5):
+            generic.get(self.cache_key, lambda: 'value')
+        self.assertEqual(5, self.backend.get.call_count)
+        self.assertEqual(['key'], generic.hot_keys.hot_keys())
+
+    def test_decorator(self):
+        detector = HotKeyDetector(min_count=2, pin_timeout=10)
+        cache = CacheDecorator(
+            "Test.", self.backend, FunctionKeyBuilder(), default_timeout=60, hot_keys=detector)
+
+        @cache('double')
+        def double(value):
+            return value * 2
+
+        for _ in range(5):
+            self.assertEqual(4, double(2))
+        self.assertEqual(['Test.double__value_2'], detector.hot_keys())
+        self.assertEqual(2, self.backend.get.call_count)
@@ -93,3 +93,140 @@ class AttrsMethodKeyBuilderTestCase(BaseKeyBuilderTestCase):
         key_str = self.builder.build_key('sample', s.sample_method, s, 1).key_str
         self.assertEqual(expected_key_str, key_str)
         
+
+
+class KeyPlanTestCase(unittest.TestCase):
+    class Sample(object):
+        id = 'uniq'
+
+        def method(self, a, b=2, **extra):
+            pass
+
+    def _assert_same_key(self, builder, func, *args, **kwargs):
+        plan = builder.compile('sample', func, key_version='v1')
+        expected = builder.build_key('sample', func, *args, key_version='v1', **kwargs)
+        key = plan(*args, **kwargs)
+        self.assertEqual(expected.key_str, key.key_str)
+        self.assertEqual(expected.kwargs, key.kwargs)
+        self.assertEqual('v1', key.version)
+
+    def test_function_plan_matches_build_key(self):
+        from generic_cache.key_builder import FunctionKeyBuilder, KeyPlan
+
+        def sample_func(a, b, c=3):
+            pass
+        builder = FunctionKeyBuilder()
+        self.assertIsInstance(builder.compile('sample', sample_func), KeyPlan)
+        self._assert_same_key(builder, sample_func, 1, 2)
+        self._assert_same_key(builder, sample_func, 1, b=2, c=4)
+        self._assert_same_key(builder, sample_func, c=1, a=2, b=3)
+
+    def test_method_plans_match_build_key(self):
+        from generic_cache.key_builder import MethodKeyBuilder, AttrsMethodKeyBuilder
+        s = self.Sample()
+        for builder in (MethodKeyBuilder(), AttrsMethodKeyBuilder(['id'])):
+            self._assert_same_key(builder, self.Sample.method, s, 1)
+            self._assert_same_key(builder, self.Sample.method, s, 1, b=5)
+            self._assert_same_key(builder, self.Sample.method, s, 1, zzz=1, aaa=2)
+
+    def test_plan_rejects_extra_positional_args(self):
+        from generic_cache.key_builder import FunctionKeyBuilder
+
+        def sample_func(a):
+            pass
+        plan = FunctionKeyBuilder().compile('sample', sample_func)
+        self.assertRaises(TypeError, plan, 1, 2)
+
+    def test_plan_rejects_varargs(self):
+        from generic_cache.key_builder import FunctionKeyBuilder
+
+        def sample_func(*args):
+            pass
+        self.assertRaises(ValueError, FunctionKeyBuilder().compile, 'sample', sample_func)
+
+    def test_custom_normalization_is_not_planned(self):
+        from generic_cache.key_builder import FunctionKeyBuilder, KeyPlan
+
+        class UpperKeyBuilder(FunctionKeyBuilder):
+            def get_normalized_kwargs(self, func, *func_args, **func_kwargs):
+                kwargs = super(UpperKeyBuilder, self).get_normalized_kwargs(
+                    func, *func_args, **func_kwargs)
+                return dict((k, str(v).upper()) for k, v in kwargs.items())
+
+        def sample_func(a):
+            pass
+        plan = UpperKeyBuilder().compile('sample', sample_func)
+        self.assertNotIsInstance(plan, KeyPlan)
+        self.assertEqual('sample__a_X', plan('x').key_str)
+
+
+class HashedKeyEncoderTestCase(unittest.TestCase):
+    def setUp(self):
+        from generic_cache.key_encoder import HashedKeyEncoder
+        self.encoder = HashedKeyEncoder()
+
+    def encode(self, *args, **kwargs):
+        return self.encoder.encode('type', 'v1', args, kwargs)
+
+    def test_readable_prefix_and_fixed_length(self):
+        key = self.encode('x' * 10000)
+        self.assertTrue(key.startswith('typev1__'))
+        self.assertEqual(len('typev1__') + 32, len(key))
+        self.assertEqual(len(self.encode(1)), len(key))
+
+    def test_unordered_arguments(self):
+        self.assertEqual(
+            self.encode({'a': 1, 'b': 2}, {3, 2, 1}),
+            self.encode(dict([('b', 2), ('a', 1)]), {1, 2, 3}),
+        )
+
+    def test_no_string_collisions(self):
+        self.assertNotEqual(self.encode('a__b'), self.encode('a', 'b'))
+        self.assertNotEqual(self.encode(1), self.encode('1'))
+        self.assertNotEqual(self.encode([1]), self.encode((1,)))
+        self.assertNotEqual(self.encode(True), self.encode(1))
+        self.assertNotEqual(self.encode(a=1), self.encode(b=1))
+
+    def test_max_length(self):
+        from generic_cache.key_encoder import HashedKeyEncoder
+        encoder = HashedKeyEncoder(max_length=40)
+        self.assertEqual(40, len(encoder.encode('t' * 100, '', (), {})))
+        self.assertEqual(32, len(HashedKeyEncoder(readable_prefix=False).encode('t', '', (), {})))
+
+    def test_cache_key_protocol(self):
+        class Entity(object):
+            def __init__(self, id):
+                self.id = id
+
+            def __cache_key__(self):
+                return self.id
+        self.assertEqual(self.encode(Entity(1)), self.encode(Entity(1)))
+        self.assertNotEqual(self.encode(Entity(1)), self.encode(Entity(2)))
+
+    def test_key_builders_use_encoder(self):
+        from generic_cache.key_builder import AttrsMethodKeyBuilder
+
+        class Sample(object):
+            id = 'uniq'
+
+            def method(self, a):
+                pass
+        builder = AttrsMethodKeyBuilder(['id'], key_encoder=self.encoder)
+        key = builder.build_key('type', Sample.method, Sample(), 1, key_version='v1')
+        plan = builder.compile('type', Sample.method, key_version='v1')
+        self.assertEqual(self.encode(a=1, id='uniq'), key.key_str)
+        self.assertEqual(key.key_str, plan(Sample(), a=1).key_str)
+
+    def test_functions_may_have_a_key_encoder_argument(self):
+        from generic_cache.key_builder import FunctionKeyBuilder
+
+        def func(key_encoder):
+            pass
+        for encoder in (None, self.encoder):
+            builder = FunctionKeyBuilder(key_encoder=encoder)
+            key = builder.build_key('type', func, 'json')
+            plan = builder.compile('type', func)
+            self.assertEqual(key.key_str, plan(key_encoder='json').key_str)
+            self.assertEqual({'key_encoder': 'json'}, key.kwargs)
+        self.assertEqual('type__key_encoder_json', FunctionKeyBuilder().compile('type', func)(
+            'json').key_str)
@@ -0,0 +1,118 @@
+# Copyright (c) 2018, Globo.com (https://github.com/globocom)
+#
+# License: MIT
+
+import socket
+import unittest
+
+import mock
+
+from generic_cache.backend import BaseBackend, InMemoryCache
+from generic_cache.cache import BaseCacheKey, GenericCache
+from generic_cache.metrics import Histogram, InMemoryMetrics, PrometheusExporter, StatsdMetrics
+
+
+class FailingBackend(BaseBackend):
+    def get(self, key, default=None):
+        raise IOError("backend down")
+
+
+class HistogramTestCase(unittest.TestCase):
+    def test_cumulative_counts(self):
+        histogram = Histogram(buckets=(0.1, 1))
+        for value in (0.05, 0.1, 0.5, 3):
+            histogram.observe(value)
+        self.assertEqual([(0.1, 2), (1, 3), ('+Inf', 4)], histogram.cumulative_counts())
+        self.assertEqual((4, 3.65), (histogram.count, histogram.sum))
+
+
+class InMemoryMetricsTestCase(unittest.TestCase):
+    def test_snapshot(self):
+        metrics = InMemoryMetrics()
+        metrics.increment('hits', 'users')
+        metrics.increment('hits', 'users', 2)
+        metrics.observe('compute_seconds', 'users', 0.5)
+        self.assertEqual(
+            {'users': {'hits': 3, 'compute_seconds': {'count': 1, 'sum': 0.5}}},
+            metrics.snapshot()
+        )
+        metrics.reset()
+        self.assertEqual({}, metrics.snapshot())
+
+    def test_prometheus_export(self):
+        metrics = InMemoryMetrics(buckets=(1,))
+        metrics.increment('hits', 'users')
+        metrics.increment('hits', 'say "hi"')
+        metrics.observe('compute_seconds', 'users', 0.5)
+        self.assertEqual(
+            '# TYPE generic_cache_hits_total counter\n'
+            'generic_cache_hits_total{key_type="say \\"hi\\""} 1\n'
+            'generic_cache_hits_total{key_type="users"} 1\n'
+            '# TYPE generic_cache_compute_seconds histogram\n'
+            'generic_cache_compute_seconds_bucket{key_type="users",le="1"} 1\n'
+            'generic_cache_compute_seconds_bucket{key_type="users",le="+Inf"} 1\n'
+            'generic_cache_compute_seconds_sum{key_type="users"} 0.5\n'
+            'generic_cache_compute_seconds_count{key_type="users"} 1\n',
+            PrometheusExporter(metrics).render()
+        )
+
+
+class StatsdMetricsTestCase(unittest.TestCase):
+    def test_send(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        server.bind(('127.0.0.1', 0))
+        server.settimeout(1)
+        metrics = StatsdMetrics('127.0.0.1', server.getsockname()[1])
+        try:
+            metrics.increment('hits', 'users')
+            metrics.observe('compute_seconds', 'users', 0.25)
+            self.assertEqual(b'generic_cache.users.hits:1|c', server.recv(1024))
+            self.assertEqual(b'generic_cache.users.compute_seconds:250.000|ms', server.recv(1024))
+        finally:
+            metrics.close()
+            server.close()
+
+
+class GenericCacheMetricsTestCase(unittest.TestCase):
+    key = BaseCacheKey('users', timeout=10)
+
+    def test_hits_misses_and_sets(self):
+        metrics = InMemoryMetrics()
+        generic = GenericCache(InMemoryCache(), metrics=metrics)
+        generic.get(self.key, lambda: 'value')
+        generic.get(self.key, lambda: 'value')
+        self.assertEqual(1, metrics.counter('hits', 'users'))
+        self.assertEqual(1, metrics.counter('misses', 'users'))
+        self.assertEqual(1, metrics.counter('sets', 'users'))
+        self.assertEqual(2, metrics.histogram('backend_get_seconds', 'users').count)
+        self.assertEqual(1, metrics.histogram('backend_set_seconds', 'users').count)
+        self.assertEqual(1, metrics.histogram('compute_seconds', 'users').count)
+
+    def test_errors(self):
+        metrics = InMemoryMetrics()
+        generic = GenericCache(InMemoryCache(), metrics=metrics)
+
+        def fail():
+            raise ValueError()
+        self.assertRaises(ValueError, generic.get, self.key, fail)
+        self.assertEqual(1, metrics.counter('compute_errors', 'users'))
+
+        generic = GenericCache(FailingBackend(), metrics=metrics)
+        self.assertRaises(IOError, generic.get, self.key, lambda: 'value')
+        self.assertEqual(1, metrics.counter('backend_errors', 'users'))
+
+    def test_get_many(self):
+        metrics = InMemoryMetrics()
+        generic = GenericCache(InMemoryCache(), metrics=metrics)
+        keys = [BaseCacheKey('a', timeout=10), BaseCacheKey('b', timeout=10)]
+        generic.set(keys[0], 'va')
+        generic.get_many(keys, lambda missing: ['vb'])
+        self.assertEqual(1, metrics.counter('hits', 'a'))
+        self.assertEqual(1, metrics.counter('misses', 'b'))
+
+    def test_disabled_logging_does_not_format_keys(self):
+        key = mock.MagicMock(key_str='key', timeout=10)
+        generic = GenericCache(InMemoryCache())
+        generic.get(key, lambda: 'value')
+        generic.get(key, lambda: 'value')
+        self.assertFalse(key.__str__.called)
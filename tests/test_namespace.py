@@ -0,0 +1,151 @@
+# Copyright (c) 2018, Globo.com (https://github.com/globocom)
+#
+# License: MIT
+
+import unittest
+
+from generic_cache.backend import InMemoryCache
+from generic_cache.decorator import CacheDecorator
+from generic_cache.key_builder import AttrsMethodKeyBuilder, FunctionKeyBuilder, MethodKeyBuilder
+from generic_cache.key_encoder import HashedKeyEncoder
+from generic_cache.namespace import NamespaceGenerations
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class NamespaceGenerationsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.backend = InMemoryCache()
+        self.clock = FakeClock()
+        self.generations = NamespaceGenerations(self.backend, local_ttl=5, clock=self.clock)
+
+    def test_generation_is_initialized_once(self):
+        generation = self.generations.get('users')
+        self.assertEqual(generation, self.backend.get('generation__users'))
+        other = NamespaceGenerations(self.backend)
+        self.assertEqual(generation, other.get('users'))
+
+    def test_bump_is_a_single_write(self):
+        generation = self.generations.get('users')
+        sets = []
+        original_set = self.backend.set
+        self.backend.set = lambda *args, **kwargs: sets.append(args) or original_set(*args, **kwargs)
+        new_generation = self.generations.bump('users')
+        self.assertEqual(1, len(sets))
+        self.assertNotEqual(generation, new_generation)
+        self.assertEqual(new_generation, self.generations.get('users'))
+
+    def test_remote_bump_is_seen_after_local_ttl(self):
+        generation = self.generations.get('users')
+        other = NamespaceGenerations(self.backend)
+        new_generation = other.bump('users')
+        self.assertEqual(generation, self.generations.get('users'))
+        self.clock.now += 5
+        self.assertEqual(new_generation, self.generations.get('users'))
+
+    def test_lost_generation_is_not_reused(self):
+        generation = self.generations.get('users')
+        self.backend.delete('generation__users')
+        self.generations.clear_local()
+        self.assertNotEqual(generation, self.generations.get('users'))
+
+    def test_local_generations_are_bounded(self):
+        generations = NamespaceGenerations(
+            self.backend, local_ttl=5, local_max_entries=10, clock=self.clock)
+        for i in range(100):
+            generations.get('user_{}'.format(i))
+        self.assertEqual(10, len(generations._local))
+        # Expired generations are freed, not just refreshed when read again.
+        self.clock.now += 5
+        self.assertEqual(10, generations._local.purge_expired())
+        self.assertEqual(0, len(generations._local))
+
+
+class User(object):
+    def __init__(self, id):
+        self.id = id
+        self.calls = 0
+
+
+class DecoratorNamespaceTestCase(unittest.TestCase):
+    def setUp(self):
+        self.cache = CacheDecorator(
+            "User.", InMemoryCache(), AttrsMethodKeyBuilder(['id']), namespace_generations=True)
+        cache = self.cache
+
+        class CachedUser(User):
+            @cache("get_name")
+            def get_name(self):
+                self.calls += 1
+                return "name {}".format(self.id)
+
+            @cache("get_photo")
+            def get_photo(self, size):
+                self.calls += 1
+                return "photo {} {}".format(self.id, size)
+
+        self.user = CachedUser(1)
+        self.other = CachedUser(2)
+
+    def call_all(self):
+        for user in (self.user, self.other):
+            user.get_name()
+            user.get_photo(10)
+
+    def test_invalidate_instance(self):
+        self.call_all()
+        self.call_all()
+        self.assertEqual((2, 2), (self.user.calls, self.other.calls))
+        self.cache.invalidate_instance(self.user)
+        self.call_all()
+        self.assertEqual((4, 2), (self.user.calls, self.other.calls))
+
+    def test_invalidate_key_type(self):
+        self.call_all()
+        type(self.user).get_name.cache.invalidate_all()
+        self.call_all()
+        self.assertEqual((3, 3), (self.user.calls, self.other.calls))
+        self.cache.invalidate_key_type('get_photo')
+        self.call_all()
+        self.assertEqual((4, 4), (self.user.calls, self.other.calls))
+
+    def test_cache_handler_uses_namespaced_keys(self):
+        self.user.get_photo(10)
+        self.assertEqual("photo 1 10", type(self.user).get_photo.cache.get(self.user, 10))
+        self.cache.invalidate_instance(self.user)
+        self.assertIsNone(type(self.user).get_photo.cache.get(self.user, 10))
+
+    def test_requires_namespace_generations(self):
+        cache = CacheDecorator("f.", InMemoryCache(), FunctionKeyBuilder())
+        self.assertRaises(ValueError, cache.invalidate_key_type, 'func')
+
+    def test_instance_namespace_requires_attrs_key_builder(self):
+        cache = CacheDecorator(
+            "User.", InMemoryCache(), MethodKeyBuilder(), namespace_generations=True)
+        self.assertRaises(ValueError, cache.invalidate_instance, self.user)
+
+    def test_encoded_keys_keep_their_max_length(self):
+        backend = InMemoryCache()
+        cache = CacheDecorator(
+            "f.", backend, FunctionKeyBuilder(key_encoder=HashedKeyEncoder()),
+            namespace_generations=True)
+        calls = []
+
+        @cache("x" * 300)
+        def identity(a):
+            calls.append(a)
+            return a
+        identity(1)
+        identity(1)
+        cache.invalidate_key_type("x" * 300)
+        identity(1)
+        self.assertEqual([1, 1], calls)
+        key = cache._build_key("x" * 300, identity.__wrapped__, 1)
+        self.assertEqual(250, len(key.key_str))
+        self.assertEqual(1, backend.get(key.key_str))
@@ -0,0 +1,120 @@
+# Copyright (c) 2018, Globo.com (https://github.com/globocom)
+#
+# License: MIT
+
+import time
+import unittest
+
+import mock
+
+from generic_cache.backend import InMemoryCache
+from generic_cache.decorator import CacheDecorator
+from generic_cache.key_builder import FunctionKeyBuilder
+from generic_cache.profiling import (
+    BaseProfilerHook, ProfileCollector, Profiler, current_call,
+)
+
+
+class RecordingHook(BaseProfilerHook):
+    def __init__(self):
+        self.events = []
+
+    def on_phase_start(self, call, phase):
+        self.events.append(('start', phase))
+
+    def on_phase_end(self, call, phase, duration, error):
+        self.events.append(('end', phase, error is not None))
+
+    def on_call_end(self, call):
+        self.events.append(('call', call.key_type, call.hit))
+
+
+class ProfilerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.hook = RecordingHook()
+        self.collector = ProfileCollector()
+        self.profiler = Profiler([self.hook, self.collector])
+        cache = CacheDecorator(
+            "Test.", InMemoryCache(), FunctionKeyBuilder(), default_timeout=60,
+            profiler=self.profiler)
+
+        @cache('slow')
+        def slow(value):
+            time.sleep(0.01)
+            if value < 0:
+                raise ValueError(value)
+            return value
+
+        @cache('outer')
+        def outer(value):
+            return slow(value) + 1
+
+        self.slow = slow
+        self.outer = outer
+
+    def test_phases(self):
+        self.slow(1)
+        self.slow(1)
+        self.assertEqual([
+            ('start', 'build_key'), ('end', 'build_key', False),
+            ('start', 'backend_get'), ('end', 'backend_get', False),
+            ('start', 'compute'), ('end', 'compute', False),
+            ('start', 'backend_set'), ('end', 'backend_set', False),
+            ('call', 'Test.slow', False),
+            ('start', 'build_key'), ('end', 'build_key', False),
+            ('start', 'backend_get'), ('end', 'backend_get', False),
+            ('call', 'Test.slow', True),
+        ], self.hook.events)
+        self.assertIsNone(current_call())
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            self.slow(-1)
+        self.assertIn(('end', 'compute', True), self.hook.events)
+        spans = self.collector.export_spans()
+        self.assertEqual(2, spans[0]['status']['code'])
+
+    def test_report(self):
+        for value in range(5):
+            self.slow(value)
+            self.slow(value)
+        report = self.collector.report()['Test.slow']
+        self.assertEqual(10, report['total']['count'])
+        self.assertEqual(10, report['backend_get']['count'])
+        self.assertEqual(5, report['compute']['count'])
+        self.assertGreaterEqual(report['compute']['p50'], 0.01)
+        self.assertLessEqual(report['compute']['p50'], report['compute']['p99'])
+        self.assertLessEqual(report['compute']['p99'], report['compute']['max'])
+        text = self.collector.format_report()
+        self.assertIn('Test.slow', text)
+        self.assertIn('compute', text)
+
+    def test_sample_rate(self):
+        self.profiler.sample_rate = 0.5
+        with mock.patch('generic_cache.profiling.random.random', side_effect=[0.9, 0.1]):
+            self.slow(1)
+            self.slow(1)
+        self.assertEqual(1, self.collector.report()['Test.slow']['total']['count'])
+        self.profiler.sample_rate = 0
+        self.slow(1)
+        self.assertEqual(1, self.collector.report()['Test.slow']['total']['count'])
+
+    def test_export_spans(self):
+        self.outer(1)
+        spans = self.collector.export_spans()
+        by_name = dict((span['name'], span) for span in spans)
+        outer = by_name['Test.outer']
+        inner = by_name['Test.slow']
+        self.assertEqual(outer['traceId'], inner['traceId'])
+        self.assertEqual(32, len(outer['traceId']))
+        self.assertEqual('', outer['parentSpanId'])
+        self.assertEqual(outer['spanId'], inner['parentSpanId'])
+        compute = [
+            span for span in spans
+            if span['name'] == 'compute' and span['parentSpanId'] == inner['spanId']][0]
+        self.assertLessEqual(int(inner['startTimeUnixNano']), int(compute['startTimeUnixNano']))
+        self.assertLessEqual(int(compute['endTimeUnixNano']), int(inner['endTimeUnixNano']))
+        self.assertIn({'key': 'cache.hit', 'value': {'boolValue': False}}, inner['attributes'])
+        self.assertIn(
+            {'key': 'cache.key', 'value': {'stringValue': 'Test.slow__value_1'}},
+            inner['attributes'])
@@ -0,0 +1,211 @@
+# Copyright (c) 2018, Globo.com (https://github.com/globocom)
+#
+# License: MIT
+
+import socketserver
+import threading
+import time
+import unittest
+
+from generic_cache.backend import MISS
+from generic_cache.cache import BaseCacheKey, GenericCache
+from generic_cache.codec import Codec
+from generic_cache.redis_backend import (
+    ConnectionPool, RedisBackend, RedisConnectionError, RedisError, pack_command,
+)
+
+
+class FakeRedisHandler(socketserver.StreamRequestHandler):
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def handle(self):
+        server = self.server
+        server.connections += 1
+        while True:
+            args = self.read_command()
+            if args is None:
+                return
+            server.commands.append([args[0].upper()] + args[1:])
+            if server.delay:
+                time.sleep(server.delay)
+            with server.lock:
+                reply = getattr(self, 'do_' + args[0].decode().lower())(*args[1:])
+            self.wfile.write(reply)
+
+    def bulk(self, value):
+        if value is None:
+            return b'$-1\r\n'
+        return b'$' + str(len(value)).encode() + b'\r\n' + value + b'\r\n'
+
+    def lookup(self, key):
+        value, deadline = self.server.data.get(key, (None, None))
+        if deadline is not None and deadline <= time.time():
+            self.server.data.pop(key)
+            return None
+        return value
+
+    def do_get(self, key):
+        return self.bulk(self.lookup(key))
+
+    def do_mget(self, *keys):
+        return b'*' + str(len(keys)).encode() + b'\r\n' + b''.join(
+            self.bulk(self.lookup(key)) for key in keys)
+
+    def do_set(self, key, value, *options):
+        options = [option.upper() for option in options]
+        deadline = None
+        if b'PX' in options:
+            deadline = time.time() + int(options[options.index(b'PX') + 1]) / 1000.0
+        if b'NX' in options and self.lookup(key) is not None:
+            return b'$-1\r\n'
+        self.server.data[key] = (value, deadline)
+        return b'+OK\r\n'
+
+    def do_del(self, *keys):
+        count = sum(self.server.data.pop(key, None) is not None for key in keys)
+        return b':' + str(count).encode() + b'\r\n'
+
+    def do_select(self, db):
+        return b'+OK\r\n'
+
+    def do_auth(self, password):
+        if password != b'secret':
+            return b'-ERR invalid password\r\n'
+        return b'+OK\r\n'
+
+
+class FakeRedisServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        socketserver.ThreadingTCPServer.__init__(self, ('127.0.0.1', 0), FakeRedisHandler)
+        self.data = {}
+        self.commands = []
+        self.connections = 0
+        self.delay = 0
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.serve_forever, args=(0.01,))
+        self.thread.daemon = True
+        self.thread.start()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class RedisBackendTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeRedisServer()
+        self.backend = RedisBackend(port=self.server.port)
+
+    def tearDown(self):
+        self.backend.close()
+        self.server.stop()
+
+    def test_pack_command(self):
+        self.assertEqual(b'*2\r\n$3\r\nGET\r\n$1\r\nk\r\n', pack_command('GET', 'k'))
+        self.assertEqual(b'*2\r\n$6\r\nSELECT\r\n$1\r\n1\r\n', pack_command('SELECT', 1))
+        self.assertRaises(TypeError, pack_command, 'GET', None)
+        self.assertRaises(TypeError, pack_command, 'GET', ('a', 'b'))
+
+    def test_get_set_delete(self):
+        self.assertIsNone(self.backend.get('key'))
+        self.assertIs(MISS, self.backend.get('key', default=MISS))
+        self.backend.set('key', {'a': [1, 2]})
+        self.assertEqual({'a': [1, 2]}, self.backend.get('key'))
+        self.backend.set('none', None)
+        self.assertIsNone(self.backend.get('none', default=MISS))
+        self.backend.delete('key')
+        self.assertIsNone(self.backend.get('key'))
+
+    def test_native_timeouts(self):
+        self.backend.set('key', 'value', timeout=1.5)
+        self.assertEqual([b'SET', b'key'], self.server.commands[-1][:2])
+        self.assertEqual([b'PX', b'1500'], self.server.commands[-1][3:])
+        self.backend.set('expired', 'value', timeout=0)
+        time.sleep(0.01)
+        self.assertIsNone(self.backend.get('expired'))
+
+    def test_add(self):
+        self.assertTrue(self.backend.add('lock', 1, timeout=10))
+        self.assertFalse(self.backend.add('lock', 2, timeout=10))
+        self.assertEqual(1, self.backend.get('lock'))
+
+    def test_batch_operations_are_single_round_trips(self):
+        self.backend.set_many({'a': 1, 'b': 2}, timeout=10)
+        self.assertEqual({'a': 1, 'b': 2}, self.backend.get_many(['a', 'b', 'c']))
+        self.assertEqual([b'MGET', b'a', b'b', b'c'], self.server.commands[-1])
+        self.backend.delete_many(['a', 'c'])
+        self.assertEqual([b'DEL', b'a', b'c'], self.server.commands[-1])
+        self.assertEqual({'b': 2}, self.backend.get_many(['a', 'b']))
+        self.assertEqual({}, self.backend.get_many([]))
+
+    def test_connections_are_reused(self):
+        for i in range(10):
+            self.backend.set('key', i)
+            self.backend.get('key')
+        self.assertEqual(1, self.server.connections)
+
+    def test_raw_values_without_codec(self):
+        backend = RedisBackend(port=self.server.port, codec=None)
+        backend.set('key', b'raw')
+        self.assertEqual(b'raw', backend.get('key'))
+        self.assertRaises(TypeError, backend.set, 'key', 'text')
+        self.assertRaises(TypeError, backend.add, 'other', 1)
+        self.assertRaises(TypeError, backend.set_many, {'a': b'raw', 'b': {'a': 1}})
+        self.assertEqual(b'raw', backend.get('key'))
+        self.assertEqual({}, backend.get_many(['other', 'a', 'b']))
+        backend.close()
+
+    def test_generic_cache_codec_without_backend_codec(self):
+        backend = RedisBackend(port=self.server.port, codec=None)
+        generic = GenericCache(
+            backend, codec=Codec(), single_flight=True, single_flight_lock=True)
+        key = BaseCacheKey('key', timeout=10)
+        self.assertEqual({'a': 1}, generic.get(key, lambda: {'a': 1}))
+        self.assertEqual({'a': 1}, generic.get(key, lambda: None))
+        backend.close()
+
+    def test_server_error(self):
+        backend = RedisBackend(port=self.server.port, password='wrong')
+        self.assertRaises(RedisError, backend.get, 'key')
+        backend = RedisBackend(port=self.server.port, password='secret', db=1)
+        backend.set('key', 'value')
+        self.assertEqual('value', backend.get('key'))
+        backend.close()
+
+    def test_socket_timeout(self):
+        self.server.delay = 0.2
+        backend = RedisBackend(port=self.server.port, socket_timeout=0.05)
+        self.assertRaises(RedisConnectionError, backend.get, 'key')
+        self.assertEqual([], backend.pool._idle)
+
+    def test_connection_refused(self):
+        self.server.stop()
+        self.assertRaises(RedisConnectionError, self.backend.get, 'key')
+        self.server = FakeRedisServer()
+
+    def test_pool_exhausted(self):
+        pool = ConnectionPool(max_connections=1, timeout=0.01, port=self.server.port, host='127.0.0.1')
+        with pool.connection():
+            self.assertRaises(RedisConnectionError, pool.acquire)
+
+    def test_generic_cache_single_flight_lock(self):
+        generic = GenericCache(self.backend, single_flight=True, single_flight_lock=True)
+        key = BaseCacheKey('key', timeout=10)
+        self.assertEqual('computed', generic.get(key, lambda: 'computed'))
+        self.assertEqual('computed', generic.get(key, lambda: 'other'))
+        self.assertIsNone(self.backend.get('key__lock'))
@@ -0,0 +1,119 @@
+# Copyright (c) 2018, Globo.com (https://github.com/globocom)
+#
+# License: MIT
+
+import asyncio
+import threading
+import unittest
+
+import mock
+
+from generic_cache.backend import InMemoryCache
+from generic_cache.cache import BaseCacheKey, GenericCache
+from generic_cache.decorator import CacheDecorator
+from generic_cache.key_builder import MethodKeyBuilder
+from generic_cache.scope import RequestScope, current_scope
+
+
+class RequestScopeTestCase(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+        self.backend = mock.Mock(wraps=InMemoryCache())
+        self.cache_dec = CacheDecorator("Test.", self.backend, MethodKeyBuilder(), default_timeout=60)
+        async_cache_dec = CacheDecorator("Test.", InMemoryCache(), MethodKeyBuilder())
+        calls = self.calls
+
+        class User(object):
+            @self.cache_dec('get_data')
+            def get_data(self, field):
+                calls.append(field)
+                return field.upper()
+
+            @self.cache_dec('get_none')
+            def get_none(self):
+                calls.append(None)
+                return None
+
+            @async_cache_dec('get_async')
+            async def get_async(self, field):
+                calls.append(field)
+                await asyncio.sleep(0.01)
+                return field.upper()
+
+        self.user = User()
+
+    def test_repeated_calls_skip_the_backend(self):
+        with self.cache_dec.request_scope() as scope:
+            self.assertIs(scope, current_scope())
+            for _ in range(5):
+                self.assertEqual('NAME', self.user.get_data('name'))
+        self.assertEqual(['name'], self.calls)
+        self.assertEqual(1, self.backend.get.call_count)
+        self.assertEqual(4, scope.hits)
+        self.assertIsNone(current_scope())
+        self.assertEqual(0, len(scope))
+        # Outside of the scope every call queries the backend.
+        self.user.get_data('name')
+        self.user.get_data('name')
+        self.assertEqual(3, self.backend.get.call_count)
+
+    def test_cached_values_are_memoized(self):
+        self.user.get_data('name')
+        with RequestScope():
+            self.user.get_data('name')
+            self.user.get_data('name')
+        self.assertEqual(2, self.backend.get.call_count)
+
+    def test_flush_and_disable_cache(self):
+        with RequestScope():
+            self.user.get_data('name')
+            self.user.get_data.cache.flush(self.user, 'name')
+            self.user.get_data('name')
+            self.user.get_data('name', disable_cache=True)
+        self.assertEqual(['name', 'name', 'name'], self.calls)
+
+    def test_none_is_memoized_only_with_cache_none(self):
+        with RequestScope():
+            self.user.get_none()
+            self.user.get_none()
+        self.assertEqual(2, len(self.calls))
+        generic = GenericCache(InMemoryCache(), cache_none=True)
+        key = BaseCacheKey('none', timeout=10)
+        with RequestScope() as scope:
+            generic.get(key, lambda: None)
+            generic.get(key, lambda: None)
+        self.assertEqual(1, scope.hits)
+
+    def test_scope_is_not_shared_with_other_threads(self):
+        seen = []
+        with RequestScope():
+            thread = threading.Thread(target=lambda: seen.append(current_scope()))
+            thread.start()
+            thread.join()
+        self.assertEqual([None], seen)
+
+    def test_nested_scope(self):
+        with RequestScope() as outer:
+            self.user.get_data('name')
+            with RequestScope() as inner:
+                self.user.get_data('name')
+            self.assertIs(outer, current_scope())
+        self.assertEqual(0, outer.hits)
+        self.assertEqual(0, inner.hits)
+
+    def test_asyncio_tasks(self):
+        async def handle_request():
+            with RequestScope() as scope:
+                await self.user.get_async('name')
+                await asyncio.gather(*[self.user.get_async('name') for _ in range(3)])
+                return scope.hits
+
+        async def scenario():
+            return await asyncio.gather(handle_request(), handle_request())
+
+        loop = asyncio.new_event_loop()
+        try:
+            self.assertEqual([3, 3], loop.run_until_complete(scenario()))
+        finally:
+            loop.close()
+        self.assertEqual(['name'], self.calls)
@@ -0,0 +1,145 @@
+# Copyright (c) 2018, Globo.com (https://github.com/globocom)
+#
+# License: MIT
+
+import multiprocessing
+import os
+import tempfile
+import time
+import unittest
+
+from generic_cache.backend import MISS
+from generic_cache.cache import BaseCacheKey, GenericCache
+from generic_cache.shm_backend import SharedMemoryCache, _SEQ
+
+
+def _write_in_child(path, key, value):
+    cache = SharedMemoryCache(path, buckets=16, ways=2, slot_size=256)
+    cache.set(key, value, timeout=60)
+    cache.close()
+
+
+def _set_in_child(cache, key, value):
+    cache.set(key, value, timeout=60)
+
+
+class SharedMemoryCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), 'cache')
+        self.cache = self.build()
+
+    def tearDown(self):
+        self.cache.close(unlink=True)
+        os.rmdir(os.path.dirname(self.path))
+
+    def build(self, **kwargs):
+        options = {'buckets': 16, 'ways': 2, 'slot_size': 256}
+        options.update(kwargs)
+        return SharedMemoryCache(self.path, **options)
+
+    def build_anonymous(self, **kwargs):
+        options = {'buckets': 16, 'ways': 2, 'slot_size': 256}
+        options.update(kwargs)
+        cache = SharedMemoryCache(**options)
+        self.addCleanup(cache.close)
+        return cache
+
+    def test_get_set_delete(self):
+        self.assertIs(MISS, self.cache.get('key', MISS))
+        self.cache.set('key', {'a': 1})
+        self.assertEqual({'a': 1}, self.cache.get('key'))
+        self.cache.set('key', 'other')
+        self.assertEqual('other', self.cache.get('key'))
+        self.cache.set('none', None)
+        self.assertIsNone(self.cache.get('none', MISS))
+        self.assertEqual({'key': 'other', 'none': None}, self.cache.get_many(['key', 'none', 'x']))
+        self.cache.delete('key')
+        self.assertIsNone(self.cache.get('key'))
+        self.assertEqual(1, len(self.cache))
+
+    def test_timeout(self):
+        self.cache.set('key', 'value', timeout=0.05)
+        self.cache.set('forever', 'value')
+        self.assertEqual('value', self.cache.get('key'))
+        time.sleep(0.06)
+        self.assertIsNone(self.cache.get('key'))
+        self.assertEqual('value', self.cache.get('forever'))
+
+    def test_add(self):
+        self.assertTrue(self.cache.add('lock', 1, timeout=10))
+        self.assertFalse(self.cache.add('lock', 2, timeout=10))
+        self.cache.set('expired', 1, timeout=-1)
+        self.assertTrue(self.cache.add('expired', 2))
+        self.assertEqual(2, self.cache.get('expired'))
+
+    def test_size_bounded_eviction(self):
+        cache = self.build_anonymous(buckets=1, ways=4)
+        for i in range(10):
+            cache.set(i, i)
+        self.assertEqual(4, len(cache))
+        self.assertEqual([6, 7, 8, 9], [i for i in range(10) if cache.get(i) is not None])
+        self.assertEqual(6, cache.stats()['evictions'])
+
+    def test_expiring_entries_are_evicted_first(self):
+        cache = self.build_anonymous(buckets=1, ways=2)
+        cache.set('forever', 1)
+        cache.set('expiring', 1, timeout=100)
+        cache.set('new', 1)
+        self.assertEqual(1, cache.get('forever'))
+        self.assertIsNone(cache.get('expiring'))
+
+    def test_oversized_values_are_rejected(self):
+        self.cache.set('key', 'small')
+        self.cache.set('key', 'x' * 1000)
+        self.assertIsNone(self.cache.get('key'))
+        self.assertEqual(1, self.cache.stats()['rejections'])
+
+    def test_torn_reads_are_misses(self):
+        self.cache.set('key', 'value')
+        key_hash = self.cache._hash(b'key')
+        offset, _ = self.cache._find(self.cache._bucket_offset(key_hash), key_hash, b'key')
+        seq = _SEQ.unpack_from(self.cache._map, offset)[0]
+        _SEQ.pack_into(self.cache._map, offset, seq + 1)
+        self.assertIsNone(self.cache.get('key'))
+        # A writer finishing the slot makes it readable again.
+        self.cache.set('key', 'new')
+        self.assertEqual('new', self.cache.get('key'))
+
+    def test_shared_between_processes(self):
+        process = multiprocessing.get_context('fork').Process(
+            target=_write_in_child, args=(self.path, 'key', 'from child'))
+        process.start()
+        process.join()
+        self.assertEqual(0, process.exitcode)
+        self.assertEqual('from child', self.cache.get('key'))
+
+    def test_layout_change_is_rejected(self):
+        self.cache.set('key', 'value')
+        self.assertRaises(ValueError, self.build, ways=4)
+        # The file in use is left untouched.
+        self.assertEqual('value', self.cache.get('key'))
+        self.assertEqual(self.cache.size, os.path.getsize(self.path))
+
+    def test_default_file_is_unlinked(self):
+        directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+        before = set(os.listdir(directory))
+        cache = self.build_anonymous()
+        self.assertIsNone(cache.path)
+        created = set(os.listdir(directory)) - before
+        self.assertEqual([], [name for name in created if name.startswith('generic_cache_')])
+        process = multiprocessing.get_context('fork').Process(
+            target=_set_in_child, args=(cache, 'key', 'from child'))
+        process.start()
+        process.join()
+        self.assertEqual('from child', cache.get('key'))
+
+    def test_clear(self):
+        self.cache.set('key', 'value')
+        self.cache.clear()
+        self.assertEqual(0, len(self.cache))
+
+    def test_works_with_generic_cache(self):
+        generic = GenericCache(self.cache, single_flight=True, single_flight_lock=True)
+        key = BaseCacheKey('key', timeout=10)
+        self.assertEqual('computed', generic.get(key, lambda: 'computed'))
+        self.assertEqual('computed', generic.get(key, lambda: 'other'))
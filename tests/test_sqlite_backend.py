@@ -0,0 +1,120 @@
+# Copyright (c) 2018, Globo.com (https://github.com/globocom)
+#
+# License: MIT
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from generic_cache.backend import MISS, InMemoryCache, TieredBackend
+from generic_cache.cache import BaseCacheKey, GenericCache
+from generic_cache.sqlite_backend import SQLiteCache
+
+
+class SQLiteCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'cache.db')
+        self.cache = SQLiteCache(self.path)
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.directory)
+
+    def test_get_set_delete(self):
+        self.assertIs(MISS, self.cache.get('key', MISS))
+        self.cache.set('key', {'a': [1, 2]})
+        self.assertEqual({'a': [1, 2]}, self.cache.get('key'))
+        self.cache.set('none', None)
+        self.assertIsNone(self.cache.get('none', MISS))
+        self.cache.delete('key')
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_timeout(self):
+        self.cache.set('key', 'value', timeout=-1)
+        self.cache.set('forever', 'value')
+        self.assertIsNone(self.cache.get('key'))
+        self.assertEqual({'forever': 'value'}, self.cache.get_many(['key', 'forever']))
+        self.assertEqual(1, len(self.cache))
+
+    def test_add(self):
+        self.assertTrue(self.cache.add('lock', 1, timeout=10))
+        self.assertFalse(self.cache.add('lock', 2, timeout=10))
+        self.cache.set('expired', 1, timeout=-1)
+        self.assertTrue(self.cache.add('expired', 2))
+        self.assertEqual(2, self.cache.get('expired'))
+
+    def test_batch_operations(self):
+        mapping = dict(('key_{}'.format(i), i) for i in range(1200))
+        self.cache.set_many(mapping, timeout=10)
+        self.assertEqual(mapping, self.cache.get_many(list(mapping) + ['missing']))
+        self.cache.delete_many(list(mapping)[:1000])
+        self.assertEqual(200, len(self.cache.get_many(mapping)))
+
+    def test_compact(self):
+        self.cache.set_many(dict(('key_{}'.format(i), 'x' * 1000) for i in range(200)), timeout=-1)
+        self.cache.set('forever', 'value')
+        self.assertEqual(200, self.cache.compact())
+        self.assertEqual('value', self.cache.get('forever'))
+
+    def test_connections_of_finished_threads_are_closed(self):
+        import threading
+
+        keys = ['key_{}'.format(i) for i in range(20)]
+        for key in keys:
+            thread = threading.Thread(target=self.cache.set, args=(key, 'value'))
+            thread.start()
+            thread.join()
+        # Only the connection of this thread is left.
+        self.assertEqual(1, len(self.cache._connections))
+        self.assertEqual(20, len(self.cache.get_many(keys)))
+
+    def test_survives_restart(self):
+        self.cache.set('key', 'value', timeout=60)
+        self.cache.close()
+        self.cache = SQLiteCache(self.path)
+        self.assertEqual('value', self.cache.get('key'))
+
+    def test_load_into(self):
+        self.cache.set('old', 1)
+        time.sleep(0.01)
+        self.cache.set('new', 2, timeout=60)
+        self.cache.set('expired', 3, timeout=-1)
+        memory = InMemoryCache(max_entries=1)
+        self.assertEqual(1, self.cache.load_into(memory, limit=1))
+        self.assertEqual({'new': 2}, memory.get_many(['old', 'new', 'expired']))
+
+    def test_lazy_warm_start_with_tiered_backend(self):
+        self.cache.set('key', 'value', timeout=60)
+        backend = TieredBackend(self.cache)
+        self.assertEqual('value', backend.get('key'))
+        self.assertEqual('value', backend.l1.get('key'))
+
+    def test_threads(self):
+        def write(offset):
+            for i in range(50):
+                self.cache.set('key_{}_{}'.format(offset, i), i)
+
+        threads = [threading.Thread(target=write, args=(n,)) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(200, len(self.cache))
+
+    def test_compact_interval(self):
+        cache = SQLiteCache(self.path, compact_interval=0.01)
+        cache.set('key', 'value', timeout=0.01)
+        time.sleep(0.1)
+        cache.close()
+        self.assertEqual(0, self.cache._connection().execute(
+            'SELECT COUNT(*) FROM cache').fetchone()[0])
+
+    def test_works_with_generic_cache(self):
+        generic = GenericCache(self.cache, single_flight=True, single_flight_lock=True)
+        key = BaseCacheKey('key', timeout=10)
+        self.assertEqual('computed', generic.get(key, lambda: 'computed'))
+        self.assertEqual('computed', generic.get(key, lambda: 'other'))
@@ -0,0 +1,197 @@
+# Copyright (c) 2018, Globo.com (https://github.com/globocom)
+#
+# License: MIT
+
+import threading
+import time
+import unittest
+
+import mock
+
+from generic_cache.backend import MISS, InMemoryCache
+from generic_cache.cache import BaseCacheKey, GenericCache
+from generic_cache.write_behind import WriteBehindBackend
+
+
+class GatedBackend(InMemoryCache):
+    '''
+    Backend whose bulk writes wait for `gate` to be set, so tests control when
+    the worker finishes a batch.
+    '''
+
+    def __init__(self, *args, **kwargs):
+        super(GatedBackend, self).__init__(*args, **kwargs)
+        self.gate = threading.Event()
+        self.gate.set()
+        self.batches = []
+
+    def set_many(self, mapping, timeout=None):
+        self.gate.wait(2)
+        self.batches.append(dict(mapping))
+        super(GatedBackend, self).set_many(mapping, timeout=timeout)
+
+
+class WriteBehindBackendTestCase(unittest.TestCase):
+    def setUp(self):
+        self.inner = GatedBackend()
+        self.backends = []
+
+    def tearDown(self):
+        self.inner.gate.set()
+        for backend in self.backends:
+            backend.close()
+
+    def build(self, **kwargs):
+        options = {'flush_interval': 10, 'flush_on_exit': False}
+        options.update(kwargs)
+        backend = WriteBehindBackend(self.inner, **options)
+        self.backends.append(backend)
+        return backend
+
+    def hold_worker(self, backend):
+        # A full queue is written right away: keep the worker busy on another
+        # write so the queue stays as the test fills it.
+        self.inner.gate.clear()
+        backend.set('in_flight', 0)
+        threading.Thread(target=backend.flush).start()
+        deadline = time.time() + 2
+        while not backend._in_flight and time.time() < deadline:
+            time.sleep(0.01)
+
+    def test_writes_are_queued_and_coalesced(self):
+        backend = self.build()
+        backend.set('key', 1)
+        backend.set('key', 2, timeout=60)
+        backend.set('other', 3)
+        self.assertIsNone(self.inner.get('key'))
+        # Reads see the queued writes.
+        self.assertEqual(2, backend.get('key'))
+        self.assertEqual({'key': 2, 'other': 3}, backend.get_many(['key', 'other', 'missing']))
+        self.assertTrue(backend.flush())
+        # One bulk write per timeout.
+        self.assertEqual(2, len(self.inner.batches))
+        self.assertIn({'key': 2}, self.inner.batches)
+        self.assertEqual(2, self.inner.get('key'))
+        stats = backend.stats()
+        self.assertEqual((3, 1, 2, 0), (
+            stats['queued'], stats['coalesced'], stats['written'], stats['pending']))
+
+    def test_batch_size_triggers_a_write(self):
+        backend = self.build(batch_size=3)
+        backend.set_many({'a': 1, 'b': 2, 'c': 3})
+        deadline = time.time() + 2
+        while self.inner.get('c') is None and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual([{'a': 1, 'b': 2, 'c': 3}], self.inner.batches)
+
+    def test_flush_interval(self):
+        backend = self.build(flush_interval=0.01)
+        backend.set('key', 'value')
+        time.sleep(0.2)
+        self.assertEqual('value', self.inner.get('key'))
+
+    def test_reads_during_a_write(self):
+        backend = self.build()
+        self.inner.gate.clear()
+        backend.set('key', 'value')
+        flushed = threading.Thread(target=backend.flush)
+        flushed.start()
+        deadline = time.time() + 2
+        while not backend._in_flight and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(0, backend.stats()['pending'])
+        self.assertEqual('value', backend.get('key'))
+        self.inner.gate.set()
+        flushed.join()
+        self.assertEqual('value', self.inner.get('key'))
+
+    def test_delete(self):
+        self.inner.set('key', 'old')
+        backend = self.build()
+        backend.set('key', 'new')
+        backend.delete('key')
+        self.assertIsNone(backend.get('key'))
+        self.assertIs(MISS, backend.get('key', MISS))
+        self.assertEqual({}, backend.get_many(['key']))
+        self.assertEqual('old', self.inner.get('key'))
+        backend.flush()
+        self.assertIsNone(self.inner.get('key'))
+
+    def test_add(self):
+        backend = self.build()
+        backend.set('pending', 1)
+        self.assertFalse(backend.add('pending', 2))
+        self.inner.set('deleted', 1)
+        backend.delete('deleted')
+        self.assertTrue(backend.add('deleted', 2))
+        self.assertEqual(2, self.inner.get('deleted'))
+
+    def test_drop_oldest(self):
+        backend = self.build(max_pending=2)
+        self.hold_worker(backend)
+        backend.delete('deleted')
+        backend.set('a', 1)
+        backend.set('b', 2)
+        self.assertIsNone(backend.get('a'))
+        self.assertEqual(2, backend.get('b'))
+        self.inner.gate.set()
+        backend.flush()
+        self.assertEqual({'b': 2}, self.inner.get_many(['a', 'b']))
+        self.assertEqual(1, backend.stats()['dropped'])
+
+    def test_drop_newest(self):
+        backend = self.build(max_pending=1, overflow='drop_newest')
+        self.hold_worker(backend)
+        backend.set('a', 1)
+        backend.set('b', 2)
+        backend.set('a', 3)
+        self.assertEqual((3, None), (backend.get('a'), backend.get('b')))
+        self.assertEqual(1, backend.stats()['dropped'])
+
+    def test_write_through(self):
+        backend = self.build(max_pending=1, overflow='write_through')
+        self.hold_worker(backend)
+        backend.set('a', 1)
+        backend.set('b', 2)
+        self.assertEqual(2, self.inner.get('b'))
+        self.assertIsNone(self.inner.get('a'))
+        self.assertEqual(1, backend.stats()['written_through'])
+
+    def test_block(self):
+        backend = self.build(max_pending=1, overflow='block', block_timeout=0.05)
+        self.hold_worker(backend)
+        backend.set('b', 2)
+        start = time.time()
+        backend.set('c', 3)
+        self.assertGreaterEqual(time.time() - start, 0.05)
+        self.assertEqual(1, backend.stats()['dropped'])
+        self.inner.gate.set()
+        backend.set('c', 3)
+        backend.flush()
+        self.assertEqual({'b': 2, 'c': 3}, self.inner.get_many(['b', 'c']))
+
+    def test_failed_writes_are_counted(self):
+        backend = self.build()
+        with mock.patch.object(self.inner, 'set_many', side_effect=IOError()):
+            backend.set('key', 'value')
+            backend.flush()
+        self.assertEqual(1, backend.stats()['failed'])
+        self.assertIsNone(backend.get('key'))
+
+    def test_close(self):
+        backend = self.build()
+        backend.set('key', 'value')
+        backend.close()
+        self.assertEqual('value', self.inner.get('key'))
+        self.assertFalse(backend._thread.is_alive())
+        backend.set('other', 'value')
+        self.assertEqual('value', self.inner.get('other'))
+
+    def test_works_with_generic_cache(self):
+        backend = self.build()
+        generic = GenericCache(backend, single_flight=True, single_flight_lock=True)
+        key = BaseCacheKey('key', timeout=10)
+        self.assertEqual('computed', generic.get(key, lambda: 'computed'))
+        self.assertEqual('computed', generic.get(key, lambda: 'other'))
+        backend.flush()
+        self.assertEqual('computed', self.inner.get('key'))